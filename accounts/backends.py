@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+
+UserModel = get_user_model()
+
+
+class ProfileModelBackend(ModelBackend):
+    """ModelBackend that loads the user's profile in the same query
+
+    Nearly every page reads ``request.user.userprofile`` (seller checks,
+    the navigation bar), so the session user and the user returned by
+    ``authenticate()`` come with it joined in.
+
+    Rejected credentials raise PermissionDenied, which stops
+    ``authenticate()`` from hashing the password again in the
+    ModelBackend listed after this one. The async ``aauthenticate()`` and
+    ``aget_user()`` behave the same way.
+    """
+
+    def _users(self):
+        return UserModel._default_manager.select_related('userprofile')
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = self._users().get(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user
+            UserModel().set_password(password)
+            raise PermissionDenied
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        raise PermissionDenied
+
+    def get_user(self, user_id):
+        try:
+            user = self._users().get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await self._users().aget(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            UserModel().set_password(password)
+            raise PermissionDenied
+        if await user.acheck_password(password) and self.user_can_authenticate(user):
+            return user
+        raise PermissionDenied
+
+    async def aget_user(self, user_id):
+        try:
+            user = await self._users().aget(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from accounts.models import UserProfile
+
+class Command(BaseCommand):
+    help = 'Mark lapsed seller subscriptions inactive; run on a schedule (e.g. hourly from cron)'
+
+    def handle(self, *args, **options):
+        expired = UserProfile.expire_subscriptions()
+        self.stdout.write(self.style.SUCCESS(f'Expired {expired} subscription(s)'))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:22
+
+import products.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=products.storage.image_storage, upload_to='profile_pics/'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_media_blobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['subscription_active', 'subscription_end_date'], name='accounts_us_subscri_effab1_idx'),
+        ),
+    ]
@@ -1,7 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
+from products.models import ImageJob, MediaBlob
+from products.storage import image_storage
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -9,7 +13,8 @@ class UserProfile(models.Model):
     university = models.CharField(max_length=100, blank=True)
     phone_number = models.CharField(max_length=15, blank=True)
     address = models.TextField(blank=True)
-    profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    profile_picture = models.ImageField(upload_to='profile_pics/', storage=image_storage, blank=True, null=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     # Seller subscription fields
     is_seller = models.BooleanField(default=False)
@@ -23,21 +28,38 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.student_id or 'No Student ID'}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_profile_picture = MediaBlob.loaded_name(instance, field_names, 'profile_picture')
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._loaded_profile_picture = MediaBlob.track_change(
+                self, 'profile_picture', getattr(self, '_loaded_profile_picture', None)
+            )
+        ImageJob.enqueue(self, 'profile_picture')
+
     def is_subscription_active(self):
-        """Check if user has an active seller subscription"""
+        """Check if user has an active seller subscription
+
+        Computed from ``subscription_end_date``, so permission checks never
+        write; ``subscription_active`` is cleared in bulk by the
+        expire_subscriptions command.
+        """
         if not self.subscription_active:
             return False
-        
-        # Check if subscription has expired
-        if self.subscription_end_date and self.subscription_end_date < timezone.now():
-            try:
-                self.subscription_active = False
-                self.save(update_fields=['subscription_active'])
-            except Exception as e:
-                # Log error but don't break the flow
-                print(f"Error updating subscription status: {e}")
-            return False
-        return True
+        return not (self.subscription_end_date and self.subscription_end_date < timezone.now())
+
+    @classmethod
+    def expire_subscriptions(cls, now=None):
+        """Clear ``subscription_active`` on every lapsed subscription in one UPDATE; returns the count"""
+        now = now or timezone.now()
+        return cls.objects.filter(subscription_active=True, subscription_end_date__lt=now).update(
+            subscription_active=False, updated_at=now
+        )
 
     def can_post_products(self):
         """Check if user can post products (has active subscription)"""
@@ -46,6 +68,9 @@ class UserProfile(models.Model):
     class Meta:
         verbose_name = "User Profile"
         verbose_name_plural = "User Profiles"
+        indexes = [
+            models.Index(fields=['subscription_active', 'subscription_end_date']),
+        ]
 
 class SellerSubscription(models.Model):
     SUBSCRIPTION_TYPES = [
@@ -97,16 +122,39 @@ class SellerSubscription(models.Model):
             elif self.subscription_type == 'yearly':
                 self.end_date = self.start_date + timedelta(days=365)
         
-        super().save(*args, **kwargs)
-        
-        # Update user profile subscription status
-        if self.payment_status == 'completed':
-            profile, created = UserProfile.objects.get_or_create(user=self.user)
-            profile.is_seller = True
-            profile.subscription_active = True
-            profile.subscription_start_date = self.start_date
-            profile.subscription_end_date = self.end_date
-            profile.save()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            # Update user profile subscription status
+            if self.payment_status == 'completed' and not self.apply_to_profile():
+                profile, created = UserProfile.objects.get_or_create(user=self.user, defaults={
+                    'is_seller': True,
+                    'subscription_active': True,
+                    'subscription_start_date': self.start_date,
+                    'subscription_end_date': self.end_date,
+                })
+                if not created:
+                    self.apply_to_profile()
+
+    def apply_to_profile(self):
+        """Activate the subscriber's profile for this period in a single UPDATE
+
+        The profile is not read first, so concurrent renewals cannot
+        overwrite each other. A renewal within the current period keeps its
+        start date, and the end date only ever moves later. Returns whether
+        a profile row was updated.
+        """
+        now = timezone.now()
+        current_period = Q(subscription_active=True, subscription_end_date__gte=self.start_date)
+        return UserProfile.objects.filter(user_id=self.user_id).update(
+            is_seller=True,
+            subscription_active=True,
+            subscription_start_date=Case(
+                When(current_period, then=F('subscription_start_date')), default=Value(self.start_date)
+            ),
+            subscription_end_date=Greatest(Coalesce('subscription_end_date', Value(self.end_date)), Value(self.end_date)),
+            updated_at=now,
+        ) > 0
 
     class Meta:
         ordering = ['-created_at']
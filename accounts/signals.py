@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.db.models.signals import post_save
+
+from .models import UserProfile
+
+
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    """Give every new user a profile, so views can use ``user.userprofile`` directly"""
+    if created and not raw:
+        UserProfile.objects.create(user=instance)
+
+
+def connect():
+    post_save.connect(create_user_profile, sender=settings.AUTH_USER_MODEL, dispatch_uid='create_user_profile')
@@ -1,3 +1,45 @@
-from django.test import TestCase
+from django.contrib.auth import aauthenticate, authenticate
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from .backends import ProfileModelBackend
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProfileModelBackendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='correct horse')
+        self.backend = ProfileModelBackend()
+
+    def test_authenticate_loads_the_profile(self):
+        user = authenticate(username='student', password='correct horse')
+        self.assertEqual(user, self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.userprofile.user_id, self.user.id)
+
+    def test_rejected_credentials(self):
+        self.assertIsNone(authenticate(username='student', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody', password='correct horse'))
+
+    def test_get_user(self):
+        user = self.backend.get_user(self.user.id)
+        with self.assertNumQueries(0):
+            user.userprofile
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(self.backend.get_user(self.user.id))
+        self.assertIsNone(self.backend.get_user(0))
+
+    async def test_aauthenticate_loads_the_profile(self):
+        user = await aauthenticate(username='student', password='correct horse')
+        self.assertEqual(user, self.user)
+        # Already joined in: reading it in async code needs no query
+        self.assertEqual(user.userprofile.user_id, self.user.id)
+        self.assertIsNone(await aauthenticate(username='student', password='wrong'))
+        self.assertIsNone(await aauthenticate(username='nobody', password='correct horse'))
+
+    async def test_aget_user(self):
+        user = await self.backend.aget_user(self.user.id)
+        self.assertEqual(user.userprofile.user_id, self.user.id)
+        await User.objects.filter(pk=self.user.pk).aupdate(is_active=False)
+        self.assertIsNone(await self.backend.aget_user(self.user.id))
+        self.assertIsNone(await self.backend.aget_user(0))
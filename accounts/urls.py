@@ -11,8 +11,10 @@ urlpatterns = [
     
     # Seller Dashboard URLs
     path('seller/dashboard/', views.seller_dashboard, name='seller_dashboard'),
+    path('seller/dashboard/stream/', views.seller_dashboard_stream, name='seller_dashboard_stream'),
     path('seller/subscription/', views.subscription_plans, name='subscription_plans'),
     path('seller/subscribe/', views.subscribe, name='subscribe'),
     path('seller/messages/', views.seller_messages, name='seller_messages'),
     path('seller/products/', views.seller_products, name='seller_products'),
+    path('seller/sales/export/', views.seller_sales_export, name='seller_sales_export'),
 ]
\ No newline at end of file
@@ -5,11 +5,17 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.http import JsonResponse
-from django.db.models import Count, Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, F, Q
 from .models import UserProfile, SellerSubscription
 from .forms import SimpleUserCreationForm
-from products.models import Product, Message, ProductLike, ProductView, Order
+from products.models import Product, Order, Conversation
+from products.messaging import open_conversation, conversation_page
+from products.counters import get_unread_count
+from products.dashboard import get_dashboard_stats, get_recent_activity
+from products.events import event_stream_response, seller_channel
+from products.exports import EXPORT_FORMATS, aiter_export, iter_export, parse_export_date, seller_sales_rows
 
 def register(request):
     if request.method == 'POST':
@@ -17,20 +23,15 @@ def register(request):
         user_type = request.POST.get('user_type', 'buyer')
         
         if form.is_valid():
+            # The profile is created with the user (accounts/signals.py) and
+            # filled in later in profile completion
             user = form.save()
             
-            # Create user profile
-            UserProfile.objects.create(
-                user=user,
-                student_id=None,  # Will be filled later in profile completion
-                university='',  # Will be filled later in profile completion
-            )
-            
             username = form.cleaned_data.get('username')
             messages.success(request, f'Account created successfully for {username}!')
             
             # Auto-login the user
-            login(request, user)
+            login(request, user, backend='accounts.backends.ProfileModelBackend')
             
             # Redirect based on user type
             if user_type == 'seller':
@@ -59,8 +60,7 @@ def login_view(request):
                 # Redirect based on user type
                 if user_type == 'seller':
                     # Check if user has seller subscription
-                    profile, created = UserProfile.objects.get_or_create(user=user)
-                    if profile.can_post_products():
+                    if user.userprofile.can_post_products():
                         return redirect('seller_dashboard')
                     else:
                         return redirect('subscription_plans')
@@ -73,53 +73,35 @@ def login_view(request):
 
 @login_required
 def profile(request):
-    try:
-        profile = request.user.userprofile
-    except UserProfile.DoesNotExist:
-        profile = UserProfile.objects.create(user=request.user)
+    profile = request.user.userprofile
     
     return render(request, 'accounts/profile.html', {'profile': profile})
 
 @login_required
 def seller_dashboard(request):
     """Main seller dashboard view"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = request.user.userprofile
     
     # Check if user has active subscription
     if not profile.can_post_products():
         return redirect('subscription_plans')
     
-    # Get seller statistics
-    products = Product.objects.filter(seller=request.user)
-    total_products = products.count()
-    active_products = products.filter(status='available').count()
-    sold_products = products.filter(status='sold').count()
-    
-    # Get recent messages
-    recent_messages = Message.objects.filter(
-        recipient=request.user
-    ).select_related('sender', 'product')[:5]
-    
-    unread_messages_count = Message.objects.filter(
-        recipient=request.user,
-        is_read=False
-    ).count()
-    
-    # Get recent product views and likes
-    recent_views = ProductView.objects.filter(
-        product__seller=request.user
-    ).select_related('product', 'user')[:10]
+    # Product counts, ledger and latest messages are cached per seller and
+    # dropped by the writes that change them
+    stats = get_dashboard_stats(request.user)
+    unread_messages_count = get_unread_count(request.user.id)
     
-    recent_likes = ProductLike.objects.filter(
-        product__seller=request.user
-    ).select_related('product', 'user')[:10]
+    # Views and likes come from short per-seller lists kept as they happen
+    recent_views = get_recent_activity(request.user.id, 'view')
+    recent_likes = get_recent_activity(request.user.id, 'like')
     
     context = {
         'profile': profile,
-        'total_products': total_products,
-        'active_products': active_products,
-        'sold_products': sold_products,
-        'recent_messages': recent_messages,
+        'total_products': stats['total_products'],
+        'active_products': stats['active_products'],
+        'sold_products': stats['sold_products'],
+        'ledger': stats['ledger'],
+        'recent_messages': stats['recent_messages'],
         'unread_messages_count': unread_messages_count,
         'recent_views': recent_views,
         'recent_likes': recent_likes,
@@ -127,10 +109,23 @@ def seller_dashboard(request):
     
     return render(request, 'accounts/seller_dashboard.html', context)
 
+@login_required
+async def seller_dashboard_stream(request):
+    """Server-sent event stream of views, likes, messages and orders on the seller's products
+
+    Lets the dashboard update in place instead of being reloaded; like the
+    message stream it needs an ASGI server.
+    """
+    user = await request.auser()
+    if not await UserProfile.objects.filter(user=user, is_seller=True).aexists():
+        return HttpResponseForbidden()
+    
+    return event_stream_response(request, [seller_channel(user.id)])
+
 @login_required
 def subscription_plans(request):
     """Display subscription plans for sellers"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = request.user.userprofile
     
     # Get user's current subscription if any
     current_subscription = SellerSubscription.objects.filter(
@@ -170,26 +165,31 @@ def subscribe(request):
 
 @login_required
 def seller_messages(request):
-    """View all messages for seller"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    """View all conversations for seller"""
+    profile = request.user.userprofile
     
     if not profile.can_post_products():
         return redirect('subscription_plans')
     
-    messages_list = Message.objects.filter(
-        recipient=request.user
-    ).select_related('sender', 'product').order_by('-created_at')
+    show_archived = request.GET.get('archived') == '1'
+    conversations, next_cursor = conversation_page(
+        Conversation.objects.filter(seller=request.user, seller_archived=show_archived),
+        cursor=request.GET.get('cursor')
+    )
     
-    context = {
-        'messages': messages_list,
-    }
+    context = open_conversation(request)
+    context.update({
+        'conversations': conversations,
+        'next_cursor': next_cursor,
+        'show_archived': show_archived,
+    })
     
     return render(request, 'accounts/seller_messages.html', context)
 
 @login_required
 def seller_products(request):
     """View and manage seller's products"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = request.user.userprofile
     
     if not profile.can_post_products():
         return redirect('subscription_plans')
@@ -198,14 +198,50 @@ def seller_products(request):
         likes_count=Count('likes'),
         views_count=Count('views'),
         messages_count=Count('messages')
-    ).order_by('-created_at')
+    )
+    
+    sort_by = request.GET.get('sort', 'newest')
+    if sort_by == 'best_offer':
+        products = products.order_by(F('best_offer').desc(nulls_last=True), '-created_at')
+    elif sort_by == 'latest_offer':
+        products = products.order_by(F('last_offer_at').desc(nulls_last=True), '-created_at')
+    else:
+        products = products.order_by('-created_at')
     
     context = {
         'products': products,
+        'sort_by': sort_by,
     }
     
     return render(request, 'accounts/seller_products.html', context)
 
+@login_required
+def seller_sales_export(request):
+    """Stream the seller's sales as CSV or JSON Lines"""
+    profile = request.user.userprofile
+    
+    if not profile.is_seller:
+        return redirect('subscription_plans')
+    
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'success': False, 'error': 'Unsupported format'}, status=400)
+    
+    try:
+        since = parse_export_date(request.GET.get('since'))
+        until = parse_export_date(request.GET.get('until'), end_of_day=True)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Dates must be in YYYY-MM-DD format'}, status=400)
+    
+    rows = seller_sales_rows(request.user, since=since, until=until)
+    # Under ASGI a sync iterator would be buffered whole before sending
+    lines = aiter_export(rows, export_format) if isinstance(request, ASGIRequest) else iter_export(rows, export_format)
+    content_type = 'application/x-ndjson' if export_format == 'jsonl' else 'text/csv'
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    filename = f'sales-{request.user.username}-{timezone.now():%Y%m%d}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @login_required
 def my_orders(request):
     """View user's orders"""
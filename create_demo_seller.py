@@ -43,9 +43,8 @@ def create_demo_seller():
         last_name='Seller'
     )
     
-    # Create profile with active subscription
-    profile = UserProfile.objects.create(
-        user=user,
+    # Fill in the profile created with the user, with an active subscription
+    UserProfile.objects.filter(user=user).update(
         student_id='DEMO123',
         university='Demo University',
         phone_number='555-0123',
@@ -55,6 +54,7 @@ def create_demo_seller():
         subscription_start_date=timezone.now(),
         subscription_end_date=timezone.now() + timedelta(days=30)
     )
+    profile = UserProfile.objects.get(user=user)
     
     # Create subscription record
     subscription = SellerSubscription.objects.create(
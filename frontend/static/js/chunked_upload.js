@@ -0,0 +1,197 @@
+// Chunked, resumable image uploads for the product forms (/api/uploads/)
+//
+// A form marked <form data-chunked-upload> sends its #image and
+// #additional_images files ahead in 1 MB chunks, each with its SHA-256,
+// then submits only the resulting upload ids (image_upload and
+// additional_uploads). Session ids are kept in localStorage, so after a
+// dropped connection the next submit resumes with the missing chunks.
+// When the server stores images in object storage it answers with a
+// presigned request instead, and the file is PUT straight to the bucket.
+// Browsers without fetch or crypto.subtle post the files as before.
+const CHUNK_RETRIES = 3;
+
+function setupChunkedUploads() {
+    const form = document.querySelector('form[data-chunked-upload]');
+    if (!form || !window.fetch || !(window.crypto && window.crypto.subtle)) {
+        return;
+    }
+
+    form.addEventListener('submit', async function(e) {
+        const mainInput = form.querySelector('#image');
+        const additionalInput = form.querySelector('#additional_images');
+        const mainFile = mainInput && mainInput.files[0];
+        const additionalFiles = additionalInput ? Array.from(additionalInput.files).slice(0, 5) : [];
+        if (!mainFile && !additionalFiles.length) {
+            return;
+        }
+        e.preventDefault();
+
+        const status = uploadStatusElement(form);
+        const files = (mainFile ? [mainFile] : []).concat(additionalFiles);
+        const totalBytes = files.reduce((total, file) => total + file.size, 0);
+        let sentBytes = 0;
+        const onProgress = function(bytes) {
+            sentBytes += bytes;
+            status.textContent = `Uploading images… ${Math.round(sentBytes * 100 / totalBytes)}%`;
+        };
+
+        try {
+            if (mainFile) {
+                addHiddenInput(form, 'image_upload', await uploadInChunks(mainFile, onProgress));
+            }
+            for (const file of additionalFiles) {
+                addHiddenInput(form, 'additional_uploads', await uploadInChunks(file, onProgress));
+            }
+        } catch (error) {
+            status.textContent = `${error.message} Submit again to resume the upload.`;
+            form.querySelectorAll('input[name="image_upload"], input[name="additional_uploads"]').forEach(input => input.remove());
+            const submitBtn = form.querySelector('[type="submit"]');
+            if (submitBtn) {
+                submitBtn.disabled = false;
+                submitBtn.classList.remove('loading');
+                submitBtn.textContent = 'Try Again';
+            }
+            return;
+        }
+
+        // The bytes are already on the server; only the ids are posted
+        if (mainInput) {
+            mainInput.disabled = true;
+        }
+        if (additionalInput) {
+            additionalInput.disabled = true;
+        }
+        status.textContent = 'Images uploaded, saving…';
+        form.submit();
+    });
+}
+
+async function uploadInChunks(file, onProgress) {
+    const key = `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+    let upload = null;
+    const savedId = localStorage.getItem(key);
+    if (savedId) {
+        const response = await fetch(`/api/uploads/${savedId}/`, {credentials: 'same-origin'});
+        if (response.ok) {
+            upload = (await response.json()).upload;
+        }
+    }
+    if (!upload) {
+        upload = await uploadRequest('/api/uploads/', 'POST', JSON.stringify({
+            filename: file.name,
+            size: file.size,
+            content_type: file.type,
+            sha256: await sha256Hex(await file.arrayBuffer()),
+            direct: true
+        }), {'Content-Type': 'application/json'});
+        upload = upload.upload;
+        localStorage.setItem(key, upload.id);
+    }
+
+    if (upload.status !== 'complete' && upload.direct) {
+        await sendDirect(upload.direct, file);
+        onProgress(file.size);
+        await uploadRequest(`/api/uploads/${upload.id}/complete/`, 'POST');
+    } else if (upload.status !== 'complete') {
+        const received = new Set(upload.received);
+        for (let index = 0; index < upload.total_chunks; index++) {
+            const chunk = file.slice(index * upload.chunk_size, (index + 1) * upload.chunk_size);
+            if (!received.has(index)) {
+                await sendChunk(upload.id, index, chunk);
+            }
+            onProgress(chunk.size);
+        }
+        await uploadRequest(`/api/uploads/${upload.id}/complete/`, 'POST');
+    } else {
+        onProgress(file.size);
+    }
+    localStorage.removeItem(key);
+    return upload.id;
+}
+
+async function sha256Hex(buffer) {
+    const digest = await crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+}
+
+async function sendDirect(request, file) {
+    // Cross-origin PUT to object storage: no cookies or CSRF token
+    for (let attempt = 1; ; attempt++) {
+        let response = null;
+        try {
+            response = await fetch(request.url, {method: request.method, headers: request.headers, body: file});
+        } catch (networkError) {
+            // Retried below
+        }
+        if (response && response.ok) {
+            return;
+        }
+        if (attempt >= CHUNK_RETRIES || (response && response.status === 403)) {
+            // Resuming fetches the upload again, with a freshly signed URL
+            throw new Error(response ? 'Image upload failed.' : 'The connection was lost while uploading images.');
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+    }
+}
+
+async function sendChunk(uploadId, index, chunk) {
+    const buffer = await chunk.arrayBuffer();
+    const checksum = await sha256Hex(buffer);
+
+    for (let attempt = 1; ; attempt++) {
+        try {
+            return await uploadRequest(`/api/uploads/${uploadId}/chunks/${index}/`, 'PUT', buffer, {
+                'Content-Type': 'application/octet-stream',
+                'X-Chunk-Checksum': checksum
+            });
+        } catch (error) {
+            if (attempt >= CHUNK_RETRIES || error.status === 404) {
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+        }
+    }
+}
+
+async function uploadRequest(url, method, body, headers) {
+    let response;
+    try {
+        response = await fetch(url, {
+            method: method,
+            body: body,
+            credentials: 'same-origin',
+            headers: Object.assign({'X-CSRFToken': getCookie('csrftoken')}, headers || {})
+        });
+    } catch (networkError) {
+        throw new Error('The connection was lost while uploading images.');
+    }
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok || !data.success) {
+        const error = new Error(data.error ? `${data.error}.` : 'Image upload failed.');
+        error.status = response.status;
+        throw error;
+    }
+    return data;
+}
+
+function addHiddenInput(form, name, value) {
+    const input = document.createElement('input');
+    input.type = 'hidden';
+    input.name = name;
+    input.value = value;
+    form.appendChild(input);
+}
+
+function uploadStatusElement(form) {
+    let status = form.querySelector('.chunked-upload-status');
+    if (!status) {
+        status = document.createElement('div');
+        status.className = 'chunked-upload-status form-text mt-2';
+        status.setAttribute('role', 'status');
+        const submitBtn = form.querySelector('[type="submit"]');
+        (submitBtn ? submitBtn.parentNode : form).appendChild(status);
+    }
+    return status;
+}
+
+document.addEventListener('DOMContentLoaded', setupChunkedUploads);
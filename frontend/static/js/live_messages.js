@@ -0,0 +1,357 @@
+// Live inbox updates over server-sent events (/messages/stream/)
+//
+// The inbox page carries the current user's id (.messages-page[data-user-id])
+// and the open thread describes its conversation:
+//   <div id="thread-messages" data-conversation-id="12" data-bubble-class="message-bubble">
+// Sidebar entries carry data-conversation-id so they can be badged and
+// moved to the top when a message arrives for a closed thread.
+function connectMessageStream() {
+    if (!window.EventSource) {
+        return null;
+    }
+
+    const inbox = document.querySelector('.messages-page[data-user-id]');
+    if (!inbox) {
+        return null;
+    }
+    const userId = inbox.dataset.userId;
+    const thread = document.getElementById('thread-messages');
+    const source = new EventSource('/messages/stream/');
+
+    source.addEventListener('message.created', function(e) {
+        const message = JSON.parse(e.data);
+        const isOpen = thread && String(message.conversation_id) === thread.dataset.conversationId;
+
+        const isRecipient = String(message.recipient_id) === userId;
+
+        if (isOpen) {
+            appendThreadMessage(thread, message, userId);
+            if (isRecipient) {
+                markAsRead(message.id);
+            }
+        } else if (isRecipient) {
+            bumpConversation(message);
+        }
+    });
+
+    source.addEventListener('message.read', function(e) {
+        const receipt = JSON.parse(e.data);
+        receipt.message_ids.forEach(function(messageId) {
+            const icon = document.querySelector(`[data-message-id="${messageId}"] .read-status`);
+            if (icon) {
+                icon.classList.remove('fa-check');
+                icon.classList.add('fa-check-double');
+            }
+        });
+    });
+
+    return source;
+}
+
+function appendThreadMessage(thread, message, userId) {
+    if (thread.querySelector(`[data-message-id="${message.id}"]`)) {
+        return;
+    }
+    const bubble = buildMessageBubble(thread, message, userId);
+    thread.appendChild(bubble);
+    bubble.scrollIntoView({behavior: 'smooth', block: 'end'});
+}
+
+function buildMessageBubble(thread, message, userId) {
+    const isSent = String(message.sender_id) === userId;
+    const bubbleClass = thread.dataset.bubbleClass || 'chat-bubble';
+
+    const bubble = document.createElement('div');
+    bubble.className = `${bubbleClass} ${isSent ? 'sent' : 'received'}`;
+    bubble.dataset.messageId = message.id;
+
+    const content = document.createElement('div');
+    content.className = 'bubble-content';
+
+    const subject = document.createElement('div');
+    subject.className = 'message-subject';
+    subject.textContent = message.subject;
+    content.appendChild(subject);
+
+    const text = document.createElement('div');
+    text.className = 'message-text';
+    text.textContent = message.content;
+    text.style.whiteSpace = 'pre-line';
+    content.appendChild(text);
+
+    if (message.offered_price) {
+        const offer = document.createElement('div');
+        offer.className = 'offered-price-badge';
+        offer.textContent = `Offered: $${message.offered_price}`;
+        content.appendChild(offer);
+    }
+
+    const time = document.createElement('div');
+    time.className = 'message-time';
+    time.textContent = new Date(message.created_at).toLocaleString();
+    if (isSent) {
+        const status = document.createElement('i');
+        status.className = `fas ${message.is_read ? 'fa-check-double' : 'fa-check'} read-status`;
+        time.appendChild(document.createTextNode(' '));
+        time.appendChild(status);
+    }
+    content.appendChild(time);
+
+    bubble.appendChild(content);
+    return bubble;
+}
+
+// Fetch the previous page of the open thread and insert it above the current messages
+function loadEarlierMessages(button) {
+    const thread = document.getElementById('thread-messages');
+    const inbox = document.querySelector('.messages-page[data-user-id]');
+    if (!thread || !inbox) {
+        return;
+    }
+    button.disabled = true;
+
+    const url = `/messages/conversation/${thread.dataset.conversationId}/?cursor=${encodeURIComponent(button.dataset.cursor)}`;
+    fetch(url)
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error || 'Could not load messages');
+        }
+        const firstBubble = thread.querySelector('[data-message-id]');
+        data.messages.forEach(function(message) {
+            if (!thread.querySelector(`[data-message-id="${message.id}"]`)) {
+                thread.insertBefore(buildMessageBubble(thread, message, inbox.dataset.userId), firstBubble);
+            }
+        });
+        if (data.next_cursor) {
+            button.dataset.cursor = data.next_cursor;
+            button.disabled = false;
+        } else {
+            button.remove();
+        }
+    })
+    .catch(error => {
+        button.disabled = false;
+        showMessage(error.message, 'error');
+    });
+}
+
+function bumpConversation(message) {
+    const item = document.querySelector(`.message-item[data-conversation-id="${message.conversation_id}"]`);
+    if (!item) {
+        showMessage(`New message from ${message.sender_name}. Refresh to see the conversation.`, 'success');
+        return;
+    }
+
+    item.classList.add('unread');
+    let badge = item.querySelector('.unread-count');
+    if (!badge) {
+        badge = document.createElement('span');
+        badge.className = 'unread-count';
+        badge.textContent = '0';
+        item.querySelector('.sender-name').appendChild(badge);
+    }
+    badge.textContent = parseInt(badge.textContent, 10) + 1;
+
+    const time = item.querySelector('.message-time');
+    if (time) {
+        time.textContent = 'just now';
+    }
+
+    // Most recent activity goes to the top of the list
+    item.parentNode.prepend(item);
+}
+
+function markAsRead(messageId) {
+    fetch(`/messages/mark-read/${messageId}/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': getCookie('csrftoken'),
+            'Content-Type': 'application/json',
+        },
+    })
+    .catch(error => {
+        console.error('Error marking message as read:', error);
+    });
+}
+
+// Bulk inbox actions (/messages/bulk/)
+function bulkUpdateMessages(payload) {
+    return fetch('/messages/bulk/', {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': getCookie('csrftoken'),
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(payload)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error || 'Update failed');
+        }
+        return data;
+    });
+}
+
+function markAllRead() {
+    bulkUpdateMessages({action: 'read', before: new Date().toISOString()})
+    .then(data => {
+        document.querySelectorAll('.message-item.unread').forEach(item => item.classList.remove('unread'));
+        document.querySelectorAll('.message-item .unread-count').forEach(badge => badge.remove());
+        showMessage(`${data.message_ids.length} message(s) marked as read.`, 'success');
+    })
+    .catch(error => showMessage(error.message, 'error'));
+}
+
+function setConversationArchived(conversationId, archived) {
+    bulkUpdateMessages({action: archived ? 'archive' : 'unarchive', conversation_id: conversationId})
+    .then(() => {
+        const item = document.querySelector(`.message-item[data-conversation-id="${conversationId}"]`);
+        if (item) {
+            item.remove();
+        }
+        showMessage(archived ? 'Conversation archived.' : 'Conversation moved to inbox.', 'success');
+    })
+    .catch(error => showMessage(error.message, 'error'));
+}
+
+// Server-side message search (/messages/search/)
+//
+// Typing in #messageSearch, or changing the optional #messageSearchType,
+// #messageSearchMinPrice and #messageSearchMaxPrice filters, replaces the
+// conversation list with #message-search-results until the search is cleared.
+let messageSearchTimer = null;
+
+function setupMessageSearch() {
+    const searchInput = document.getElementById('messageSearch');
+    const results = document.getElementById('message-search-results');
+    if (!searchInput || !results) {
+        return;
+    }
+    const filters = ['messageSearchType', 'messageSearchMinPrice', 'messageSearchMaxPrice']
+        .map(id => document.getElementById(id))
+        .filter(Boolean);
+
+    [searchInput, ...filters].forEach(function(input) {
+        input.addEventListener(input.tagName === 'SELECT' ? 'change' : 'input', function() {
+            clearTimeout(messageSearchTimer);
+            messageSearchTimer = setTimeout(runMessageSearch, 300);
+        });
+    });
+}
+
+function messageSearchParams() {
+    const params = new URLSearchParams();
+    const fields = {
+        q: 'messageSearch',
+        type: 'messageSearchType',
+        min_price: 'messageSearchMinPrice',
+        max_price: 'messageSearchMaxPrice',
+    };
+    Object.entries(fields).forEach(function([name, id]) {
+        const input = document.getElementById(id);
+        if (input && input.value.trim()) {
+            params.set(name, input.value.trim());
+        }
+    });
+    return params;
+}
+
+function runMessageSearch(page) {
+    const sidebar = document.querySelector('.messages-sidebar');
+    const results = document.getElementById('message-search-results');
+    const inbox = document.querySelector('.messages-page[data-user-id]');
+    const params = messageSearchParams();
+
+    if (![...params.keys()].length) {
+        sidebar.classList.remove('searching');
+        results.innerHTML = '';
+        return;
+    }
+    if (page) {
+        params.set('page', page);
+    }
+
+    fetch(`/messages/search/?${params}`)
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error || 'Search failed');
+        }
+        if (!page || page === 1) {
+            results.innerHTML = '';
+        }
+        const more = results.querySelector('.load-more-link');
+        if (more) {
+            more.remove();
+        }
+
+        data.results.forEach(function(message) {
+            results.appendChild(buildSearchResult(message, inbox ? inbox.dataset.userId : null));
+        });
+        if (!results.children.length) {
+            const empty = document.createElement('div');
+            empty.className = 'load-more-link';
+            empty.textContent = 'No messages found';
+            results.appendChild(empty);
+        } else if (data.has_next) {
+            const next = document.createElement('button');
+            next.type = 'button';
+            next.className = 'load-more-link';
+            next.textContent = 'More results';
+            next.addEventListener('click', () => runMessageSearch(data.page + 1));
+            results.appendChild(next);
+        }
+        sidebar.classList.add('searching');
+    })
+    .catch(error => showMessage(error.message, 'error'));
+}
+
+function buildSearchResult(message, userId) {
+    const item = document.createElement('a');
+    item.className = 'message-item';
+    item.href = `?conversation=${message.conversation_id}`;
+    item.dataset.messageId = message.id;
+
+    const avatar = document.createElement('div');
+    avatar.className = 'sender-avatar';
+    avatar.textContent = (message.sender_name || '?').charAt(0).toUpperCase();
+    item.appendChild(avatar);
+
+    const preview = document.createElement('div');
+    preview.className = 'message-preview-content';
+
+    const header = document.createElement('div');
+    header.className = 'message-preview-header';
+    const sender = document.createElement('span');
+    sender.className = 'sender-name';
+    sender.textContent = String(message.sender_id) === userId ? 'You' : message.sender_name;
+    const time = document.createElement('span');
+    time.className = 'message-time';
+    time.textContent = new Date(message.created_at).toLocaleDateString();
+    header.appendChild(sender);
+    header.appendChild(time);
+    preview.appendChild(header);
+
+    const subject = document.createElement('div');
+    subject.className = 'message-preview-text';
+    subject.textContent = message.subject;
+    preview.appendChild(subject);
+
+    const meta = document.createElement('div');
+    meta.className = 'message-meta';
+    const badge = document.createElement('span');
+    badge.className = `message-type-badge badge-${message.message_type}`;
+    badge.textContent = message.offered_price
+        ? `${message.message_type_display} · $${message.offered_price}`
+        : message.message_type_display;
+    meta.appendChild(badge);
+    preview.appendChild(meta);
+
+    item.appendChild(preview);
+    return item;
+}
+
+document.addEventListener('DOMContentLoaded', connectMessageStream);
+document.addEventListener('DOMContentLoaded', setupMessageSearch);
@@ -15,23 +15,45 @@ document.addEventListener('DOMContentLoaded', function() {
     quantityInputs.forEach(input => {
         input.addEventListener('change', function() {
             const productId = this.dataset.productId;
-            updateCartQuantity(productId, this.value);
+            queueCartOperation('update', productId, parseInt(this.value, 10));
         });
     });
 });
 
-// Add to cart function
-function addToCart(productId) {
-    fetch('/api/cart/add/', {
+// POST JSON with an idempotency key, retrying network failures with the same key
+// so the server applies the change at most once
+function postIdempotent(url, payload, retries = 2) {
+    const idempotencyKey = newIdempotencyKey();
+    const attempt = remaining => fetch(url, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
-            'X-CSRFToken': getCookie('csrftoken')
+            'X-CSRFToken': getCookie('csrftoken'),
+            'Idempotency-Key': idempotencyKey
         },
-        body: JSON.stringify({
-            product_id: productId,
-            quantity: 1
-        })
+        body: JSON.stringify(payload)
+    })
+    .catch(error => {
+        if (remaining > 0) {
+            return attempt(remaining - 1);
+        }
+        throw error;
+    });
+    return attempt(retries);
+}
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
+// Add to cart function
+function addToCart(productId) {
+    postIdempotent('/api/cart/add/', {
+        product_id: productId,
+        quantity: 1
     })
     .then(response => response.json())
     .then(data => {
@@ -53,16 +75,49 @@ function addToCart(productId) {
 
 // Update cart quantity function
 function updateCartQuantity(productId, quantity) {
-    fetch('/api/cart/update/', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-            'X-CSRFToken': getCookie('csrftoken')
-        },
-        body: JSON.stringify({
-            product_id: productId,
-            quantity: quantity
-        })
+    postIdempotent('/api/cart/update/', {
+        product_id: productId,
+        quantity: quantity
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            showMessage(data.message || 'Cart updated!', 'success');
+            updateCartTotal(data.total);
+        } else {
+            showMessage(data.error || 'Failed to update cart.', 'error');
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showMessage('An error occurred.', 'error');
+    });
+}
+
+// Batched cart updates: rapid changes are collected and sent as one request
+const CART_BATCH_DELAY = 400;
+let pendingCartOperations = [];
+let cartBatchTimer = null;
+
+function queueCartOperation(op, productId, quantity) {
+    pendingCartOperations.push({
+        op: op,
+        product_id: productId,
+        quantity: quantity
+    });
+    clearTimeout(cartBatchTimer);
+    cartBatchTimer = setTimeout(flushCartOperations, CART_BATCH_DELAY);
+}
+
+function flushCartOperations() {
+    if (pendingCartOperations.length === 0) {
+        return;
+    }
+    const operations = pendingCartOperations;
+    pendingCartOperations = [];
+
+    postIdempotent('/api/cart/batch/', {
+        operations: operations
     })
     .then(response => response.json())
     .then(data => {
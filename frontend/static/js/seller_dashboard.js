@@ -0,0 +1,122 @@
+// Live seller dashboard over server-sent events (/accounts/seller/dashboard/stream/)
+//
+// Views, likes, messages and orders on the seller's products are prepended to
+// #activity-feed and #recent-messages, and the stat cards marked with
+// data-stat are bumped in place, so the page never needs a reload.
+const DASHBOARD_FEED_LIMIT = 10;
+
+function connectDashboardStream() {
+    if (!window.EventSource || !document.getElementById('activity-feed')) {
+        return null;
+    }
+    const source = new EventSource('/accounts/seller/dashboard/stream/');
+
+    source.addEventListener('engagement.view', function(e) {
+        const event = JSON.parse(e.data);
+        const who = event.actor || 'Someone';
+        prependActivity('view', 'fa-eye', `${who} viewed ${event.product_title}`);
+    });
+
+    source.addEventListener('engagement.like', function(e) {
+        const event = JSON.parse(e.data);
+        if (event.liked) {
+            prependActivity('like', 'fa-heart', `${event.actor} liked ${event.product_title}`);
+        }
+    });
+
+    source.addEventListener('engagement.message', function(e) {
+        const event = JSON.parse(e.data);
+        prependActivity('message', 'fa-envelope', `${event.actor} messaged you about ${event.product_title}`);
+        prependRecentMessage(event.message);
+        bumpStat('unread', 1);
+    });
+
+    source.addEventListener('engagement.order', function(e) {
+        const event = JSON.parse(e.data);
+        const quantity = event.items.reduce((total, item) => total + item.quantity, 0);
+        prependActivity('order', 'fa-shopping-bag', `${event.actor} ordered ${quantity} item(s) — $${event.total}`);
+        bumpStat('orders', 1);
+        bumpAmount('gross', event.total);
+        bumpAmount('pending', event.total);
+    });
+
+    return source;
+}
+
+function prependToFeed(container, element) {
+    const empty = container.querySelector('.empty-state');
+    if (empty) {
+        empty.remove();
+    }
+    container.prepend(element);
+    while (container.children.length > DASHBOARD_FEED_LIMIT) {
+        container.lastElementChild.remove();
+    }
+}
+
+function prependActivity(kind, iconClass, text) {
+    const item = document.createElement('div');
+    item.className = 'activity-item';
+
+    const icon = document.createElement('div');
+    icon.className = `activity-icon ${kind}`;
+    icon.innerHTML = `<i class="fas ${iconClass}"></i>`;
+    item.appendChild(icon);
+
+    const content = document.createElement('div');
+    content.className = 'activity-content';
+    const label = document.createElement('div');
+    label.className = 'activity-text';
+    label.textContent = text;
+    const time = document.createElement('div');
+    time.className = 'activity-time';
+    time.textContent = 'just now';
+    content.appendChild(label);
+    content.appendChild(time);
+    item.appendChild(content);
+
+    prependToFeed(document.getElementById('activity-feed'), item);
+}
+
+function prependRecentMessage(message) {
+    const container = document.getElementById('recent-messages');
+    if (!container) {
+        return;
+    }
+    const item = document.createElement('div');
+    item.className = 'message-item';
+
+    const avatar = document.createElement('div');
+    avatar.className = 'message-avatar';
+    avatar.textContent = message.sender_name.charAt(0).toUpperCase();
+    item.appendChild(avatar);
+
+    const content = document.createElement('div');
+    content.className = 'message-content';
+    [['message-sender', message.sender_name], ['message-text', message.subject], ['message-time', 'just now']]
+        .forEach(function([className, text]) {
+            const line = document.createElement('div');
+            line.className = className;
+            line.textContent = text;
+            content.appendChild(line);
+        });
+    item.appendChild(content);
+
+    prependToFeed(container, item);
+}
+
+function bumpStat(name, delta) {
+    document.querySelectorAll(`[data-stat="${name}"]`).forEach(function(stat) {
+        stat.textContent = (parseInt(stat.textContent, 10) || 0) + delta;
+    });
+}
+
+function bumpAmount(name, amount) {
+    document.querySelectorAll(`[data-stat="${name}"]`).forEach(function(stat) {
+        const value = parseFloat(stat.dataset.value || '0') + parseFloat(amount);
+        stat.dataset.value = value.toFixed(2);
+        stat.textContent = `$${value.toFixed(2)}`;
+    });
+}
+
+document.addEventListener('DOMContentLoaded', connectDashboardStream);
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, ProductImage, Cart, CartItem, Order, OrderItem, Message, ProductLike, ProductView
+from .models import Category, Product, ProductImage, Cart, CartItem, Order, OrderItem, Message, ProductLike, ProductView, SellerLedger, Conversation
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -25,6 +25,14 @@ class MessageAdmin(admin.ModelAdmin):
     search_fields = ['sender__username', 'recipient__username', 'subject']
     readonly_fields = ['created_at', 'updated_at']
 
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ['buyer', 'seller', 'product', 'last_message_at', 'buyer_unread_count', 'seller_unread_count']
+    list_filter = ['last_message_at']
+    search_fields = ['buyer__username', 'seller__username', 'product__title']
+    raw_id_fields = ['last_message']
+    readonly_fields = ['created_at']
+
 @admin.register(ProductLike)
 class ProductLikeAdmin(admin.ModelAdmin):
     list_display = ['user', 'product', 'created_at']
@@ -47,10 +55,17 @@ class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'product', 'quantity', 'created_at']
     list_filter = ['created_at']
 
+# Item amounts feed the seller ledgers, which only follow checkout, payment
+# status changes and deletions; they are not edited by hand
+ORDER_ITEM_READONLY_FIELDS = ['product', 'seller', 'quantity', 'price', 'total']
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
-    readonly_fields = ['total']
+    readonly_fields = ORDER_ITEM_READONLY_FIELDS
+    
+    def has_add_permission(self, request, obj=None):
+        return False
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -83,3 +98,14 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ['order', 'product', 'seller', 'quantity', 'price', 'total']
     list_filter = ['created_at']
     search_fields = ['order__order_number', 'product__title', 'seller__username']
+    readonly_fields = ORDER_ITEM_READONLY_FIELDS
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(SellerLedger)
+class SellerLedgerAdmin(admin.ModelAdmin):
+    list_display = ['seller', 'gross_sales', 'order_count', 'items_sold', 'pending_amount', 'paid_amount', 'updated_at']
+    search_fields = ['seller__username']
+    readonly_fields = ['gross_sales', 'order_count', 'items_sold', 'pending_amount', 'paid_amount', 'updated_at']
@@ -0,0 +1,13 @@
+from .counters import get_unread_count
+
+
+def unread_messages(request):
+    """Expose the user's unread message count to every template
+
+    The value is a callable, so the (cached) lookup only happens on pages
+    that actually render it.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'unread_messages_count': 0}
+    return {'unread_messages_count': lambda: get_unread_count(user.id)}
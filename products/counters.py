@@ -0,0 +1,79 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _unread_key(user_id):
+    return f'unread_messages:{user_id}'
+
+
+def get_unread_count(user_id):
+    """Number of unread messages addressed to the user
+
+    Served from the cache; a miss is repopulated with one COUNT query, after
+    which increments and decrements keep the value current.
+    """
+    count = cache.get(_unread_key(user_id))
+    if count is None:
+        from .models import Message
+        count = Message.objects.filter(recipient_id=user_id, is_read=False).count()
+        cache.add(_unread_key(user_id), count, getattr(settings, 'UNREAD_COUNT_TTL', 60 * 60))
+    return count
+
+
+def _adjust(user_id, delta):
+    key = _unread_key(user_id)
+    try:
+        if delta > 0:
+            count = cache.incr(key, delta)
+        else:
+            count = cache.decr(key, -delta)
+    except ValueError:
+        # Not cached yet; the next read recomputes it
+        return
+    if count < 0:
+        cache.delete(key)
+
+
+def adjust_unread_count(user_id, delta):
+    """Apply a change to a user's cached unread count once the transaction commits"""
+    if delta:
+        transaction.on_commit(lambda: _adjust(user_id, delta))
+
+
+def _thread_version_key(conversation_id):
+    return f'message_thread_version:{conversation_id}'
+
+
+def get_thread_version(conversation_id):
+    """Current version of a conversation's cached reply threads
+
+    A missing version starts from the clock rather than 0, so losing it
+    from the cache can never bring back entries stored under older numbers.
+    """
+    key = _thread_version_key(conversation_id)
+    version = time.time_ns()
+    if not cache.add(key, version, None):
+        version = cache.get(key, version)
+    return version
+
+
+def _bump_thread_version(conversation_id):
+    try:
+        cache.incr(_thread_version_key(conversation_id))
+    except ValueError:
+        # No version yet, so nothing is cached under one
+        pass
+
+
+def bump_thread_version(*conversation_ids):
+    """Move readers of the conversations' threads onto fresh cache entries once the transaction commits"""
+    conversation_ids = {conversation_id for conversation_id in conversation_ids if conversation_id}
+
+    def bump():
+        for conversation_id in conversation_ids:
+            _bump_thread_version(conversation_id)
+    if conversation_ids:
+        transaction.on_commit(bump)
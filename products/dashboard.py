@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+
+def _dashboard_key(seller_id):
+    return f'seller_dashboard:{seller_id}'
+
+
+ACTIVITY_KINDS = ('view', 'like')
+
+
+def _activity_key(seller_id, kind):
+    return f'seller_activity:{seller_id}:{kind}'
+
+
+def get_dashboard_stats(seller):
+    """Product counts, sales ledger and latest messages for the seller dashboard
+
+    Cached per seller and dropped by invalidate_dashboard() when a product,
+    order or incoming message changes them; a miss costs one aggregate over
+    the seller's products, one ledger row and one message query.
+    """
+    stats = cache.get(_dashboard_key(seller.id))
+    if stats is None:
+        from .models import Message, Product, SellerLedger
+        stats = Product.objects.filter(seller=seller).aggregate(
+            total_products=Count('id'),
+            active_products=Count('id', filter=Q(status='available')),
+            sold_products=Count('id', filter=Q(status='sold')),
+        )
+        stats['ledger'] = SellerLedger.objects.filter(seller=seller).first() or SellerLedger(seller=seller)
+        stats['recent_messages'] = list(
+            Message.objects.filter(recipient=seller).select_related('sender', 'product')[:5]
+        )
+        cache.set(_dashboard_key(seller.id), stats, getattr(settings, 'SELLER_DASHBOARD_CACHE_TTL', 60 * 10))
+    return stats
+
+
+def invalidate_dashboard(*seller_ids):
+    """Drop the sellers' cached dashboard once the current transaction commits"""
+    keys = [_dashboard_key(seller_id) for seller_id in seller_ids if seller_id]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _activity_entry(kind, record):
+    return {
+        'kind': kind,
+        'user_id': record.user_id,
+        'username': record.user.username if record.user_id else None,
+        'product_id': record.product_id,
+        'product_title': record.product.title,
+        'created_at': record.created_at,
+    }
+
+
+def get_recent_activity(seller_id, kind):
+    """Latest views or likes (``kind``) on the seller's products, newest first
+
+    Each kind is cached as its own list capped at SELLER_ACTIVITY_LENGTH
+    entries, so a burst of views never pushes the likes out. A miss rebuilds
+    it from the newest rows; after that new ones are pushed onto the front,
+    so the dashboard never sorts the seller's whole view history.
+    """
+    activity = cache.get(_activity_key(seller_id, kind))
+    if activity is None:
+        from .models import ProductLike, ProductView
+        model = ProductView if kind == 'view' else ProductLike
+        records = model.objects.filter(product__seller_id=seller_id).select_related('product', 'user')
+        activity = [
+            _activity_entry(kind, record)
+            for record in records.order_by('-created_at')[:getattr(settings, 'SELLER_ACTIVITY_LENGTH', 10)]
+        ]
+        cache.add(_activity_key(seller_id, kind), activity, getattr(settings, 'SELLER_ACTIVITY_TTL', 60 * 60))
+    return activity
+
+
+def _update_activity(seller_id, kind, change):
+    key = _activity_key(seller_id, kind)
+    activity = cache.get(key)
+    if activity is None:
+        # Not cached yet; the next read rebuilds it
+        return
+    # Concurrent updates can drop an entry until the list expires; it is only a feed
+    cache.set(key, change(activity)[:getattr(settings, 'SELLER_ACTIVITY_LENGTH', 10)],
+              getattr(settings, 'SELLER_ACTIVITY_TTL', 60 * 60))
+
+
+def record_activity(kind, record):
+    """Push a new ProductView or ProductLike onto its seller's list for ``kind`` after commit"""
+    seller_id = record.product.seller_id
+    entry = _activity_entry(kind, record)
+    transaction.on_commit(lambda: _update_activity(seller_id, kind, lambda activity: [entry] + activity))
+
+
+def forget_activity(kind, record):
+    """Remove a deleted like (or view) from its seller's list for ``kind`` after commit"""
+    seller_id = record.product.seller_id
+    product_id, user_id = record.product_id, record.user_id
+
+    def remove(activity):
+        return [
+            entry for entry in activity
+            if not (entry['product_id'] == product_id and entry['user_id'] == user_id)
+        ]
+    transaction.on_commit(lambda: _update_activity(seller_id, kind, remove))
+
+
+def clear_activity(seller_id):
+    """Drop the seller's activity lists (e.g. after a product is renamed or deleted) after commit"""
+    keys = [_activity_key(seller_id, kind) for kind in ACTIVITY_KINDS]
+    transaction.on_commit(lambda: cache.delete_many(keys))
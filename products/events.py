@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+
+
+class EventBus:
+    """In-process publish/subscribe fan-out for server-sent events
+
+    Subscribers are asyncio queues owned by the ASGI event loop; publishers
+    may run in any thread (sync views run in a worker thread under ASGI), so
+    events are handed to each loop with ``call_soon_threadsafe``. Everything
+    lives in one process, which is enough for a single-box deployment; run one
+    ASGI worker (or put a shared broker behind this interface) to scale out.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> set of (loop, queue)
+
+    def subscribe(self, channel, queue=None):
+        """Register a queue for ``channel`` on the running event loop
+
+        Pass the same ``queue`` for several channels to merge them into one
+        bounded stream.
+        """
+        if queue is None:
+            queue = asyncio.Queue(self.max_queue_size)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+    def publish(self, channel, event_type, data):
+        """Deliver an event to every current subscriber of ``channel``"""
+        event = {'type': event_type, 'data': data}
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has closed; it will be cleaned up on disconnect
+                pass
+
+
+def _offer(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # Slow consumer: drop the oldest event rather than block publishers
+        queue.get_nowait()
+        queue.put_nowait(event)
+
+
+event_bus = EventBus(getattr(settings, 'EVENT_STREAM_QUEUE_SIZE', 100))
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def seller_channel(seller_id):
+    """Engagement on a seller's products (views, likes, messages, orders)"""
+    return f'seller:{seller_id}'
+
+
+def publish_on_commit(channel, event_type, data):
+    """Publish once the current transaction commits, so clients never see rolled-back data"""
+    transaction.on_commit(lambda: event_bus.publish(channel, event_type, data))
+
+
+def publish_engagement(product, event_type, actor=None, **data):
+    """Tell the product's seller about engagement with it, e.g. ``engagement.view``
+
+    Skipped when the seller has no dashboard open, so hot paths like product
+    views cost nothing extra for sellers who are not watching.
+    """
+    channel = seller_channel(product.seller_id)
+    if not event_bus.subscriber_count(channel):
+        return
+    publish_on_commit(channel, event_type, {
+        'product_id': product.id,
+        'product_title': product.title,
+        'actor': (actor.first_name or actor.username) if actor else None,
+        **data,
+    })
+
+
+async def event_stream(channels, heartbeat=None):
+    """Async iterator of server-sent event frames for the given channels"""
+    heartbeat = heartbeat or getattr(settings, 'EVENT_STREAM_HEARTBEAT_SECONDS', 15)
+    # Every channel feeds the same bounded queue, so a slow client loses its
+    # oldest events instead of buffering without limit
+    queue = asyncio.Queue(event_bus.max_queue_size)
+    subscriptions = [(channel, event_bus.subscribe(channel, queue)) for channel in channels]
+
+    try:
+        # Tell EventSource how long to wait before reconnecting
+        yield f'retry: {heartbeat * 1000}\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+    finally:
+        for channel, subscriber in subscriptions:
+            event_bus.unsubscribe(channel, subscriber)
+
+
+def event_stream_response(request, channels):
+    """Streaming response for ``channels``, or a short one when not served over ASGI
+
+    Under WSGI Django drains an async iterator to a list before sending it,
+    which for an endless stream would hang and hold the worker forever.
+    Instead the client gets a bare ``retry`` frame and EventSource backs off
+    for ``EVENT_STREAM_WSGI_RETRY_SECONDS`` before trying again.
+    """
+    if not isinstance(request, ASGIRequest):
+        retry = getattr(settings, 'EVENT_STREAM_WSGI_RETRY_SECONDS', 300)
+        response = HttpResponse(f'retry: {retry * 1000}\n\n', content_type='text/event-stream')
+    else:
+        response = StreamingHttpResponse(event_stream(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
@@ -0,0 +1,112 @@
+import csv
+import json
+from datetime import datetime, time
+from decimal import Decimal
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import OrderItem
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_CHUNK_SIZE = 2000
+
+# (column name, OrderItem lookup) pairs in export order
+SALES_EXPORT_COLUMNS = [
+    ('order_number', 'order__order_number'),
+    ('order_date', 'order__created_at'),
+    ('order_status', 'order__status'),
+    ('payment_status', 'order__payment_status'),
+    ('buyer_name', 'order__buyer_name'),
+    ('buyer_email', 'order__buyer_email'),
+    ('product_id', 'product_id'),
+    ('product_title', 'product__title'),
+    ('quantity', 'quantity'),
+    ('price', 'price'),
+    ('total', 'total'),
+]
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer streaming"""
+
+    def write(self, value):
+        return value
+
+
+def parse_export_date(value, end_of_day=False):
+    """Parse a YYYY-MM-DD string into an aware datetime, or None if blank"""
+    if not value:
+        return None
+    day = datetime.strptime(value, '%Y-%m-%d').date()
+    return timezone.make_aware(datetime.combine(day, time.max if end_of_day else time.min))
+
+
+def seller_sales_rows(seller, since=None, until=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one tuple per OrderItem sold by ``seller``
+
+    Rows come from ``values_list().iterator()`` so memory stays constant and,
+    on PostgreSQL, results are read through a server-side cursor.
+    """
+    items = OrderItem.objects.filter(seller=seller)
+    if since:
+        items = items.filter(order__created_at__gte=since)
+    if until:
+        items = items.filter(order__created_at__lte=until)
+
+    lookups = [lookup for name, lookup in SALES_EXPORT_COLUMNS]
+    return items.order_by('order__created_at', 'id').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def _serialize(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def iter_csv(rows):
+    """Yield CSV lines, starting with the header row"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, lookup in SALES_EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([_serialize(value) for value in row])
+
+
+def iter_jsonl(rows):
+    """Yield one JSON object per line"""
+    names = [name for name, lookup in SALES_EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, (_json_value(value) for value in row)))) + '\n'
+
+
+def iter_export(rows, export_format):
+    if export_format == 'jsonl':
+        return iter_jsonl(rows)
+    return iter_csv(rows)
+
+
+async def aiter_export(rows, export_format, batch_size=EXPORT_CHUNK_SIZE):
+    """Async ``iter_export`` for ASGI, reading ``batch_size`` rows per chunk
+
+    StreamingHttpResponse buffers a sync iterator whole under ASGI, so the
+    rows are pulled through ``sync_to_async`` a batch at a time instead;
+    queries stay on the sync thread and each batch is sent as it is read.
+    """
+    lines = iter_export(rows, export_format)
+    while batch := await sync_to_async(_take)(lines, batch_size):
+        yield ''.join(batch)
+
+
+def _take(lines, count):
+    return list(islice(lines, count))
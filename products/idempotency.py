@@ -0,0 +1,128 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+IDEMPOTENCY_MAX_KEY_LENGTH = 100
+
+# Replayed responses keep these headers; everything else is regenerated
+REPLAYED_HEADERS = ('Content-Type', 'Location', 'Content-Disposition')
+
+_IN_PROGRESS = 'in-progress'
+
+
+def get_idempotency_key(request):
+    """Read the client key from the Idempotency-Key header or a form field"""
+    key = request.META.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD)
+    if key and len(key) <= IDEMPOTENCY_MAX_KEY_LENGTH:
+        return key.strip()
+    return None
+
+
+def _cache_key(request, key):
+    digest = hashlib.sha256(f'{request.user.pk}:{request.path}:{key}'.encode()).hexdigest()
+    return f'idempotency:{digest}'
+
+
+def _fingerprint(request):
+    """Hash of the request payload, used to reject a key reused for other data"""
+    if request.content_type in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+        # Form data has already been parsed, so the raw body is no longer readable
+        payload = repr(sorted(
+            (field, request.POST.getlist(field)) for field in request.POST if field != 'csrfmiddlewaretoken'
+        )).encode()
+    else:
+        payload = request.body
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _replay(stored):
+    response = HttpResponse(stored['content'], status=stored['status'])
+    for header, value in stored['headers'].items():
+        response[header] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _default_should_store(response):
+    return 200 <= response.status_code < 400
+
+
+def idempotent(should_store=_default_should_store):
+    """Make a POST view safe to retry with an idempotency key
+
+    The first request with a given key claims it with ``cache.add`` and runs
+    the view; its response is stored for IDEMPOTENCY_KEY_TTL seconds. Replays
+    of the same key return the stored response without running the view.
+    Responses rejected by ``should_store`` release the key so the client can
+    correct the request and try again. Requests without a key are unaffected.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = get_idempotency_key(request) if request.method == 'POST' else None
+            if not key or not request.user.is_authenticated:
+                return view_func(request, *args, **kwargs)
+
+            cache_key = _cache_key(request, key)
+            fingerprint = _fingerprint(request)
+            ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24)
+            lock_ttl = getattr(settings, 'IDEMPOTENCY_LOCK_TTL', 30)
+
+            claim = {'state': _IN_PROGRESS, 'fingerprint': fingerprint}
+            while not cache.add(cache_key, claim, lock_ttl):
+                stored = _wait_for_response(cache_key)
+                if stored is None:
+                    # The other request released its claim; try to take it over
+                    continue
+                if stored['state'] == _IN_PROGRESS:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'A request with this idempotency key is still being processed'
+                    }, status=409)
+                if stored['fingerprint'] != fingerprint:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'Idempotency key was already used for a different request'
+                    }, status=422)
+                return _replay(stored)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                cache.delete(cache_key)
+                raise
+
+            if getattr(response, 'streaming', False) or not should_store(response):
+                cache.delete(cache_key)
+                return response
+
+            cache.set(cache_key, {
+                'state': 'done',
+                'fingerprint': fingerprint,
+                'status': response.status_code,
+                'content': response.content,
+                'headers': {header: response[header] for header in REPLAYED_HEADERS if response.has_header(header)},
+            }, ttl)
+            return response
+        return wrapper
+    return decorator
+
+
+def _wait_for_response(cache_key):
+    """Poll briefly for a concurrent request holding the key to finish
+
+    Returns the stored entry, which is still in progress if the wait timed
+    out, or None if the key was released.
+    """
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 5)
+    while True:
+        stored = cache.get(cache_key)
+        if stored is None or stored['state'] != _IN_PROGRESS or time.monotonic() >= deadline:
+            return stored
+        time.sleep(0.05)
@@ -0,0 +1,334 @@
+import logging
+import posixpath
+from base64 import b64encode
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError, features
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Pillow format, MIME type and encoder options per derivative format
+DERIVATIVE_FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 55, 'speed': 8}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+DERIVATIVES_DIR = 'derivatives'
+PLACEHOLDER_SIZE = 16  # Longest side of the inline preview shown while an image loads
+
+# (model label, image field, variants field) for every uploaded image the site serves
+IMAGE_FIELDS = [
+    ('products.Product', 'image', 'image_variants'),
+    ('products.ProductImage', 'image', 'image_variants'),
+    ('accounts.UserProfile', 'profile_picture', 'profile_picture_variants'),
+]
+
+
+class ImageRejected(ValueError):
+    """An image over the configured byte or pixel limits, or not an image at all"""
+
+
+def image_limits():
+    """``(max bytes, max pixels)`` accepted for an uploaded image"""
+    return (
+        getattr(settings, 'IMAGE_MAX_BYTES', 20 * 1024 * 1024),
+        getattr(settings, 'IMAGE_MAX_PIXELS', 40 * 1000 * 1000),
+    )
+
+
+def check_image(file):
+    """Validate an upload from its size and header alone; returns its ``(width, height)``
+
+    ``Image.open`` only parses the header, so this is cheap for any file
+    and safe to run in the request. Decoding happens in the worker.
+    """
+    max_bytes, max_pixels = image_limits()
+    if file.size > max_bytes:
+        raise ImageRejected(f'Images must be {max_bytes // (1024 * 1024)} MB or smaller.')
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            width, height = image.size
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError, ValueError):
+        raise ImageRejected('The file is not a valid image.')
+    finally:
+        file.seek(0)
+    if width * height > max_pixels:
+        raise ImageRejected(
+            f'Images can be at most {max_pixels / 1e6:g} megapixels; this one is {width * height / 1e6:.0f}.'
+        )
+    return width, height
+
+
+def open_image(source):
+    """``Image.open`` that refuses images over the pixel limit before decoding anything"""
+    image = Image.open(source)
+    max_pixels = image_limits()[1]
+    if image.width * image.height > max_pixels:
+        raise ImageRejected(f'{image.width}x{image.height} is over the {max_pixels / 1e6:g} megapixel limit')
+    return image
+
+
+def displayed_size(image):
+    """Size of ``image`` once its EXIF orientation is applied, read without decoding"""
+    if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+        return image.height, image.width
+    return image.size
+
+
+def variants_field_for(model_label, field_name):
+    for label, image_field, variants_field in IMAGE_FIELDS:
+        if (label, image_field) == (model_label, field_name):
+            return variants_field
+    raise LookupError(f'{model_label}.{field_name} is not a registered image field')
+
+
+def derivative_widths():
+    return sorted(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', [160, 320, 640, 1280]))
+
+
+def derivative_formats():
+    """Configured formats this Pillow build can encode, most compact first"""
+    configured = getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', ['avif', 'webp', 'jpeg'])
+    return [fmt for fmt in configured if fmt == 'jpeg' or features.check(fmt)]
+
+
+def derivative_name(source_name, width, fmt):
+    stem = posixpath.splitext(source_name)[0]
+    return posixpath.join(DERIVATIVES_DIR, stem, f'{width}w.{fmt}')
+
+
+def placeholder_data_uri(image):
+    """A ``data:`` URI of ``image`` shrunk to a few pixels, about 150 bytes
+
+    Browsers upscale it smoothly, which gives a blurred preview of the
+    photo that can be inlined in the page and costs no extra request.
+    """
+    thumbnail = image.convert('RGB')
+    thumbnail.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+    buffer = BytesIO()
+    if features.check('webp'):
+        thumbnail.save(buffer, 'WEBP', quality=40)
+        mime_type = 'image/webp'
+    else:
+        thumbnail.save(buffer, 'JPEG', quality=40)
+        mime_type = 'image/jpeg'
+    return f'data:{mime_type};base64,{b64encode(buffer.getvalue()).decode("ascii")}'
+
+
+def generate_variants(field_file):
+    """Resize ``field_file`` to every configured width and format; returns the variants record
+
+    The record is stored in the model's ``*_variants`` JSON field::
+
+        {'source': 'products/a.jpg', 'width': 4032, 'height': 3024,
+         'placeholder': 'data:image/webp;base64,...',
+         'variants': {'webp': [[160, 'derivatives/products/a/160w.webp'], ...], ...}}
+
+    ``source`` ties the record to the file it was made from, so a replaced
+    image is detected as stale. JPEGs are decoded at reduced resolution
+    when the largest derivative is much smaller than the original.
+    """
+    storage = field_file.storage
+    with field_file.open('rb') as source:
+        image = open_image(source)
+        width, height = displayed_size(image)
+        largest = min(max(derivative_widths()), width)
+        request = (largest, max(1, round(height * largest / width)))
+        if image.size != (width, height):
+            request = request[::-1]
+        # Lets libjpeg scale by 1/2, 1/4 or 1/8 while decoding; no-op for other formats
+        image.draft(None, request)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        targets = [w for w in derivative_widths() if w < width] or [width]
+        variants = {fmt: [] for fmt in derivative_formats()}
+        # Largest first, each size resampled from the previous one
+        current = image
+        for target in sorted(targets, reverse=True):
+            size = (target, max(1, round(height * target / width)))
+            current = current.resize(size, Image.LANCZOS)
+            for fmt, entries in variants.items():
+                pil_format, mime_type, options = DERIVATIVE_FORMATS[fmt]
+                frame = current.convert('RGB') if fmt == 'jpeg' and current.mode != 'RGB' else current
+                buffer = BytesIO()
+                frame.save(buffer, pil_format, **options)
+                name = derivative_name(field_file.name, target, fmt)
+                if storage.exists(name):
+                    storage.delete(name)
+                entries.append([target, storage.save(name, ContentFile(buffer.getvalue()))])
+        # ``current`` is now the smallest size, so the placeholder is cheap to make
+        placeholder = placeholder_data_uri(current)
+
+    for entries in variants.values():
+        entries.sort()
+    return {
+        'source': field_file.name,
+        'width': width,
+        'height': height,
+        'placeholder': placeholder,
+        'variants': variants,
+    }
+
+
+def add_placeholder(instance, field_name, variants_field):
+    """Add a placeholder to a current variants record made before placeholders existed
+
+    Made from the smallest derivative rather than the original. Returns
+    True if the record was updated.
+    """
+    field_file = getattr(instance, field_name)
+    record = getattr(instance, variants_field) or {}
+    if not variants_are_current(field_file, record) or record.get('placeholder'):
+        return False
+    smallest = min(
+        (entry for entries in record.get('variants', {}).values() for entry in entries),
+        key=lambda entry: entry[0], default=None
+    )
+    try:
+        with field_file.storage.open(smallest[1] if smallest else field_file.name, 'rb') as source:
+            placeholder = placeholder_data_uri(ImageOps.exif_transpose(Image.open(source)))
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError, ValueError) as e:
+        logger.warning('Could not make a placeholder for %s: %s', field_file.name, e)
+        return False
+
+    record = dict(record, placeholder=placeholder)
+    type(instance).objects.filter(pk=instance.pk).update(**{variants_field: record})
+    setattr(instance, variants_field, record)
+    return True
+
+
+def variants_are_current(field_file, record):
+    return bool(field_file) and bool(record) and record.get('source') == field_file.name
+
+
+def normalize_original(field_file):
+    """Store a cleaned copy of the upload: no EXIF (GPS, camera serials), rotation
+    baked in, and no side longer than ``IMAGE_MAX_DIMENSION``
+
+    Returns the new file's name, or None for files that already comply,
+    which are left byte-for-byte untouched. Image storage is
+    content-addressed, so the cleaned copy is a different blob; the caller
+    repoints its row at it and the original is collected once no other row
+    references it.
+    """
+    max_dimension = getattr(settings, 'IMAGE_MAX_DIMENSION', 4096)
+    with field_file.open('rb') as source:
+        image = open_image(source)
+        if not image.getexif() and max(image.size) <= max_dimension:
+            return None
+        pil_format = image.format
+        icc_profile = image.info.get('icc_profile')
+        # thumbnail() drafts JPEGs, so an oversized photo is never decoded at full size
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        image = ImageOps.exif_transpose(image)
+        buffer = BytesIO()
+        options = {'quality': 90} if pil_format == 'JPEG' else {}
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        image.save(buffer, pil_format, **options)
+
+    return field_file.storage.save(field_file.name, ContentFile(buffer.getvalue()))
+
+
+def refresh_image_variants(instance, field_name, variants_field, strict=False):
+    """Regenerate ``instance``'s derivatives if its image changed since they were made
+
+    Saved with a queryset update so the model's own save() is not re-entered.
+    A broken upload is logged and recorded with no variants, so it is not
+    retried on every save; templates then fall back to the original file.
+    With ``strict`` the error is raised instead, for callers that retry.
+    """
+    field_file = getattr(instance, field_name)
+    record = getattr(instance, variants_field) or {}
+    if variants_are_current(field_file, record) or (not field_file and not record):
+        return record
+
+    # Old derivatives may be shared with other rows; they go when their source blob is collected
+    new_record = {}
+    if field_file:
+        try:
+            new_record = generate_variants(field_file)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError, ValueError) as e:
+            # Retrying cannot help an image over the limits
+            if strict and not isinstance(e, ImageRejected):
+                raise
+            logger.warning('Could not generate derivatives for %s: %s', field_file.name, e)
+            new_record = {'source': field_file.name, 'variants': {}}
+
+    type(instance).objects.filter(pk=instance.pk).update(**{variants_field: new_record})
+    setattr(instance, variants_field, new_record)
+    return new_record
+
+
+def init_worker_process():
+    """Pool initializer: spawned workers start from a fresh interpreter
+
+    Each worker's address space is capped at ``IMAGE_WORKER_MEMORY_LIMIT``
+    bytes. Lives here rather than in the command module because children import
+    the initializer before Django is set up, and this module has no model
+    imports.
+    """
+    import django
+
+    django.setup()
+
+    # Refuse decompression bombs at the same limit uploads are checked against
+    Image.MAX_IMAGE_PIXELS = image_limits()[1]
+    memory_limit = getattr(settings, 'IMAGE_WORKER_MEMORY_LIMIT', None)
+    if memory_limit and resource is not None:
+        # An image that still needs more fails its job with MemoryError
+        # (and is retried/abandoned) instead of growing until the OOM killer
+        # picks a process
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def process_image(model_label, object_id, field_name):
+    """Normalize one uploaded image and build its derivatives
+
+    Runs inside the ``process_images`` worker pool, so it only takes and
+    returns plain values. Returns False if the row or file no longer exists.
+    """
+    from django.apps import apps
+    from django.db import transaction
+
+    model = apps.get_model(model_label)
+    MediaBlob = apps.get_model('products', 'MediaBlob')
+    instance = model.objects.filter(pk=object_id).first()
+    if instance is None:
+        return False
+    field_file = getattr(instance, field_name)
+    if field_file and not field_file.storage.exists(field_file.name):
+        return False
+    if field_file:
+        original_name = field_file.name
+        try:
+            normalized_name = normalize_original(field_file)
+        except ImageRejected:
+            normalized_name = None  # Recorded as broken by refresh_image_variants below
+        if normalized_name:
+            with transaction.atomic():
+                # Only repoint rows that still hold the original; a newer upload wins
+                repointed = model.objects.filter(pk=object_id, **{field_name: original_name}).update(
+                    **{field_name: normalized_name}
+                )
+                if repointed:
+                    MediaBlob.acquire(normalized_name)
+                    MediaBlob.release(original_name)
+                else:
+                    transaction.on_commit(lambda: MediaBlob.collect(normalized_name))
+            if not repointed:
+                return False
+            setattr(instance, field_name, normalized_name)
+    refresh_image_variants(instance, field_name, variants_field_for(model_label, field_name), strict=True)
+    return True
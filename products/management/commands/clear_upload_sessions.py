@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from products.uploads import clear_expired_uploads
+
+class Command(BaseCommand):
+    help = 'Delete expired chunked upload sessions, their chunks, and assembled images no product uses'
+
+    def handle(self, *args, **options):
+        cleared = clear_expired_uploads()
+        self.stdout.write(self.style.SUCCESS(f'Cleared {cleared} expired upload(s)'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from products.models import MediaBlob
+
+class Command(BaseCommand):
+    help = 'Delete stored images that no row references once MEDIA_BLOB_GRACE_PERIOD has passed'
+
+    def handle(self, *args, **options):
+        collected = MediaBlob.collect_unreferenced()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {collected} unreferenced file(s)'))
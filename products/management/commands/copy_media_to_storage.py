@@ -0,0 +1,38 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from products.storage import image_storage
+
+class Command(BaseCommand):
+    help = 'Copy images kept under MEDIA_ROOT into the configured image storage (e.g. an S3 bucket), keeping their names'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(settings.MEDIA_ROOT), help='Local directory to copy from')
+        parser.add_argument('--threads', type=int, default=8, help='Files uploaded concurrently')
+
+    def handle(self, *args, **options):
+        storage = image_storage()
+        if isinstance(storage, FileSystemStorage):
+            raise CommandError('Image storage is the local filesystem; set MEDIA_BUCKET first')
+        source = options['source']
+        names = [
+            os.path.relpath(os.path.join(directory, filename), source).replace(os.sep, '/')
+            for directory, _, filenames in os.walk(source)
+            for filename in filenames
+        ]
+
+        def copy(name):
+            if storage.exists(name):
+                return False
+            with open(os.path.join(source, name), 'rb') as f:
+                # Rows and MediaBlob already use these names; keep them as they are
+                storage.save_unhashed(name, File(f, name))
+            return True
+
+        with ThreadPoolExecutor(max_workers=max(1, options['threads'])) as pool:
+            copied = sum(pool.map(copy, names))
+        self.stdout.write(self.style.SUCCESS(f'Copied {copied} of {len(names)} file(s)'))
@@ -0,0 +1,42 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from products.images import IMAGE_FIELDS
+from products.models import MediaBlob
+from products.storage import image_storage
+
+class Command(BaseCommand):
+    help = 'Recount media references and move files stored before content addressing onto hashed, shared names'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount-only', action='store_true', help='Only rebuild reference counts')
+
+    def handle(self, *args, **options):
+        blobs = MediaBlob.rebuild_ref_counts()
+        self.stdout.write(f'Recounted references for {blobs} file(s)')
+        if options['recount_only']:
+            return
+
+        storage = image_storage()
+        moved = merged = missing = 0
+        legacy = MediaBlob.objects.filter(sha256='', ref_count__gt=0).values_list('name', flat=True)
+        for name in legacy.iterator(chunk_size=500):
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f'{name}: file is missing')
+                continue
+            with storage.open(name, 'rb') as content:
+                new_name = storage.save(name, content)
+            merged += MediaBlob.objects.filter(name=new_name, ref_count__gt=0).exists()
+            with transaction.atomic():
+                for label, field_name, variants_field in IMAGE_FIELDS:
+                    for instance in apps.get_model(label).objects.filter(**{field_name: name}).iterator():
+                        # Saving moves the reference; the job rebuilds derivatives under the new name
+                        setattr(instance, field_name, new_name)
+                        setattr(instance, variants_field, {})
+                        instance.save(update_fields=[field_name, variants_field])
+            moved += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} file(s) ({merged} onto an existing copy), {missing} missing'
+        ))
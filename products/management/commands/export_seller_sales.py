@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from products.exports import EXPORT_FORMATS, iter_export, parse_export_date, seller_sales_rows
+
+class Command(BaseCommand):
+    help = 'Stream a seller\'s sales (OrderItem rows) as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Username of the seller to export')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--since', help='Only include orders on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Only include orders on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--output', help='File to write to (defaults to stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist')
+
+        try:
+            since = parse_export_date(options['since'])
+            until = parse_export_date(options['until'], end_of_day=True)
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+
+        rows = seller_sales_rows(seller, since=since, until=until)
+        lines = iter_export(rows, options['format'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f'Sales exported to {options["output"]}'))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,26 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from products.images import IMAGE_FIELDS, add_placeholder, refresh_image_variants
+
+class Command(BaseCommand):
+    help = 'Create resized WebP/AVIF/JPEG derivatives and inline placeholders for uploaded images that do not have current ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives even if they are current')
+
+    def handle(self, *args, **options):
+        for label, field_name, variants_field in IMAGE_FIELDS:
+            model = apps.get_model(label)
+            images = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            processed = placeholders = 0
+            for instance in images.only('pk', field_name, variants_field).iterator(chunk_size=500):
+                if options['force']:
+                    setattr(instance, variants_field, {})
+                before = getattr(instance, variants_field)
+                if refresh_image_variants(instance, field_name, variants_field) is not before:
+                    processed += 1
+                # Records made before placeholders existed only need the placeholder
+                elif add_placeholder(instance, field_name, variants_field):
+                    placeholders += 1
+            self.stdout.write(f'{label}: {processed} image(s) processed, {placeholders} placeholder(s) added')
+        self.stdout.write(self.style.SUCCESS('Derivatives are up to date'))
@@ -34,15 +34,12 @@ class Command(BaseCommand):
                 user.set_password('password123')
                 user.save()
                 
-                # Create user profile
-                UserProfile.objects.get_or_create(
-                    user=user,
-                    defaults={
-                        'student_id': f'STU{random.randint(100000, 999999)}',
-                        'university': 'Sample University',
-                        'phone_number': f'+1-555-{random.randint(1000, 9999)}',
-                        'address': f'{random.randint(100, 999)} Campus Drive'
-                    }
+                # Fill in the profile created with the user
+                UserProfile.objects.filter(user=user).update(
+                    student_id=f'STU{random.randint(100000, 999999)}',
+                    university='Sample University',
+                    phone_number=f'+1-555-{random.randint(1000, 9999)}',
+                    address=f'{random.randint(100, 999)} Campus Drive'
                 )
                 self.stdout.write(f'Created user: {user.username}')
             users.append(user)
@@ -0,0 +1,87 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from products.images import init_worker_process, process_image
+from products.models import ImageJob
+
+class Command(BaseCommand):
+    help = 'Process queued image uploads (EXIF stripping, derivatives) in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'IMAGE_WORKER_PROCESSES', 2),
+                            help='Worker processes, i.e. images processed concurrently')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait for new jobs when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty instead of polling')
+
+    def handle(self, *args, **options):
+        self.processes = max(1, options['processes'])
+        self.max_attempts = getattr(settings, 'IMAGE_JOB_MAX_ATTEMPTS', 5)
+        self.retry_delay = timedelta(seconds=getattr(settings, 'IMAGE_JOB_RETRY_DELAY', 30))
+        self.stale_after = timedelta(seconds=getattr(settings, 'IMAGE_JOB_STALE_AFTER', 600))
+        self.processed = self.failed = 0
+
+        in_flight = {}
+        pool = self._start_pool()
+        try:
+            while True:
+                free = self.processes - len(in_flight)
+                if free:
+                    for job in ImageJob.claim(free, self.stale_after):
+                        future = pool.submit(process_image, job.model_label, job.object_id, job.field_name)
+                        in_flight[future] = job
+
+                if not in_flight:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(in_flight, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job = in_flight.pop(future)
+                    try:
+                        future.result()
+                    except BrokenProcessPool as e:
+                        # A child died (e.g. killed for memory); its job is retried like any failure
+                        broken = True
+                        self._fail(job, f'Worker process died: {e}')
+                    except Exception as e:
+                        self._fail(job, f'{type(e).__name__}: {e}')
+                    else:
+                        job.mark_done()
+                        self.processed += 1
+                if broken:
+                    for future, job in in_flight.items():
+                        self._fail(job, 'Worker pool restarted')
+                    in_flight.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._start_pool()
+        except KeyboardInterrupt:
+            self.stdout.write('Interrupted; unfinished jobs will be reclaimed once they go stale')
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {self.processed} image(s), {self.failed} failure(s)'))
+
+    def _start_pool(self):
+        # Children open their own database connections; never share the parent's
+        connections.close_all()
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker_process,
+            max_tasks_per_child=getattr(settings, 'IMAGE_WORKER_MAX_TASKS', 50),
+        )
+
+    def _fail(self, job, error):
+        self.failed += 1
+        job.mark_failed(error, self.max_attempts, self.retry_delay)
+        self.stderr.write(f'{job}: {error}')
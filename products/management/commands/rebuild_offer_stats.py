@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+
+class Command(BaseCommand):
+    help = 'Recompute per-product offer summaries (best offer, count, latest) from offer messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int, help='Only rebuild these products (default: all)')
+
+    def handle(self, *args, **options):
+        count = Product.rebuild_offer_stats(options['product_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt offer summaries for {count} product(s)'))
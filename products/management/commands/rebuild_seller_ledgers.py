@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from products.models import SellerLedger
+
+class Command(BaseCommand):
+    help = 'Recompute seller sales ledgers from OrderItem rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only rebuild these sellers (default: all)')
+
+    def handle(self, *args, **options):
+        seller_ids = None
+        if options['usernames']:
+            seller_ids = list(User.objects.filter(username__in=options['usernames']).values_list('id', flat=True))
+
+        count = SellerLedger.rebuild(seller_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} seller ledger(s)'))
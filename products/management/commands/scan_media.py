@@ -0,0 +1,199 @@
+import json
+import os
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, UnidentifiedImageError
+from products.images import IMAGE_FIELDS
+from products.models import MediaBlob
+from products.storage import image_storage
+
+class Command(BaseCommand):
+    help = 'Check every stored image reference against MEDIA_ROOT and report missing files, orphans and sizes as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Threads used to walk and verify files')
+        parser.add_argument('--verify', action='store_true',
+                            help='Also open every referenced original to check it is a readable image')
+        parser.add_argument('--delete-orphans', action='store_true', help='Delete files no row references')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Never delete orphans modified within this many seconds (uploads in flight)')
+        parser.add_argument('--limit', type=int, default=100, help='Paths listed per report section')
+        parser.add_argument('--output', help='Write the report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        storage = image_storage()
+        if not isinstance(storage, FileSystemStorage):
+            raise CommandError('scan_media walks the local filesystem; image storage is not under MEDIA_ROOT')
+        root = storage.location
+        references, missing_owners = self._references()
+
+        with ThreadPoolExecutor(max_workers=max(1, options['threads'])) as pool:
+            files, empty_directories = self._walk(pool, root)
+            missing = [name for name in references if name not in files]
+            corrupt = []
+            if options['verify']:
+                originals = [name for name, kind in references.items() if kind == 'original' and name in files]
+                corrupt = [
+                    {'name': name, 'error': error}
+                    for name, error in zip(originals, pool.map(self._verify, (os.path.join(root, n) for n in originals)))
+                    if error
+                ]
+
+        orphans = sorted(name for name in files if name not in references)
+        cutoff = time.time() - options['min_age']
+        deleted = []
+        if options['delete_orphans']:
+            candidates = [name for name in orphans if files[name][1] < cutoff]
+            # Reusing a stored blob does not touch its file, so the mtime says nothing about
+            # saves in progress; blobs go through MediaBlob.collect(), which skips referenced
+            # ones, ones locked by a save and ones registered within the grace period
+            tracked = set()
+            for batch in self._batches(candidates):
+                tracked.update(MediaBlob.objects.filter(name__in=batch).values_list('name', flat=True))
+            collected = [name for name in candidates if name in tracked and MediaBlob.collect(name)]
+            untracked = [name for name in candidates if name not in tracked]
+            self._delete(root, untracked, collected, empty_directories)
+            deleted = sorted(collected + untracked)
+
+        limit = options['limit']
+        referenced_bytes = sum(files[name][0] for name in references if name in files)
+        orphan_bytes = sum(files[name][0] for name in orphans)
+        by_directory = {}
+        for name, (size, mtime) in files.items():
+            top = name.split('/', 1)[0] if '/' in name else '.'
+            totals = by_directory.setdefault(top, {'files': 0, 'bytes': 0})
+            totals['files'] += 1
+            totals['bytes'] += size
+
+        report = {
+            'media_root': str(root),
+            'seconds': round(time.monotonic() - started, 2),
+            'files': len(files),
+            'references': len(references),
+            'sizes': {
+                'total_bytes': referenced_bytes + orphan_bytes,
+                'referenced_bytes': referenced_bytes,
+                'orphan_bytes': orphan_bytes,
+                'by_directory': by_directory,
+                'largest': [
+                    {'name': name, 'bytes': size}
+                    for name, (size, mtime) in sorted(files.items(), key=lambda item: -item[1][0])[:10]
+                ],
+            },
+            'missing': {
+                'count': len(missing),
+                'files': [dict(missing_owners[name], name=name) for name in missing[:limit]],
+            },
+            'orphans': {'count': len(orphans), 'files': orphans[:limit]},
+            'corrupt': {'count': len(corrupt), 'files': corrupt[:limit]},
+            'deleted': {'count': len(deleted), 'bytes': sum(files[name][0] for name in deleted)},
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def _references(self):
+        """Every file a row points at, as ``{name: 'original' | 'derivative'}``
+
+        Rows are streamed; only the first owner of each name is kept, for
+        the missing-file report.
+        """
+        references, owners = {}, {}
+        for label, field_name, variants_field in IMAGE_FIELDS:
+            rows = apps.get_model(label).objects.exclude(**{f'{field_name}__in': ['', None]})
+            for pk, name, record in rows.values_list('pk', field_name, variants_field).iterator(chunk_size=2000):
+                if name not in references:
+                    references[name] = 'original'
+                    owners[name] = {'model': label, 'id': pk, 'field': field_name}
+                # Only derivatives of the current file are still served
+                if record and record.get('source') == name:
+                    for entries in record.get('variants', {}).values():
+                        for width, derivative in entries:
+                            if derivative not in references:
+                                references[derivative] = 'derivative'
+                                owners[derivative] = {'model': label, 'id': pk, 'field': variants_field}
+        return references, owners
+
+    def _walk(self, pool, root):
+        """``{relative name: (size, mtime)}`` for every file, plus empty directories
+
+        Top-level directories are walked in parallel.
+        """
+        files, directories, empty = {}, [], []
+        try:
+            entries = list(os.scandir(root))
+        except FileNotFoundError:
+            return files, empty
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                directories.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat()
+                files[entry.name] = (stat.st_size, stat.st_mtime)
+        for subtree, subtree_empty in pool.map(lambda path: self._walk_subtree(root, path), directories):
+            files.update(subtree)
+            empty.extend(subtree_empty)
+        return files, empty
+
+    @staticmethod
+    def _walk_subtree(root, top):
+        files, empty = [], []
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            with os.scandir(directory) as entries:
+                is_empty = True
+                for entry in entries:
+                    is_empty = False
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat()
+                        name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                        files.append((name, (stat.st_size, stat.st_mtime)))
+            if is_empty:
+                empty.append(os.path.relpath(directory, root).replace(os.sep, '/'))
+        return files, empty
+
+    @staticmethod
+    def _verify(path):
+        try:
+            with Image.open(path) as image:
+                image.verify()
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError, ValueError) as e:
+            return f'{type(e).__name__}: {e}'
+        return None
+
+    @staticmethod
+    def _batches(names, size=500):
+        for start in range(0, len(names), size):
+            yield names[start:start + size]
+
+    def _delete(self, root, names, collected, empty_directories):
+        """Remove files no blob row tracks, then prune the directories they and ``collected`` leave empty"""
+        directories = set(empty_directories)
+        directories.update(posixpath.dirname(name) for name in collected)
+        for name in names:
+            try:
+                os.remove(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+            directories.add(posixpath.dirname(name))
+        # Prune directories the deletions (or earlier blob collection) left empty, deepest first
+        for directory in sorted(directories, key=lambda d: d.count('/'), reverse=True):
+            while directory:
+                try:
+                    os.rmdir(os.path.join(root, directory))
+                except OSError:
+                    break
+                directory = posixpath.dirname(directory)
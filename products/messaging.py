@@ -0,0 +1,242 @@
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+
+from .counters import adjust_unread_count, bump_thread_version
+from .models import MESSAGE_SEARCH_CONFIG, Conversation, Message, publish_read_receipt
+
+
+INBOX_PAGE_SIZE = 20
+THREAD_PAGE_SIZE = 30
+SEARCH_PAGE_SIZE = 20
+
+
+def encode_cursor(timestamp, pk):
+    """Opaque keyset cursor for a (timestamp, id) position; the timestamp may be None"""
+    return urlsafe_b64encode(f'{timestamp.isoformat() if timestamp else ""}|{pk}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, id) for a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        timestamp, pk = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        if timestamp:
+            timestamp = parse_datetime(timestamp)
+            if timestamp is None:
+                return None
+        else:
+            timestamp = None
+        return timestamp, int(pk)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return None
+
+
+def _keyset_page(queryset, timestamp_field, cursor, page_size):
+    """Newest-first page of ``queryset`` after ``cursor``, plus the cursor for the next page
+
+    Filters on (timestamp, id) instead of using OFFSET, so every page is an
+    index range scan no matter how deep the client pages. Rows without a
+    timestamp come first, as they do in a descending Postgres index, and the
+    cursor steps from them into the timestamped rows.
+    """
+    position = decode_cursor(cursor)
+    if position:
+        timestamp, pk = position
+        if timestamp is None:
+            queryset = queryset.filter(
+                Q(**{f'{timestamp_field}__isnull': True, 'id__lt': pk}) |
+                Q(**{f'{timestamp_field}__isnull': False})
+            )
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{timestamp_field}__lt': timestamp}) |
+                Q(**{timestamp_field: timestamp, 'id__lt': pk})
+            )
+    rows = list(queryset.order_by(F(timestamp_field).desc(nulls_first=True), '-id')[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, timestamp_field), last.id)
+    return rows, next_cursor
+
+
+def conversation_page(queryset, cursor=None, page_size=INBOX_PAGE_SIZE):
+    """One page of an inbox, most recently active conversations first"""
+    return _keyset_page(
+        queryset.select_related('buyer', 'seller', 'product', 'last_message'),
+        'last_message_at', cursor, page_size
+    )
+
+
+def thread_page(conversation, cursor=None, page_size=THREAD_PAGE_SIZE):
+    """The newest messages of a thread before ``cursor``, returned oldest first"""
+    messages, earlier_cursor = _keyset_page(
+        conversation.messages.select_related('sender', 'recipient', 'product'),
+        'created_at', cursor, page_size
+    )
+    messages.reverse()
+    return messages, earlier_cursor
+
+
+def get_user_conversation(user, conversation_id):
+    """The conversation with ``conversation_id`` if ``user`` takes part in it, else None"""
+    try:
+        return Conversation.objects.select_related('buyer', 'seller', 'product').get(
+            Q(buyer=user) | Q(seller=user),
+            id=int(conversation_id)
+        )
+    except (Conversation.DoesNotExist, ValueError, TypeError):
+        return None
+
+
+def open_conversation(request):
+    """Template context for the conversation selected with ?conversation=<id>
+
+    Only the latest page of the thread is loaded; earlier messages are fetched
+    on demand from the thread JSON endpoint. Opening a thread marks it read.
+    """
+    context = {
+        'active_conversation': None,
+        'thread_messages': [],
+        'earlier_messages_cursor': None,
+        'last_received_message': None,
+    }
+    conversation_id = request.GET.get('conversation')
+    if not conversation_id:
+        return context
+    conversation = get_user_conversation(request.user, conversation_id)
+    if conversation is None:
+        return context
+    
+    thread_messages, earlier_cursor = thread_page(conversation)
+    if conversation.unread_count_for(request.user):
+        mark_messages_read(request.user, conversation_id=conversation.id)
+        for message in thread_messages:
+            if message.recipient_id == request.user.id:
+                message.is_read = True
+    
+    last_received_message = None
+    for message in reversed(thread_messages):
+        if message.recipient_id == request.user.id:
+            last_received_message = message
+            break
+    if last_received_message is None and earlier_cursor:
+        last_received_message = conversation.messages.filter(recipient=request.user).order_by('-created_at', '-id').first()
+    
+    context.update({
+        'active_conversation': conversation,
+        'thread_messages': thread_messages,
+        'earlier_messages_cursor': earlier_cursor,
+        'last_received_message': last_received_message,
+    })
+    return context
+
+
+def _refresh_conversation_unread_counts(user, conversation_ids):
+    """Recount the user's side of each conversation with one UPDATE per side"""
+    unread = Message.objects.filter(
+        conversation=OuterRef('pk'), recipient=user, is_read=False
+    ).order_by().values('conversation').annotate(total=Count('id')).values('total')
+    count = Coalesce(Subquery(unread, output_field=IntegerField()), Value(0))
+    conversations = Conversation.objects.filter(id__in=conversation_ids)
+    conversations.filter(seller=user).update(seller_unread_count=count)
+    conversations.filter(buyer=user).update(buyer_unread_count=count)
+
+
+def mark_messages_read(user, conversation_id=None, product_id=None, before=None, message_ids=None):
+    """Mark the user's unread messages in the given scope as read
+
+    Returns ``(message_ids, conversation_ids)`` of the messages that changed
+    and the conversations they belong to.
+
+    The messages are flipped with a single UPDATE, which leaves ``updated_at``
+    alone. Conversation unread counts, the cached unread counter and read
+    receipts are updated to match.
+    """
+    unread = Message.objects.filter(recipient=user, is_read=False)
+    if conversation_id is not None:
+        unread = unread.filter(conversation_id=conversation_id)
+    if product_id is not None:
+        unread = unread.filter(product_id=product_id)
+    if before is not None:
+        unread = unread.filter(created_at__lt=before)
+    if message_ids is not None:
+        unread = unread.filter(id__in=message_ids)
+    with transaction.atomic():
+        rows = list(unread.select_for_update().order_by().values_list('id', 'conversation_id', 'sender_id'))
+        if not rows:
+            return [], []
+        message_ids = [message_id for message_id, conversation, sender in rows]
+        conversation_ids = sorted({conversation for message_id, conversation, sender in rows if conversation})
+        Message.objects.filter(id__in=message_ids).update(is_read=True)
+
+        _refresh_conversation_unread_counts(user, set(conversation_ids))
+        adjust_unread_count(user.id, -len(message_ids))
+        bump_thread_version(*conversation_ids)
+
+        receipts = {}
+        for message_id, conversation, sender in rows:
+            receipts.setdefault((sender, conversation), []).append(message_id)
+        for (sender, conversation), ids in receipts.items():
+            publish_read_receipt(sender, conversation, ids)
+    return message_ids, conversation_ids
+
+
+def set_conversations_archived(user, archived=True, conversation_id=None, product_id=None, before=None):
+    """Archive (or restore) the user's side of conversations in the given scope
+
+    Buyer and seller flags are set in one UPDATE; returns the changed ids.
+    """
+    conversations = Conversation.objects.filter(
+        Q(buyer=user, buyer_archived=not archived) | Q(seller=user, seller_archived=not archived)
+    )
+    if conversation_id is not None:
+        conversations = conversations.filter(id=conversation_id)
+    if product_id is not None:
+        conversations = conversations.filter(product_id=product_id)
+    if before is not None:
+        conversations = conversations.filter(last_message_at__lt=before)
+    with transaction.atomic():
+        conversation_ids = list(conversations.select_for_update().order_by().values_list('id', flat=True))
+        if conversation_ids:
+            Conversation.objects.filter(id__in=conversation_ids).update(
+                buyer_archived=Case(When(buyer=user, then=Value(archived)), default='buyer_archived'),
+                seller_archived=Case(When(seller=user, then=Value(archived)), default='seller_archived'),
+            )
+    return conversation_ids
+
+
+def search_messages(user, query='', message_type=None, min_price=None, max_price=None):
+    """Messages the user sent or received that match ``query`` and the filters
+
+    On PostgreSQL the query runs against the GIN-indexed ``search_vector`` and
+    results are ranked, subject hits first. Other databases have no tsvector,
+    so they fall back to a substring match on every term, newest first.
+    """
+    messages = Message.objects.filter(Q(sender=user) | Q(recipient=user))
+    if message_type:
+        messages = messages.filter(message_type=message_type)
+    if min_price is not None:
+        messages = messages.filter(offered_price__gte=min_price)
+    if max_price is not None:
+        messages = messages.filter(offered_price__lte=max_price)
+
+    ordering = ['-created_at', '-id']
+    if query and connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, search_type='websearch', config=MESSAGE_SEARCH_CONFIG)
+        messages = messages.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        )
+        ordering.insert(0, '-rank')
+    elif query:
+        for term in query.split():
+            messages = messages.filter(Q(subject__icontains=term) | Q(content__icontains=term))
+    return messages.select_related('sender', 'recipient', 'product').order_by(*ordering)
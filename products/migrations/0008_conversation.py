@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_conversations(apps, schema_editor):
+    """Group existing messages into conversations in chronological order"""
+    Message = apps.get_model('products', 'Message')
+    Conversation = apps.get_model('products', 'Conversation')
+
+    conversations = {}
+    message_conversation = {}
+    conversation_message_ids = {}
+    messages = Message.objects.select_related('product', 'parent_message').order_by('created_at', 'id')
+    for message in messages.iterator(chunk_size=2000):
+        conversation = None
+        if message.parent_message_id:
+            conversation = message_conversation.get(message.parent_message_id)
+        if conversation is None:
+            if message.product_id:
+                seller_id = message.product.seller_id
+            elif message.parent_message_id:
+                seller_id = message.parent_message.recipient_id
+            else:
+                seller_id = message.recipient_id
+            buyer_id = message.sender_id if message.sender_id != seller_id else message.recipient_id
+            key = (buyer_id, seller_id, message.product_id)
+            conversation = conversations.get(key)
+            if conversation is None:
+                conversation = Conversation.objects.create(buyer_id=buyer_id, seller_id=seller_id, product_id=message.product_id)
+                conversations[key] = conversation
+
+        message_conversation[message.id] = conversation
+        conversation.last_message_id = message.id
+        conversation.last_message_at = message.created_at
+        if not message.is_read:
+            if message.recipient_id == conversation.buyer_id:
+                conversation.buyer_unread_count += 1
+            else:
+                conversation.seller_unread_count += 1
+        conversation_message_ids.setdefault(conversation.pk, []).append(message.id)
+
+    for conversation in conversations.values():
+        conversation.save(update_fields=['last_message', 'last_message_at', 'buyer_unread_count', 'seller_unread_count'])
+        Message.objects.filter(pk__in=conversation_message_ids[conversation.pk]).update(conversation=conversation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_sellerledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('buyer_unread_count', models.PositiveIntegerField(default=0)),
+                ('seller_unread_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('buyer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buyer_conversations', to=settings.AUTH_USER_MODEL)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.message')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='products.product')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_conversations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_message_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='products.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at'], name='products_me_convers_472745_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['buyer', '-last_message_at'], name='products_co_buyer_i_d12563_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['seller', '-last_message_at'], name='products_co_seller__684e8b_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('buyer', 'seller', 'product'), name='unique_conversation_per_product'),
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def backfill_search_vectors(apps, schema_editor):
+    """Index the text of existing messages; other databases fall back to substring search"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from django.contrib.postgres.search import SearchVector
+
+    Message = apps.get_model('products', 'Message')
+    Message.objects.update(
+        search_vector=SearchVector('subject', weight='A', config='english') +
+        SearchVector('content', weight='B', config='english')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_conversation_archived'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='message_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:14
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_offer_summaries(apps, schema_editor):
+    """Summarize the offers already sent on each product"""
+    Message = apps.get_model('products', 'Message')
+    Product = apps.get_model('products', 'Product')
+
+    offers = Message.objects.filter(
+        product=OuterRef('pk'), message_type='offer', offered_price__isnull=False
+    ).exclude(sender=OuterRef('seller')).order_by().values('product')
+    Product.objects.update(
+        best_offer=Subquery(offers.annotate(best=Max('offered_price')).values('best')),
+        offer_count=Coalesce(Subquery(offers.annotate(total=Count('id')).values('total')), 0),
+        last_offer_at=Subquery(offers.annotate(latest=Max('created_at')).values('latest')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_message_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='best_offer',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='last_offer_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='offer_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_offer_summaries, migrations.RunPython.noop),
+    ]
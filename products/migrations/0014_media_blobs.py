@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:22
+
+from collections import Counter
+
+import products.storage
+from django.db import migrations, models
+
+IMAGE_FIELDS = [
+    ('products', 'Product', 'image'),
+    ('products', 'ProductImage', 'image'),
+    ('accounts', 'UserProfile', 'profile_picture'),
+]
+
+
+def count_existing_references(apps, schema_editor):
+    """Register files uploaded before content addressing, with their reference counts
+
+    Their names stay as they are and their hashes are left blank; new
+    uploads of the same bytes get content-addressed names of their own.
+    """
+    MediaBlob = apps.get_model('products', 'MediaBlob')
+    counts = Counter()
+    for app_label, model_name, field_name in IMAGE_FIELDS:
+        model = apps.get_model(app_label, model_name)
+        names = model.objects.exclude(**{f'{field_name}__in': ['', None]}).values_list(field_name, flat=True)
+        counts.update(names.iterator())
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name, ref_count=count) for name, count in counts.items()], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_imagejob'),
+        ('accounts', '0004_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=products.storage.image_storage, upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=products.storage.image_storage, upload_to='products/'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count'], name='products_me_ref_cou_427555_idx')],
+            },
+        ),
+        migrations.RunPython(count_existing_references, migrations.RunPython.noop),
+    ]
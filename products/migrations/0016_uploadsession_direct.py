@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='direct',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_from_created_at(apps, schema_editor):
+    """Existing blobs were last stored when their row was created"""
+    apps.get_model('products', 'MediaBlob').objects.update(last_registered_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_uploadsession_direct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='last_registered_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(start_from_created_at, migrations.RunPython.noop),
+    ]
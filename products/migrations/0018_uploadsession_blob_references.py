@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:03
+
+from django.db import migrations
+from django.db.models import F
+
+
+def reference_completed_uploads(apps, schema_editor):
+    """Completed uploads now hold a reference to their file until they are discarded"""
+    MediaBlob = apps.get_model('products', 'MediaBlob')
+    UploadSession = apps.get_model('products', 'UploadSession')
+    uploads = UploadSession.objects.filter(status='complete').exclude(stored_name='')
+    for name in uploads.values_list('stored_name', flat=True).iterator():
+        if not MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1):
+            MediaBlob.objects.create(name=name, ref_count=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_mediablob_last_registered_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(reference_completed_uploads, migrations.RunPython.noop),
+    ]
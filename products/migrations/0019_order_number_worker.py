@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_uploadsession_blob_references'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberWorker',
+            fields=[
+                ('worker_id', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('owner', models.CharField(blank=True, max_length=100)),
+                ('expires_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
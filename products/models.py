@@ -1,6 +1,23 @@
-from django.db import models
+from collections import Counter
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from django.contrib.auth.models import User
 from decimal import Decimal
+import math
+import uuid
+from .utils import generate_order_number
+from .events import publish_on_commit, user_channel
+from .counters import adjust_unread_count, bump_thread_version
+from .dashboard import clear_activity, forget_activity, invalidate_dashboard, record_activity
+from .images import IMAGE_FIELDS, variants_are_current, variants_field_for
+from .storage import image_storage
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -27,6 +44,7 @@ class Product(models.Model):
         ('sold', 'Sold'),
         ('reserved', 'Reserved'),
     ]
+    DASHBOARD_FIELDS = ('status', 'title')  # Shown on the seller dashboard (status counts, product titles)
 
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products')
     title = models.CharField(max_length=200)
@@ -35,7 +53,8 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     condition = models.CharField(max_length=20, choices=CONDITION_CHOICES, default='good')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
-    image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image = models.ImageField(upload_to='products/', storage=image_storage, blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized derivatives, see products/images.py
     location = models.CharField(max_length=200, help_text="Where on campus to meet")
     
     # Seller contact information (optional - can override profile defaults)
@@ -53,16 +72,84 @@ class Product(models.Model):
         help_text="Preferred way for buyers to contact you"
     )
     
+    # Offer summary, updated as price-offer messages arrive (see record_offer)
+    best_offer = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    offer_count = models.PositiveIntegerField(default=0)
+    last_offer_at = models.DateTimeField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self) -> str:
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored file so save() can move its blob reference
+        instance._loaded_image = MediaBlob.loaded_name(instance, field_names, 'image')
+        # And what the seller dashboard shows, so other saves leave its caches alone
+        instance._loaded_summary = {
+            name: value for name, value in zip(field_names, values) if name in cls.DASHBOARD_FIELDS
+        }
+        return instance
+    
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_summary', {})
+        changed = {name for name in self.DASHBOARD_FIELDS if name not in loaded or loaded[name] != getattr(self, name)}
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            changed &= set(update_fields)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._loaded_image = MediaBlob.track_change(self, 'image', getattr(self, '_loaded_image', None))
+            if changed:
+                invalidate_dashboard(self.seller_id)
+                if 'title' in changed:
+                    clear_activity(self.seller_id)
+        self._loaded_summary = {**loaded, **{name: getattr(self, name) for name in changed}}
+        ImageJob.enqueue(self, 'image', product=self)
+    
+    def image_progress(self):
+        """Counts of this product's image jobs by status, e.g. ``{'pending': 2, 'done': 4}``"""
+        return dict(self.image_jobs.order_by().values_list('status').annotate(total=Count('id')))
+    
+    @classmethod
+    def record_offer(cls, message):
+        """Fold a new offer message into its product's offer summary with one UPDATE
+
+        Offers the seller sends on their own product are not counted.
+        """
+        if message.message_type != 'offer' or message.offered_price in (None, '') or not message.product_id:
+            return
+        offered_price = Decimal(str(message.offered_price))
+        cls.objects.filter(pk=message.product_id).exclude(seller_id=message.sender_id).update(
+            best_offer=Greatest(Coalesce('best_offer', Value(offered_price)), Value(offered_price)),
+            offer_count=F('offer_count') + 1,
+            last_offer_at=message.created_at,
+        )
+    
+    @classmethod
+    def rebuild_offer_stats(cls, product_ids=None):
+        """Recompute offer summaries from Message rows; returns the number of products updated"""
+        offers = Message.objects.filter(
+            product=OuterRef('pk'), message_type='offer', offered_price__isnull=False
+        ).exclude(sender=OuterRef('seller')).order_by().values('product')
+        products = cls.objects.all() if product_ids is None else cls.objects.filter(pk__in=product_ids)
+        return products.update(
+            best_offer=Subquery(offers.annotate(best=Max('offered_price')).values('best')),
+            offer_count=Coalesce(Subquery(offers.annotate(total=Count('id')).values('total')), 0),
+            last_offer_at=Subquery(offers.annotate(latest=Max('created_at')).values('latest')),
+        )
+    
     def get_seller_contact_info(self):
-        """Get seller contact information, falling back to profile defaults"""
+        """Get seller contact information, falling back to profile defaults
+
+        Load the product with ``select_related('seller__userprofile')`` to
+        avoid two extra queries.
+        """
         contact_info = {
-            'phone': self.seller_phone or getattr(self.seller.userprofile, 'phone_number', ''),
+            'phone': self.seller_phone or self.seller.userprofile.phone_number,
             'email': self.seller_email or self.seller.email,
             'preferred_method': self.preferred_contact_method
         }
@@ -73,12 +160,25 @@ class Product(models.Model):
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='additional_images')
-    image = models.ImageField(upload_to='products/')
+    image = models.ImageField(upload_to='products/', storage=image_storage)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Image for {self.product.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image = MediaBlob.loaded_name(instance, field_names, 'image')
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._loaded_image = MediaBlob.track_change(self, 'image', getattr(self, '_loaded_image', None))
+        ImageJob.enqueue(self, 'image', product=self.product)
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -140,6 +240,16 @@ class OrderItem(models.Model):
     def get_total_price(self):
         return self.quantity * self.price
 
+MESSAGE_SEARCH_CONFIG = 'english'
+
+
+def message_search_vector(subject, content):
+    """Weighted tsvector for a message; subject matches rank above body matches"""
+    return (
+        SearchVector(subject, weight='A', config=MESSAGE_SEARCH_CONFIG) +
+        SearchVector(content, weight='B', config=MESSAGE_SEARCH_CONFIG)
+    )
+
 class Message(models.Model):
     MESSAGE_TYPES = [
         ('inquiry', 'Product Inquiry'),
@@ -164,6 +274,10 @@ class Message(models.Model):
     
     # For reply threading
     parent_message = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    conversation = models.ForeignKey('Conversation', on_delete=models.CASCADE, null=True, blank=True, related_name='messages')
+    
+    # Full-text search over subject and content (PostgreSQL only)
+    search_vector = SearchVectorField(null=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -171,8 +285,144 @@ class Message(models.Model):
     def __str__(self):
         return f"Message from {self.sender.username} to {self.recipient.username} about {self.product.title if self.product else 'General'}"
 
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        if connection.vendor == 'postgresql' and (update_fields is None or {'subject', 'content'} & set(update_fields)):
+            # Computed by the same INSERT/UPDATE, so the vector never lags the text
+            self.search_vector = message_search_vector(Value(self.subject), Value(self.content))
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_vector'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                Conversation.record_message(self)
+                Product.record_offer(self)
+                event = self.as_event_data()
+                publish_on_commit(user_channel(self.recipient_id), 'message.created', event)
+                publish_on_commit(user_channel(self.sender_id), 'message.created', event)
+                invalidate_dashboard(self.recipient_id)
+            bump_thread_version(self.conversation_id)
+
+    def as_event_data(self):
+        """JSON-serializable summary pushed to connected clients"""
+        return {
+            'id': self.id,
+            'conversation_id': self.conversation_id,
+            'parent_message_id': self.parent_message_id,
+            'sender_id': self.sender_id,
+            'sender_name': self.sender.first_name or self.sender.username,
+            'recipient_id': self.recipient_id,
+            'product_id': self.product_id,
+            'message_type': self.message_type,
+            'message_type_display': self.get_message_type_display(),
+            'subject': self.subject,
+            'content': self.content,
+            'offered_price': str(self.offered_price) if self.offered_price is not None else None,
+            'is_read': self.is_read,
+            'created_at': self.created_at.isoformat(),
+        }
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'created_at']),
+            GinIndex(fields=['search_vector'], name='message_search_vector_idx'),
+        ]
+
+def publish_read_receipt(sender_id, conversation_id, message_ids):
+    """Tell the sender of ``message_ids`` that they have been read"""
+    publish_on_commit(user_channel(sender_id), 'message.read', {
+        'conversation_id': conversation_id,
+        'message_ids': list(message_ids),
+    })
+
+class Conversation(models.Model):
+    """A buyer/seller thread about a product, with a denormalized inbox summary
+
+    Inbox pages list conversations instead of scanning every Message; the
+    messages themselves are only loaded when a thread is opened.
+    """
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='buyer_conversations')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='seller_conversations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='conversations', null=True, blank=True)
+    
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    
+    # Unread counts for each side of the thread
+    buyer_unread_count = models.PositiveIntegerField(default=0)
+    seller_unread_count = models.PositiveIntegerField(default=0)
+    
+    # Each side can archive the thread; a new message brings it back
+    buyer_archived = models.BooleanField(default=False)
+    seller_archived = models.BooleanField(default=False)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Conversation between {self.buyer.username} and {self.seller.username} about {self.product.title if self.product else 'General'}"
+
+    def other_party(self, user):
+        return self.seller if user.id == self.buyer_id else self.buyer
+
+    def unread_count_for(self, user):
+        return self.buyer_unread_count if user.id == self.buyer_id else self.seller_unread_count
+
+    @staticmethod
+    def _unread_field(conversation, user_id):
+        return 'buyer_unread_count' if user_id == conversation.buyer_id else 'seller_unread_count'
+
+    @staticmethod
+    def participants_for(message):
+        """Return (buyer_id, seller_id) for a message's thread"""
+        if message.product_id:
+            seller_id = message.product.seller_id
+        elif message.parent_message_id:
+            # Replies without a product go to whoever started the thread
+            seller_id = message.parent_message.recipient_id
+        else:
+            seller_id = message.recipient_id
+        buyer_id = message.sender_id if message.sender_id != seller_id else message.recipient_id
+        return buyer_id, seller_id
+
+    @classmethod
+    def record_message(cls, message):
+        """Attach a newly created message to its conversation and update the summary"""
+        conversation = None
+        if message.parent_message_id:
+            conversation = message.parent_message.conversation
+        if conversation is None:
+            buyer_id, seller_id = cls.participants_for(message)
+            conversation, created = cls.objects.get_or_create(
+                buyer_id=buyer_id,
+                seller_id=seller_id,
+                product_id=message.product_id,
+            )
+
+        unread_field = cls._unread_field(conversation, message.recipient_id)
+        cls.objects.filter(pk=conversation.pk).update(
+            last_message=message,
+            last_message_at=message.created_at,
+            buyer_archived=False,
+            seller_archived=False,
+            **{unread_field: F(unread_field) + 1}
+        )
+        Message.objects.filter(pk=message.pk).update(conversation=conversation)
+        message.conversation = conversation
+        if not message.is_read:
+            adjust_unread_count(message.recipient_id, 1)
+        return conversation
+
+    class Meta:
+        ordering = ['-last_message_at']
+        constraints = [
+            models.UniqueConstraint(fields=['buyer', 'seller', 'product'], name='unique_conversation_per_product'),
+        ]
+        indexes = [
+            models.Index(fields=['buyer', '-last_message_at']),
+            models.Index(fields=['seller', '-last_message_at']),
+        ]
 
 class ProductLike(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='liked_products')
@@ -182,6 +432,18 @@ class ProductLike(models.Model):
     def __str__(self):
         return f"{self.user.username} likes {self.product.title}"
 
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        super().save(*args, **kwargs)
+        if is_new:
+            record_activity('like', self)
+
+    def delete(self, *args, **kwargs):
+        # Unlikes only; likes removed by cascades drop out when the list expires
+        result = super().delete(*args, **kwargs)
+        forget_activity('like', self)
+        return result
+
     class Meta:
         unique_together = ['user', 'product']
 
@@ -194,6 +456,12 @@ class ProductView(models.Model):
     def __str__(self):
         return f"View of {self.product.title} by {self.user.username if self.user else self.ip_address}"
 
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        super().save(*args, **kwargs)
+        if is_new:
+            record_activity('view', self)
+
     class Meta:
         ordering = ['-created_at']
 
@@ -244,7 +512,21 @@ class Order(models.Model):
         return f"Order {self.order_number} by {self.buyer.username}"
     
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+        if not self.order_number:
+            self.order_number = generate_order_number()
+        
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            stored = []
+            if not self._state.adding and (update_fields is None or 'payment_status' in update_fields):
+                # Lock the row and read the stored status, so concurrent saves
+                # of the same order move its amounts between buckets only once
+                stored = list(
+                    Order.objects.select_for_update().filter(pk=self.pk).values_list('payment_status', flat=True)
+                )
+            super().save(*args, **kwargs)
+            if stored and stored[0] != self.payment_status:
+                SellerLedger.apply_payment_status_change(self, stored[0], self.payment_status)
     
     class Meta:
         ordering = ['-created_at']
@@ -262,3 +544,492 @@ class OrderItem(models.Model):
     
     def __str__(self):
         return f"{self.quantity}x {self.product.title} in Order {self.order.order_number if self.order.order_number else self.order.id}"
+
+
+class OrderNumberWorker(models.Model):
+    """Lease on one snowflake worker id for order numbers (products/utils.py)
+
+    Every process leases a free id before numbering its first order and
+    renews it while it keeps numbering, so no two live processes share an id
+    even when they run on different hosts or reuse PIDs in containers. An id
+    whose lease has run out goes to the next process that asks.
+    """
+    worker_id = models.PositiveSmallIntegerField(primary_key=True)
+    owner = models.CharField(max_length=100, blank=True)  # host:pid:token of the leaseholder
+    expires_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Worker {self.worker_id} ({self.owner or 'free'})"
+
+    @classmethod
+    def lease(cls, owner, duration, max_worker_id):
+        """Lease a free worker id to ``owner`` for ``duration``; returns the id
+
+        Ids are created on first use. Concurrent callers skip rows another
+        caller has locked, so each gets a different id.
+        """
+        for attempt in range(2):
+            now = timezone.now()
+            with transaction.atomic():
+                worker = (
+                    cls.objects.select_for_update(skip_locked=True)
+                    .filter(expires_at__lte=now, worker_id__lte=max_worker_id)
+                    .order_by('expires_at', 'worker_id')
+                    .first()
+                )
+                if worker is not None:
+                    worker.owner = owner
+                    worker.expires_at = now + duration
+                    worker.save(update_fields=['owner', 'expires_at'])
+                    return worker.worker_id
+            cls.objects.bulk_create(
+                [cls(worker_id=worker_id, expires_at=now) for worker_id in range(max_worker_id + 1)],
+                ignore_conflicts=True,
+            )
+        raise RuntimeError(f'All {max_worker_id + 1} order number worker ids are leased')
+
+    @classmethod
+    def renew(cls, worker_id, owner, duration):
+        """Extend ``owner``'s lease on ``worker_id``; False if it has lost the lease"""
+        return bool(cls.objects.filter(worker_id=worker_id, owner=owner).update(expires_at=timezone.now() + duration))
+
+
+class SellerLedger(models.Model):
+    """Running sales totals per seller, maintained as orders are placed and paid
+
+    Totals are updated with F() expressions inside the transaction that
+    writes the order, so revenue views read a single row instead of
+    aggregating OrderItems. Deleted orders and items are taken out again
+    (products/signals.py); item amounts are read-only in the admin. Bulk
+    ``QuerySet.update()`` calls on ``Order.payment_status`` bypass the
+    ledger; run ``rebuild_seller_ledgers`` after such changes.
+    """
+    seller = models.OneToOneField(User, on_delete=models.CASCADE, related_name='sales_ledger')
+    
+    gross_sales = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    order_count = models.PositiveIntegerField(default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+    
+    # Split of gross sales by the order's payment status
+    pending_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    # Order.payment_status value -> ledger bucket field
+    PAYMENT_BUCKETS = {
+        'pending': 'pending_amount',
+        'paid': 'paid_amount',
+    }
+    
+    def __str__(self):
+        return f"Ledger for {self.seller.username}: {self.gross_sales}"
+    
+    @staticmethod
+    def _seller_totals(order):
+        return order.items.filter(seller__isnull=False).values('seller').annotate(
+            amount=Sum('total'),
+            quantity=Sum('quantity'),
+        )
+    
+    @classmethod
+    def _ensure_ledgers(cls, seller_ids):
+        cls.objects.bulk_create(
+            [cls(seller_id=seller_id) for seller_id in seller_ids],
+            ignore_conflicts=True,
+        )
+    
+    @classmethod
+    def record_order(cls, order):
+        """Add a newly placed order's items to each seller's ledger
+        
+        Call inside the transaction that creates the OrderItems.
+        """
+        totals = list(cls._seller_totals(order))
+        cls._ensure_ledgers(row['seller'] for row in totals)
+        bucket = cls.PAYMENT_BUCKETS.get(order.payment_status)
+        for row in totals:
+            amount = row['amount'] or Decimal('0.00')
+            updates = {
+                'gross_sales': F('gross_sales') + amount,
+                'order_count': F('order_count') + 1,
+                'items_sold': F('items_sold') + (row['quantity'] or 0),
+                'updated_at': timezone.now(),
+            }
+            if bucket:
+                updates[bucket] = F(bucket) + amount
+            cls.objects.filter(seller_id=row['seller']).update(**updates)
+        invalidate_dashboard(*(row['seller'] for row in totals))
+    
+    @classmethod
+    def apply_payment_status_change(cls, order, old_status, new_status):
+        """Move an order's amounts between the pending and paid buckets"""
+        old_bucket = cls.PAYMENT_BUCKETS.get(old_status)
+        new_bucket = cls.PAYMENT_BUCKETS.get(new_status)
+        if old_bucket == new_bucket:
+            return
+        totals = list(cls._seller_totals(order))
+        cls._ensure_ledgers(row['seller'] for row in totals)
+        for row in totals:
+            amount = row['amount'] or Decimal('0.00')
+            updates = {'updated_at': timezone.now()}
+            if old_bucket:
+                updates[old_bucket] = F(old_bucket) - amount
+            if new_bucket:
+                updates[new_bucket] = F(new_bucket) + amount
+            cls.objects.filter(seller_id=row['seller']).update(**updates)
+        invalidate_dashboard(*(row['seller'] for row in totals))
+    
+    @classmethod
+    def remove_item(cls, item):
+        """Take a deleted OrderItem out of its seller's ledger
+
+        Call from the deleting transaction, after the row is gone. When an
+        order is deleted its items go first, so the order's payment status
+        can still be read. Cascades and queryset deletes remove all of an
+        order's items before any signal runs, so once the seller has nothing
+        left in the order their order count is recounted rather than
+        decremented, which would count the order once per item.
+        """
+        if not item.seller_id:
+            return
+        amount = item.total or Decimal('0.00')
+        updates = {
+            'gross_sales': F('gross_sales') - amount,
+            'items_sold': F('items_sold') - item.quantity,
+            'updated_at': timezone.now(),
+        }
+        payment_status = Order.objects.filter(pk=item.order_id).values_list('payment_status', flat=True).first()
+        bucket = cls.PAYMENT_BUCKETS.get(payment_status)
+        if bucket:
+            updates[bucket] = F(bucket) - amount
+        if not OrderItem.objects.filter(order_id=item.order_id, seller_id=item.seller_id).exists():
+            # The seller's last item in this order
+            updates['order_count'] = OrderItem.objects.filter(seller_id=item.seller_id).aggregate(
+                orders=Count('order', distinct=True)
+            )['orders']
+        cls.objects.filter(seller_id=item.seller_id).update(**updates)
+        invalidate_dashboard(item.seller_id)
+    
+    @classmethod
+    def rebuild(cls, seller_ids=None):
+        """Recompute ledgers from OrderItems; returns the number of ledgers written"""
+        items = OrderItem.objects.filter(seller__isnull=False)
+        if seller_ids is not None:
+            items = items.filter(seller_id__in=seller_ids)
+        
+        ledgers = {}
+        rows = items.values('seller', 'order__payment_status').annotate(
+            amount=Sum('total'),
+            quantity=Sum('quantity'),
+        )
+        for row in rows:
+            ledger = ledgers.setdefault(row['seller'], cls(seller_id=row['seller']))
+            amount = row['amount'] or Decimal('0.00')
+            ledger.gross_sales += amount
+            ledger.items_sold += row['quantity'] or 0
+            bucket = cls.PAYMENT_BUCKETS.get(row['order__payment_status'])
+            if bucket:
+                setattr(ledger, bucket, getattr(ledger, bucket) + amount)
+        
+        # Distinct order counts cannot be summed across payment statuses
+        order_counts = items.values('seller').annotate(orders=models.Count('order', distinct=True))
+        for row in order_counts:
+            ledgers[row['seller']].order_count = row['orders']
+        
+        with transaction.atomic():
+            stale = cls.objects.all() if seller_ids is None else cls.objects.filter(seller_id__in=seller_ids)
+            stale.exclude(seller_id__in=list(ledgers)).delete()
+            cls.objects.bulk_create(
+                ledgers.values(),
+                update_conflicts=True,
+                unique_fields=['seller'],
+                update_fields=['gross_sales', 'order_count', 'items_sold', 'pending_amount', 'paid_amount', 'updated_at'],
+            )
+        return len(ledgers)
+
+
+class MediaBlob(models.Model):
+    """One stored media file and how many rows reference it
+
+    Written by ``ContentAddressedStorage`` (products/storage.py), which names
+    images by their SHA-256 so identical uploads share one file. Model saves
+    move references between blobs and deletions release them; the file and
+    its derivatives are removed once nothing points at it.
+    """
+    UNKNOWN = object()  # Image field was deferred when the row was loaded
+
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)  # Blank for files stored before hashing
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_registered_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+    @staticmethod
+    def grace_cutoff():
+        """Blobs registered after this are not collected yet"""
+        return timezone.now() - timedelta(seconds=getattr(settings, 'MEDIA_BLOB_GRACE_PERIOD', 60 * 60))
+
+    @classmethod
+    def register(cls, name, sha256, size):
+        """Record a stored blob and hold it for the row about to reference it
+
+        The UPDATE (or INSERT) locks the row until the caller's transaction
+        ends, and ``collect`` also spares blobs registered within
+        MEDIA_BLOB_GRACE_PERIOD, so a file found by ``exists()`` is still
+        there when the referencing row is saved. References are counted
+        separately, when rows are saved.
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).update(last_registered_at=timezone.now()):
+                cls.objects.get_or_create(name=name, defaults={'sha256': sha256, 'size': size})
+            # Files stored before hashing get their digest on the next upload of the same bytes
+            cls.objects.filter(name=name, sha256='').update(sha256=sha256, size=size)
+
+    @classmethod
+    def acquire(cls, name):
+        if not name:
+            return
+        if not cls.objects.filter(name=name).update(ref_count=F('ref_count') + 1):
+            # A file that was never registered (saved by another storage)
+            cls.objects.get_or_create(name=name, defaults={'ref_count': 1})
+
+    @classmethod
+    def release(cls, name):
+        """Drop one reference; the blob is collected once the transaction commits"""
+        if not name:
+            return
+        cls.objects.filter(name=name).update(ref_count=F('ref_count') - 1)
+        transaction.on_commit(lambda: cls.collect(name))
+
+    @classmethod
+    def collect(cls, name):
+        """Delete ``name`` and its derivatives if it is no longer referenced
+
+        Blobs locked by a ``register`` in progress or registered within the
+        grace period are left for ``collect_unreferenced``.
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update(skip_locked=True).filter(name=name).first()
+            if blob is None or blob.ref_count > 0 or blob.last_registered_at > cls.grace_cutoff():
+                return False
+            image_storage().delete_blob(name)
+            blob.delete()
+        return True
+
+    @classmethod
+    def collect_unreferenced(cls):
+        """Collect every blob left without references past its grace period; returns the number deleted
+
+        Catches files stored for rows that were never saved and blobs that
+        ``collect`` skipped while they were held.
+        """
+        names = cls.objects.filter(ref_count__lte=0, last_registered_at__lt=cls.grace_cutoff())
+        return sum(cls.collect(name) for name in names.values_list('name', flat=True).iterator(chunk_size=500))
+
+    @classmethod
+    def loaded_name(cls, instance, field_names, field_name):
+        if field_name not in field_names:
+            return cls.UNKNOWN
+        return getattr(instance, field_name).name or None
+
+    @classmethod
+    def track_change(cls, instance, field_name, loaded_name):
+        """Move a reference from the blob ``instance`` was loaded with to its current one
+
+        Call inside the transaction that saves ``instance``; returns the
+        name to remember for the next save.
+        """
+        if loaded_name is cls.UNKNOWN:
+            return loaded_name
+        name = getattr(instance, field_name).name or None
+        if name != loaded_name:
+            cls.acquire(name)
+            cls.release(loaded_name)
+        return name
+
+    @classmethod
+    def rebuild_ref_counts(cls):
+        """Recount references from every registered image field and completed upload; returns the number of blobs"""
+        counts = Counter()
+        for label, field_name, variants_field in IMAGE_FIELDS:
+            names = apps.get_model(label).objects.exclude(**{f'{field_name}__in': ['', None]})
+            counts.update(names.values_list(field_name, flat=True).iterator())
+        # Completed uploads hold their file until a form attaches it or they expire
+        uploads = UploadSession.objects.filter(status='complete').exclude(stored_name='')
+        counts.update(uploads.values_list('stored_name', flat=True).iterator())
+        with transaction.atomic():
+            cls.objects.exclude(name__in=counts).update(ref_count=0)
+            existing = set(cls.objects.filter(name__in=counts).values_list('name', flat=True))
+            for name in existing:
+                cls.objects.filter(name=name).update(ref_count=counts[name])
+            cls.objects.bulk_create(
+                [cls(name=name, ref_count=count) for name, count in counts.items() if name not in existing]
+            )
+        return len(counts)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count']),
+        ]
+
+
+class ImageJob(models.Model):
+    """Background processing of one uploaded image, run by the ``process_images`` command
+
+    Requests only store the raw upload and enqueue a job, so decoding,
+    EXIF stripping and derivative generation never block a web worker.
+    Failed jobs are retried with exponential backoff up to
+    ``IMAGE_JOB_MAX_ATTEMPTS`` times.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    # The image is addressed generically: products and profile pictures share the queue
+    model_label = models.CharField(max_length=100)
+    object_id = models.PositiveBigIntegerField()
+    field_name = models.CharField(max_length=50)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name='image_jobs')
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)  # Not retried before this time
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)  # Set explicitly when claimed
+
+    def __str__(self):
+        return f"{self.model_label}#{self.object_id}.{self.field_name} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, instance, field_name, product=None):
+        """Queue ``instance``'s image for processing unless its derivatives are already current"""
+        label = instance._meta.label
+        field_file = getattr(instance, field_name)
+        record = getattr(instance, variants_field_for(label, field_name))
+        if variants_are_current(field_file, record) or (not field_file and not record):
+            return None
+        now = timezone.now()
+        job, created = cls.objects.update_or_create(
+            model_label=label,
+            object_id=instance.pk,
+            field_name=field_name,
+            defaults={
+                'product': product,
+                'status': 'pending',
+                'attempts': 0,
+                'last_error': '',
+                'available_at': now,
+                'updated_at': now,
+            },
+        )
+        return job
+
+    @classmethod
+    def claim(cls, limit, stale_after):
+        """Mark up to ``limit`` due jobs as processing and return them
+
+        Jobs left in ``processing`` longer than ``stale_after`` belong to a
+        worker that died and are claimed again. Concurrent workers skip rows
+        another worker has locked.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            job_ids = list(
+                cls.objects.select_for_update(skip_locked=True).filter(
+                    models.Q(status='pending', available_at__lte=now) |
+                    models.Q(status='processing', updated_at__lt=now - stale_after)
+                ).order_by('available_at').values_list('id', flat=True)[:limit]
+            )
+            cls.objects.filter(id__in=job_ids).update(status='processing', updated_at=now)
+        return list(cls.objects.filter(id__in=job_ids))
+
+    def _finish(self, **fields):
+        # A job re-queued by a newer upload while this run was in flight stays pending
+        return type(self).objects.filter(pk=self.pk, status='processing', updated_at=self.updated_at).update(**fields)
+
+    def mark_done(self):
+        return self._finish(status='done', last_error='', updated_at=timezone.now())
+
+    def mark_failed(self, error, max_attempts, retry_delay):
+        """Schedule a retry with exponential backoff, or give up after ``max_attempts``"""
+        attempts = self.attempts + 1
+        now = timezone.now()
+        if attempts >= max_attempts:
+            return self._finish(status='failed', attempts=attempts, last_error=error, updated_at=now)
+        return self._finish(
+            status='pending',
+            attempts=attempts,
+            last_error=error,
+            available_at=now + retry_delay * (2 ** (attempts - 1)),
+            updated_at=now,
+        )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['model_label', 'object_id', 'field_name'], name='unique_image_job'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+
+class UploadSession(models.Model):
+    """A chunked, resumable image upload (see products/uploads.py)
+
+    Chunks are written to ``UPLOAD_SESSION_DIR`` as they arrive and
+    assembled into image storage once all of them are in; the product
+    forms then attach the stored file by the session's id. A ``direct``
+    upload instead goes from the browser to object storage in one presigned
+    PUT, to ``stored_name``, and the session only confirms it arrived.
+    A completed session holds a MediaBlob reference until it is discarded.
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    total_size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)  # Optional whole-file checksum sent by the client
+    direct = models.BooleanField(default=False)  # Uploaded straight to object storage with a presigned URL
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    stored_name = models.CharField(max_length=255, blank=True)  # Name in image storage once assembled (direct: target name)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Upload {self.pk} of {self.filename} ({self.status})"
+
+    @property
+    def total_chunks(self):
+        return max(1, math.ceil(self.total_size / self.chunk_size))
+
+    def chunk_length(self, index):
+        """Expected size in bytes of chunk ``index``; only the last one may be short"""
+        if index < self.total_chunks - 1:
+            return self.chunk_size
+        return self.total_size - self.chunk_size * (self.total_chunks - 1)
+
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
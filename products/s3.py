@@ -0,0 +1,58 @@
+import base64
+import mimetypes
+
+from storages.backends.s3 import S3Storage
+from storages.utils import clean_name
+
+from .storage import ContentAddressedMixin
+
+
+class ContentAddressedS3Storage(ContentAddressedMixin, S3Storage):
+    """Content-addressed image storage in an S3-compatible bucket (S3, MinIO, ...)
+
+    Needs django-storages and boto3 (see requirements.txt), and is only
+    imported when settings select it. Browsers upload straight to the bucket
+    with presigned URLs and images are served from the bucket or a CDN in
+    front of it, so image bytes never pass through the web workers.
+    """
+
+    def __init__(self, **settings):
+        # With overwriting on, S3Storage.exists() is always False and every
+        # duplicate upload would be written again
+        settings['file_overwrite'] = False
+        # Presigned uploads need SigV4: SigV2 URLs sign neither the length
+        # nor the checksum header
+        settings['signature_version'] = 's3v4'
+        super().__init__(**settings)
+
+    def presigned_upload(self, name, size, sha256, expires_in):
+        """URL and headers for a single PUT of ``name``
+
+        The signature covers the length and the SHA-256 of the content, so
+        the bucket rejects any other bytes sent with it. The Content-Type
+        comes from the name's (already validated) extension, never from the
+        client, so an upload cannot be served back as HTML.
+        """
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode('ascii')
+        params = {
+            **self.get_object_parameters(name),
+            'Bucket': self.bucket_name,
+            'Key': self._normalize_name(clean_name(name)),
+            'ContentType': mimetypes.guess_type(name)[0] or self.default_content_type,
+            'ContentLength': size,
+            'ChecksumSHA256': checksum,
+        }
+        url = self.connection.meta.client.generate_presigned_url(
+            'put_object', Params=params, ExpiresIn=expires_in, HttpMethod='PUT'
+        )
+        headers = {'Content-Type': params['ContentType'], 'x-amz-checksum-sha256': checksum}
+        if 'CacheControl' in params:
+            headers['Cache-Control'] = params['CacheControl']
+        return {'url': url, 'method': 'PUT', 'headers': headers}
+
+    def read_head(self, name, length):
+        """The first ``length`` bytes of ``name``, with a ranged GET instead of downloading it all"""
+        response = self.connection.meta.client.get_object(
+            Bucket=self.bucket_name, Key=self._normalize_name(clean_name(name)), Range=f'bytes=0-{length - 1}'
+        )
+        return response['Body'].read()
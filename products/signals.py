@@ -0,0 +1,44 @@
+from django.db.models.signals import post_delete
+
+from .counters import bump_thread_version
+from .dashboard import clear_activity, invalidate_dashboard
+from .images import IMAGE_FIELDS
+from .models import MediaBlob, SellerLedger
+
+
+def release_image_references(sender, instance, **kwargs):
+    """Release the blobs a deleted row pointed at
+
+    A signal rather than ``delete()`` overrides, because cascades and
+    queryset deletes never call ``delete()`` on the rows they remove.
+    """
+    for label, field_name, variants_field in IMAGE_FIELDS:
+        if sender._meta.label == label:
+            loaded_name = getattr(instance, f'_loaded_{field_name}', MediaBlob.UNKNOWN)
+            if loaded_name is MediaBlob.UNKNOWN:
+                loaded_name = getattr(instance, field_name).name
+            MediaBlob.release(loaded_name)
+
+
+def refresh_seller_dashboard(sender, instance, **kwargs):
+    """Drop a deleted product from its seller's cached dashboard and activity list"""
+    invalidate_dashboard(instance.seller_id)
+    clear_activity(instance.seller_id)
+
+
+def remove_order_item_from_ledger(sender, instance, **kwargs):
+    """Keep seller ledgers right when orders or their items are deleted (cascades included)"""
+    SellerLedger.remove_item(instance)
+
+
+def refresh_message_thread(sender, instance, **kwargs):
+    """Drop a deleted message from its conversation's cached reply threads"""
+    bump_thread_version(instance.conversation_id)
+
+
+def connect():
+    for label in {label for label, field_name, variants_field in IMAGE_FIELDS}:
+        post_delete.connect(release_image_references, sender=label, dispatch_uid=f'release_image_references:{label}')
+    post_delete.connect(refresh_seller_dashboard, sender='products.Product', dispatch_uid='refresh_seller_dashboard')
+    post_delete.connect(remove_order_item_from_ledger, sender='products.OrderItem', dispatch_uid='remove_order_item_from_ledger')
+    post_delete.connect(refresh_message_thread, sender='products.Message', dispatch_uid='refresh_message_thread')
@@ -0,0 +1,99 @@
+import hashlib
+import posixpath
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+
+from .images import DERIVATIVES_DIR
+
+
+def image_storage():
+    """Storage for uploaded images (the ``images`` alias in settings.STORAGES)
+
+    Passed to the image fields as a callable so the backend can change per
+    environment without a migration.
+    """
+    return storages['images']
+
+
+class ContentAddressedMixin:
+    """Names uploads by the SHA-256 of their content and stores each blob once
+
+    ``products/IMG_1234.jpg`` is saved as ``products/3f/3f9a…e1.jpg``; a second
+    upload of the same bytes resolves to the existing file instead of writing
+    a copy. Every blob has a ``MediaBlob`` row whose ``ref_count`` tracks the
+    model rows pointing at it, and the file is deleted when that reaches zero
+    (and MEDIA_BLOB_GRACE_PERIOD has passed since it was last stored).
+    Derivatives are named after their source, so they are shared as well and
+    are written under their own names.
+    """
+    passthrough_prefixes = (DERIVATIVES_DIR + '/',)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if name.startswith(self.passthrough_prefixes):
+            return super().save(name, content, max_length=max_length)
+
+        digest, size = self.content_digest(content)
+        name = self.hashed_name(name, digest)
+        with transaction.atomic():
+            # Registered first: the row lock and grace period stop a concurrent
+            # collect() deleting the file we are about to reuse
+            apps.get_model('products', 'MediaBlob').register(name, digest, size)
+            if not self.exists(name):
+                name = super().save(name, content, max_length=max_length)
+        return name
+
+    def read_head(self, name, length):
+        """The first ``length`` bytes of ``name``, e.g. to check an image header"""
+        with self.open(name, 'rb') as f:
+            return f.read(length)
+
+    def save_unhashed(self, name, content):
+        """Write ``content`` under exactly ``name``, e.g. to copy a blob between storages"""
+        return super().save(name, content)
+
+    @staticmethod
+    def content_digest(content):
+        sha256 = hashlib.sha256()
+        size = 0
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            sha256.update(chunk)
+            size += len(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return sha256.hexdigest(), size
+
+    @staticmethod
+    def hashed_name(name, digest):
+        directory, filename = posixpath.split(name)
+        stem, extension = posixpath.splitext(filename)
+        if posixpath.basename(directory) == stem[:2] and len(stem) == len(digest):
+            # Re-saving a blob (e.g. with metadata stripped): keep its upload directory
+            directory = posixpath.dirname(directory)
+        extension = extension.lower()
+        if extension == '.jpeg':
+            extension = '.jpg'
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def delete_blob(self, name):
+        """Delete a blob and every derivative made from it"""
+        self.delete(name)
+        derivatives = posixpath.join(DERIVATIVES_DIR, posixpath.splitext(name)[0])
+        try:
+            directories, files = self.listdir(derivatives)
+        except FileNotFoundError:
+            return
+        for filename in files:
+            self.delete(posixpath.join(derivatives, filename))
+
+
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    """Content-addressed image storage under MEDIA_ROOT"""
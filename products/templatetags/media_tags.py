@@ -0,0 +1,59 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from products.images import DERIVATIVE_FORMATS, variants_are_current
+
+register = template.Library()
+
+FALLBACK_WIDTH = 640  # <img src> for browsers that ignore srcset
+
+
+@register.simple_tag
+def responsive_image(image, variants, alt='', sizes='100vw', css_class='', loading='lazy', placeholder=False, **attrs):
+    """``<picture>`` with AVIF/WebP sources and a JPEG ``srcset`` for an image field
+
+    Usage::
+
+        {% load media_tags %}
+        {% responsive_image product.image product.image_variants alt=product.title sizes="(max-width: 600px) 50vw, 280px" css_class="product-image" %}
+
+    Falls back to a plain ``<img>`` of the original file until derivatives exist.
+    The ``<picture>`` wrapper uses ``display: contents`` so existing CSS that
+    targets the ``<img>`` keeps working.
+
+    With ``placeholder=True`` the record's inline preview is set as the
+    ``<img>`` background, so grids show a blurred version of each photo
+    while the lazy-loaded file arrives. Use it for opaque, cover-fitted
+    images; a transparent PNG would show the preview through.
+    """
+    if not image:
+        return ''
+    if placeholder and variants_are_current(image, variants) and variants.get('placeholder'):
+        attrs['style'] = f"background: url({variants['placeholder']}) center / cover no-repeat"
+    extra = format_html_join('', ' {}="{}"', ((name.replace('_', '-'), value) for name, value in attrs.items()))
+    if not variants_are_current(image, variants) or not variants.get('variants'):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async"{}>',
+            image.url, alt, css_class, loading, extra
+        )
+
+    storage = image.storage
+    srcsets = {
+        fmt: ', '.join(f'{storage.url(name)} {width}w' for width, name in entries)
+        for fmt, entries in variants['variants'].items() if entries
+    }
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((DERIVATIVE_FORMATS[fmt][1], srcset, sizes) for fmt, srcset in srcsets.items() if fmt != 'jpeg')
+    )
+
+    jpeg = variants['variants'].get('jpeg') or []
+    fallback = next((name for width, name in jpeg if width >= FALLBACK_WIDTH), jpeg[-1][1] if jpeg else None)
+    return format_html(
+        '<picture style="display: contents">{}<img src="{}"{} sizes="{}" '
+        'alt="{}" class="{}" loading="{}" decoding="async"{}></picture>',
+        sources,
+        storage.url(fallback) if fallback else image.url,
+        format_html(' srcset="{}"', srcsets['jpeg']) if 'jpeg' in srcsets else '',
+        sizes, alt, css_class, loading, extra
+    )
@@ -1,3 +1,913 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from accounts.models import UserProfile
+
+try:
+    import boto3
+    import requests
+    from moto import mock_aws
+except ImportError:  # Object storage tests need requirements-test.txt
+    mock_aws = None
+
+from .counters import get_unread_count
+from .dashboard import get_dashboard_stats, get_recent_activity
+from .events import event_bus, event_stream, seller_channel, user_channel
+from .messaging import conversation_page, decode_cursor, encode_cursor, mark_messages_read, thread_page
+from .models import (
+    Cart, CartItem, Category, Conversation, MediaBlob, Message, Order, OrderItem, Product, ProductLike, ProductView,
+    OrderNumberWorker, SellerLedger, UploadSession,
+)
+from .storage import image_storage
+from .threads import load_thread
+from .utils import (
+    MAX_SEQUENCE, MAX_WORKER_ID, ORDER_NUMBER_LENGTH, SEQUENCE_BITS, WORKER_ID_BITS, OrderNumberGenerator, WorkerLease,
+)
+from .uploads import abort_upload, clear_expired_uploads, complete_upload
+
+
+def png_bytes(color='red', size=(8, 8)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TemporaryMediaMixin:
+    """Point MEDIA_ROOT (and so the images storage) at a throwaway directory"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=media_root, MEDIA_BLOB_GRACE_PERIOD=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+def make_product(seller, title='Desk lamp', price='10.00', **fields):
+    category, created = Category.objects.get_or_create(name='Test category')
+    return Product.objects.create(
+        seller=seller, category=category, title=title, description='', price=Decimal(price),
+        location='Library', **fields
+    )
+
+
+class BatchCartTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller')
+        self.buyer = User.objects.create_user('buyer')
+        self.lamp = make_product(self.seller, 'Lamp', '10.00')
+        self.chair = make_product(self.seller, 'Chair', '25.50')
+        self.client.force_login(self.buyer)
+
+    def batch(self, operations, **headers):
+        return self.client.post(
+            reverse('api_batch_cart'), json.dumps({'operations': operations}),
+            content_type='application/json', **headers
+        )
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__user=self.buyer).values_list('product_id', 'quantity'))
+
+    def test_operations_fold_into_final_quantities(self):
+        response = self.batch([
+            {'op': 'add', 'product_id': self.lamp.id, 'quantity': 2},
+            {'op': 'add', 'product_id': self.lamp.id},
+            {'op': 'add', 'product_id': self.chair.id},
+            {'op': 'update', 'product_id': self.chair.id, 'quantity': 4},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(self.quantities(), {self.lamp.id: 3, self.chair.id: 4})
+        self.assertEqual(data['total'], 3 * 10.0 + 4 * 25.5)
+        self.assertEqual([item['product_id'] for item in data['items']], [self.lamp.id, self.chair.id])
+
+    def test_update_to_zero_and_remove_delete_items(self):
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.lamp, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.chair, quantity=1)
+        response = self.batch([
+            {'op': 'update', 'product_id': self.lamp.id, 'quantity': 0},
+            {'op': 'remove', 'product_id': self.chair.id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {})
+        self.assertEqual(response.json()['total'], 0)
+
+    def test_invalid_operation_changes_nothing(self):
+        response = self.batch([
+            {'op': 'add', 'product_id': self.lamp.id},
+            {'op': 'add', 'product_id': self.chair.id, 'quantity': 0},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {})
+
+    def test_unknown_product_rolls_back_the_batch(self):
+        response = self.batch([
+            {'op': 'add', 'product_id': self.lamp.id},
+            {'op': 'add', 'product_id': 999999},
+        ])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['missing_product_ids'], [999999])
+        self.assertEqual(self.quantities(), {})
+
+    def test_non_object_body_is_rejected(self):
+        for body in ('[]', '"x"', '1'):
+            response = self.client.post(reverse('api_batch_cart'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_idempotency_key_replays_instead_of_applying_twice(self):
+        operations = [{'op': 'add', 'product_id': self.lamp.id}]
+        first = self.batch(operations, HTTP_IDEMPOTENCY_KEY='cart-batch-1')
+        second = self.batch(operations, HTTP_IDEMPOTENCY_KEY='cart-batch-1')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(self.quantities(), {self.lamp.id: 1})
+
+
+class SellerLedgerTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.buyer = User.objects.create_user('buyer')
+        self.lamp = make_product(self.alice, 'Lamp', '10.00')
+        self.desk = make_product(self.alice, 'Desk', '40.00')
+        self.bike = make_product(self.bob, 'Bike', '100.00')
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.lamp, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.desk, quantity=1)
+        CartItem.objects.create(cart=cart, product=self.bike, quantity=1)
+        self.client.force_login(self.buyer)
+        response = self.client.post(reverse('checkout'), {
+            'buyer_name': 'Buyer', 'buyer_email': 'buyer@example.com', 'buyer_phone': '555',
+            'delivery_address': 'Dorm 1',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.order = Order.objects.get(buyer=self.buyer)
+
+    def ledger(self, seller):
+        ledger = SellerLedger.objects.get(seller=seller)
+        return (ledger.gross_sales, ledger.order_count, ledger.items_sold, ledger.pending_amount, ledger.paid_amount)
+
+    def test_checkout_records_each_sellers_totals(self):
+        self.assertEqual(self.ledger(self.alice), (Decimal('60.00'), 1, 3, Decimal('60.00'), Decimal('0.00')))
+        self.assertEqual(self.ledger(self.bob), (Decimal('100.00'), 1, 1, Decimal('100.00'), Decimal('0.00')))
+
+    def test_payment_status_change_moves_amounts_once(self):
+        first = Order.objects.get(pk=self.order.pk)
+        stale = Order.objects.get(pk=self.order.pk)
+        first.payment_status = 'paid'
+        first.save()
+        # A second save of the same transition, from an instance loaded before the first
+        stale.payment_status = 'paid'
+        stale.save()
+        self.assertEqual(self.ledger(self.alice), (Decimal('60.00'), 1, 3, Decimal('0.00'), Decimal('60.00')))
+
+        first.payment_status = 'refunded'
+        first.save()
+        self.assertEqual(self.ledger(self.bob), (Decimal('100.00'), 1, 1, Decimal('0.00'), Decimal('0.00')))
+
+    def test_saves_that_skip_payment_status_leave_the_ledger_alone(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'shipped'
+        order.payment_status = 'paid'
+        order.save(update_fields=['status'])
+        self.assertEqual(self.ledger(self.alice)[3:], (Decimal('60.00'), Decimal('0.00')))
+
+    def test_deleting_items_and_orders_updates_the_ledger(self):
+        OrderItem.objects.get(order=self.order, product=self.desk).delete()
+        self.assertEqual(self.ledger(self.alice), (Decimal('20.00'), 1, 2, Decimal('20.00'), Decimal('0.00')))
+
+        OrderItem.objects.get(order=self.order, product=self.lamp).delete()
+        self.assertEqual(self.ledger(self.alice), (Decimal('0.00'), 0, 0, Decimal('0.00'), Decimal('0.00')))
+
+        Order.objects.get(pk=self.order.pk).delete()
+        self.assertEqual(self.ledger(self.bob), (Decimal('0.00'), 0, 0, Decimal('0.00'), Decimal('0.00')))
+
+    def test_deleting_an_order_with_several_items_per_seller_counts_it_once(self):
+        CartItem.objects.create(cart=Cart.objects.get(user=self.buyer), product=self.lamp, quantity=1)
+        CartItem.objects.create(cart=Cart.objects.get(user=self.buyer), product=self.desk, quantity=1)
+        response = self.client.post(reverse('checkout'), {
+            'buyer_name': 'Buyer', 'buyer_email': 'buyer@example.com', 'buyer_phone': '555',
+            'delivery_address': 'Dorm 1',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.ledger(self.alice)[:3], (Decimal('110.00'), 2, 5))
+
+        Order.objects.get(pk=self.order.pk).delete()
+        self.assertEqual(self.ledger(self.alice), (Decimal('50.00'), 1, 2, Decimal('50.00'), Decimal('0.00')))
+        # The last order on the ledger can go as well
+        Order.objects.filter(buyer=self.buyer).delete()
+        self.assertEqual(self.ledger(self.alice), (Decimal('0.00'), 0, 0, Decimal('0.00'), Decimal('0.00')))
+
+    def test_incremental_totals_match_a_rebuild(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.payment_status = 'paid'
+        order.save()
+        OrderItem.objects.get(order=self.order, product=self.lamp).delete()
+        before = {seller.id: self.ledger(seller) for seller in (self.alice, self.bob)}
+        SellerLedger.rebuild()
+        self.assertEqual(before, {seller.id: self.ledger(seller) for seller in (self.alice, self.bob)})
+
+
+class BulkMessageActionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller')
+        self.buyer = User.objects.create_user('buyer')
+        self.other = User.objects.create_user('other')
+        self.lamp = make_product(self.seller, 'Lamp')
+        self.messages = [
+            Message.objects.create(sender=self.buyer, recipient=self.seller, product=self.lamp,
+                                   subject=f'Question {i}', content='Is it available?')
+            for i in range(3)
+        ]
+        self.conversation = Conversation.objects.get(buyer=self.buyer, seller=self.seller)
+        self.client.force_login(self.seller)
+
+    def bulk(self, payload):
+        return self.client.post(reverse('bulk_update_messages'), json.dumps(payload), content_type='application/json')
+
+    def test_read_marks_the_scope_and_updates_counters(self):
+        Message.objects.create(sender=self.other, recipient=self.seller, subject='Elsewhere', content='Hi')
+        self.assertEqual(get_unread_count(self.seller.id), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.bulk({'action': 'read', 'conversation_id': self.conversation.id})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(sorted(data['message_ids']), sorted(m.id for m in self.messages))
+        self.assertEqual(data['conversation_ids'], [self.conversation.id])
+        self.assertFalse(Message.objects.filter(id__in=data['message_ids'], is_read=False).exists())
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.seller_unread_count, 0)
+        self.assertEqual(get_unread_count(self.seller.id), 1)
+
+        # Already read: nothing changes the second time
+        self.assertEqual(self.bulk({'action': 'read', 'conversation_id': self.conversation.id}).json()['message_ids'], [])
+
+    def test_read_before_only_touches_older_messages(self):
+        now = timezone.now()
+        Message.objects.filter(id=self.messages[0].id).update(created_at=now - timedelta(days=2))
+        response = self.bulk({'action': 'read', 'before': (now - timedelta(days=1)).isoformat()})
+        self.assertEqual(response.json()['message_ids'], [self.messages[0].id])
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.seller_unread_count, 2)
+
+    def test_archive_only_changes_the_requesting_side(self):
+        response = self.bulk({'action': 'archive', 'product_id': self.lamp.id})
+        self.assertEqual(response.json(), {
+            'success': True, 'action': 'archive', 'conversation_ids': [self.conversation.id], 'message_ids': [],
+        })
+        self.conversation.refresh_from_db()
+        self.assertTrue(self.conversation.seller_archived)
+        self.assertFalse(self.conversation.buyer_archived)
+
+        response = self.bulk({'action': 'unarchive', 'conversation_id': self.conversation.id})
+        self.assertEqual(response.json()['conversation_ids'], [self.conversation.id])
+        self.conversation.refresh_from_db()
+        self.assertFalse(self.conversation.seller_archived)
+
+    def test_other_users_conversations_are_out_of_scope(self):
+        self.client.force_login(self.other)
+        response = self.bulk({'action': 'archive', 'conversation_id': self.conversation.id})
+        self.assertEqual(response.json()['conversation_ids'], [])
+        self.assertEqual(self.bulk({'action': 'read', 'conversation_id': self.conversation.id}).json()['message_ids'], [])
+
+    def test_invalid_requests_are_rejected(self):
+        for body in ('[]', '"x"', '1', 'null', '{'):
+            response = self.client.post(reverse('bulk_update_messages'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.bulk({'action': 'delete', 'conversation_id': self.conversation.id}).status_code, 400)
+        self.assertEqual(self.bulk({'action': 'read'}).status_code, 400)
+        self.assertEqual(self.bulk({'action': 'read', 'before': 'yesterday'}).status_code, 400)
+
+
+class KeysetCursorTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller')
+        self.buyers = [User.objects.create_user(f'buyer{i}') for i in range(5)]
+        now = timezone.now()
+        self.conversations = [Conversation.objects.create(buyer=buyer, seller=self.seller) for buyer in self.buyers]
+        # Two conversations share a timestamp and one has no messages yet
+        timestamps = [now, now - timedelta(hours=1), now - timedelta(hours=1), now - timedelta(hours=2), None]
+        for conversation, timestamp in zip(self.conversations, timestamps):
+            Conversation.objects.filter(pk=conversation.pk).update(last_message_at=timestamp)
+
+    def pages(self, page_size):
+        queryset = Conversation.objects.filter(seller=self.seller)
+        pages, cursor = [], None
+        while True:
+            rows, cursor = conversation_page(queryset, cursor=cursor, page_size=page_size)
+            pages.append([row.id for row in rows])
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_conversation_once_in_order(self):
+        c = [conversation.id for conversation in self.conversations]
+        expected = [c[4], c[0], max(c[1], c[2]), min(c[1], c[2]), c[3]]
+        for page_size in (1, 2, 3, 5):
+            pages = self.pages(page_size)
+            self.assertEqual([row for page in pages for row in page], expected, page_size)
+            self.assertTrue(all(len(page) <= page_size for page in pages))
+
+    def test_cursor_round_trip(self):
+        now = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(now, 7)), (now, 7))
+        self.assertEqual(decode_cursor(encode_cursor(None, 7)), (None, 7))
+        for cursor in ('', 'not-a-cursor', encode_cursor(now, 7)[:-4]):
+            self.assertIsNone(decode_cursor(cursor))
+
+    def test_thread_pages_step_back_through_history(self):
+        buyer = self.buyers[0]
+        product = make_product(self.seller, 'Lamp')
+        sent = [
+            Message.objects.create(sender=buyer, recipient=self.seller, product=product, subject='Lamp', content=str(i))
+            for i in range(5)
+        ]
+        conversation = Conversation.objects.get(buyer=buyer, product=product)
+        latest, cursor = thread_page(conversation, page_size=2)
+        self.assertEqual(latest, sent[3:])
+        earlier, cursor = thread_page(conversation, cursor=cursor, page_size=2)
+        self.assertEqual(earlier, sent[1:3])
+        earliest, cursor = thread_page(conversation, cursor=cursor, page_size=2)
+        self.assertEqual((earliest, cursor), (sent[:1], None))
+
+
+class ThreadCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller')
+        self.buyer = User.objects.create_user('buyer')
+        self.lamp = make_product(self.seller, 'Lamp')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question = Message.objects.create(
+                sender=self.buyer, recipient=self.seller, product=self.lamp, subject='Lamp', content='Available?'
+            )
+            self.answer = self.reply(self.question, 'Yes')
+
+    def reply(self, parent, content):
+        return Message.objects.create(
+            sender=parent.recipient, recipient=parent.sender, product=parent.product,
+            subject='Re: Lamp', content=content, parent_message=parent
+        )
+
+    def thread(self, message):
+        return [(reply.id, reply.depth, reply.is_read) for reply in load_thread(message)]
+
+    def test_thread_is_cached_per_conversation(self):
+        expected = [(self.question.id, 0, False), (self.answer.id, 1, False)]
+        self.assertEqual(self.thread(self.answer), expected)
+        # Any message of the tree is served from the same entry
+        with self.assertNumQueries(0):
+            self.assertEqual(self.thread(self.question), expected)
+
+    def test_message_writes_refresh_the_cached_thread(self):
+        self.thread(self.question)
+        with self.captureOnCommitCallbacks(execute=True):
+            follow_up = self.reply(self.answer, 'How much?')
+        self.assertEqual([row[0] for row in self.thread(self.question)], [self.question.id, self.answer.id, follow_up.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_messages_read(self.seller, conversation_id=self.question.conversation_id)
+        self.assertEqual(self.thread(self.question)[0], (self.question.id, 0, True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            follow_up.delete()
+        self.assertEqual(len(self.thread(self.question)), 2)
+
+    def test_replied_flag_is_not_served_stale(self):
+        load_thread(self.question)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.is_replied = True
+            self.question.save()
+        self.assertTrue(load_thread(self.answer)[0].is_replied)
+
+    def test_conversation_without_timestamp(self):
+        Conversation.objects.filter(pk=self.question.conversation_id).update(last_message_at=None)
+        message = Message.objects.select_related('conversation').get(pk=self.answer.pk)
+        self.assertEqual(len(load_thread(message)), 2)
+
+
+class EventStreamTests(TestCase):
+    async def test_slow_client_keeps_only_the_newest_events(self):
+        channels = [user_channel(1), seller_channel(1)]
+        stream = event_stream(channels, heartbeat=1)
+        try:
+            self.assertEqual(await anext(stream), 'retry: 1000\n\n')
+            for number in range(1000):
+                event_bus.publish(channels[number % 2], 'tick', {'number': number})
+            await asyncio.sleep(0)
+
+            subscribers = {subscriber for channel in channels for subscriber in event_bus._subscribers[channel]}
+            self.assertEqual(len(subscribers), 1)
+            queue = subscribers.pop()[1]
+            self.assertEqual(queue.qsize(), event_bus.max_queue_size)
+            first = 1000 - event_bus.max_queue_size
+            self.assertEqual(await anext(stream), f'event: tick\ndata: {{"number": {first}}}\n\n')
+        finally:
+            await stream.aclose()
+        self.assertEqual(event_bus.subscriber_count(channels[0]), 0)
+        self.assertEqual(event_bus.subscriber_count(channels[1]), 0)
+
+    def test_streams_answer_wsgi_requests_with_a_retry(self):
+        user = User.objects.create_user('seller')
+        UserProfile.objects.filter(user=user).update(is_seller=True)
+        self.client.force_login(user)
+        for url in (reverse('message_stream'), reverse('seller_dashboard_stream')):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.streaming)
+                self.assertEqual(response['Content-Type'], 'text/event-stream')
+                self.assertEqual(response.content, f'retry: {settings.EVENT_STREAM_WSGI_RETRY_SECONDS * 1000}\n\n'.encode())
+
+
+class MediaBlobTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller')
+        self.storage = image_storage()
+
+    def refs(self, name):
+        return MediaBlob.objects.get(name=name).ref_count
+
+    def test_identical_uploads_share_one_counted_blob(self):
+        first = make_product(self.seller, 'Lamp', image=ContentFile(png_bytes(), 'IMG_1.png'))
+        second = make_product(self.seller, 'Desk', image=ContentFile(png_bytes(), 'IMG_2.PNG'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(self.storage.exists(first.image.name))
+        self.assertEqual(MediaBlob.objects.count(), 1)
+        self.assertEqual(self.refs(first.image.name), 2)
+
+    def test_replacing_moves_the_reference_and_collects_the_old_file(self):
+        first = make_product(self.seller, 'Lamp', image=ContentFile(png_bytes(), 'lamp.png'))
+        second = make_product(self.seller, 'Desk', image=ContentFile(png_bytes(), 'desk.png'))
+        old_name = first.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.image = ContentFile(png_bytes('blue'), 'lamp.png')
+            first.save()
+        self.assertEqual((self.refs(old_name), self.refs(first.image.name)), (1, 1))
+        self.assertTrue(self.storage.exists(old_name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.image = None
+            second.save()
+        self.assertFalse(MediaBlob.objects.filter(name=old_name).exists())
+        self.assertFalse(self.storage.exists(old_name))
+
+    def test_deleting_rows_releases_their_blob(self):
+        first = make_product(self.seller, 'Lamp', image=ContentFile(png_bytes(), 'lamp.png'))
+        second = make_product(self.seller, 'Desk', image=ContentFile(png_bytes(), 'desk.png'))
+        name = first.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.refs(name), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=second.pk).delete()
+        self.assertFalse(self.storage.exists(name))
+
+    def test_recently_registered_blobs_survive_collection(self):
+        product = make_product(self.seller, 'Lamp', image=ContentFile(png_bytes(), 'lamp.png'))
+        name = product.image.name
+        with self.settings(MEDIA_BLOB_GRACE_PERIOD=3600):
+            # Another upload of the same bytes finds the file while its last row goes away
+            self.assertEqual(self.storage.save('products/again.png', ContentFile(png_bytes())), name)
+            with self.captureOnCommitCallbacks(execute=True):
+                product.delete()
+            self.assertTrue(self.storage.exists(name))
+            self.assertEqual(MediaBlob.collect_unreferenced(), 0)
+
+        make_product(self.seller, 'Desk', image=ContentFile(png_bytes(), 'desk.png'))
+        self.assertEqual(self.refs(name), 1)
+        self.assertEqual(MediaBlob.collect_unreferenced(), 0)
+
+    def test_blobs_never_referenced_are_collected_after_the_grace_period(self):
+        name = self.storage.save('products/abandoned.png', ContentFile(png_bytes()))
+        with self.settings(MEDIA_BLOB_GRACE_PERIOD=3600):
+            self.assertEqual(MediaBlob.collect_unreferenced(), 0)
+        self.assertEqual(MediaBlob.collect_unreferenced(), 1)
+        self.assertFalse(self.storage.exists(name))
+
+
+@override_settings(UPLOAD_CHUNK_SIZE=32)
+class UploadSessionTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir, ignore_errors=True)
+        override = self.settings(UPLOAD_SESSION_DIR=upload_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.seller = User.objects.create_user('seller')
+        self.client.force_login(self.seller)
+        self.content = png_bytes(size=(40, 30))
+
+    def start(self, content=None):
+        content = content or self.content
+        response = self.client.post(reverse('start_upload_session'), json.dumps({
+            'filename': 'photo.png', 'size': len(content), 'sha256': hashlib.sha256(content).hexdigest(),
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload']
+
+    def send_chunk(self, upload, index, content=None):
+        content = content or self.content
+        chunk = content[index * upload['chunk_size']:(index + 1) * upload['chunk_size']]
+        return self.client.put(
+            reverse('upload_chunk', args=[upload['id'], index]), chunk,
+            content_type='application/octet-stream', HTTP_X_CHUNK_CHECKSUM=hashlib.sha256(chunk).hexdigest(),
+        )
+
+    def complete(self, upload):
+        return self.client.post(reverse('complete_upload_session', args=[upload['id']]))
+
+    def test_resume_and_complete(self):
+        upload = self.start()
+        self.assertGreater(upload['total_chunks'], 2)
+        self.assertEqual(self.send_chunk(upload, 0).status_code, 200)
+        self.assertEqual(self.send_chunk(upload, 2).status_code, 200)
+
+        # The client comes back later and asks what is still missing
+        state = self.client.get(reverse('upload_session', args=[upload['id']])).json()['upload']
+        self.assertEqual(state['received'], [0, 2])
+        response = self.complete(upload)
+        self.assertEqual(response.status_code, 409)
+
+        for index in set(range(upload['total_chunks'])) - set(state['received']):
+            self.send_chunk(upload, index)
+        response = self.complete(upload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['upload']['status'], 'complete')
+        session = UploadSession.objects.get(pk=upload['id'])
+        with image_storage().open(session.stored_name) as f:
+            self.assertEqual(f.read(), self.content)
+
+        # Completing again is a no-op and takes no second reference
+        self.assertEqual(complete_upload(session), session.stored_name)
+        self.assertEqual(MediaBlob.objects.get(name=session.stored_name).ref_count, 1)
+
+    def test_bad_chunk_is_rejected(self):
+        upload = self.start()
+        response = self.client.put(
+            reverse('upload_chunk', args=[upload['id'], 0]), self.content[:upload['chunk_size']],
+            content_type='application/octet-stream', HTTP_X_CHUNK_CHECKSUM='0' * 64,
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.client.get(reverse('upload_session', args=[upload['id']])).json()['upload']['received'], [])
+
+    def completed_session(self):
+        upload = self.start()
+        for index in range(upload['total_chunks']):
+            self.send_chunk(upload, index)
+        self.complete(upload)
+        return UploadSession.objects.get(pk=upload['id'])
+
+    def test_completed_upload_holds_its_file_until_discarded(self):
+        session = self.completed_session()
+        name = session.stored_name
+        # Another row with the same bytes goes away before the form attaches the upload
+        other = make_product(self.seller, 'Lamp', image=ContentFile(self.content, 'lamp.png'))
+        self.assertEqual(other.image.name, name)
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertTrue(image_storage().exists(name))
+
+        attached = make_product(self.seller, 'Desk', image=name)
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            clear_expired_uploads(now=session.expires_at)
+        self.assertFalse(UploadSession.objects.filter(pk=session.pk).exists())
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 1)
+        self.assertTrue(image_storage().exists(attached.image.name))
+
+    def test_aborting_an_unattached_upload_deletes_its_file(self):
+        session = self.completed_session()
+        with self.captureOnCommitCallbacks(execute=True):
+            abort_upload(session)
+            # A second discard (e.g. the expiry sweep racing the abort) releases nothing more
+            abort_upload(session)
+        self.assertFalse(MediaBlob.objects.filter(name=session.stored_name).exists())
+        self.assertFalse(image_storage().exists(session.stored_name))
+
+
+@skipUnless(mock_aws, 'needs boto3, django-storages and moto')
+class S3StorageTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing'}))
+        self.enterContext(mock_aws())
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='media')
+        self.enterContext(self.settings(STORAGES={**settings.STORAGES, 'images': {
+            'BACKEND': 'products.s3.ContentAddressedS3Storage',
+            'OPTIONS': {'bucket_name': 'media', 'region_name': 'us-east-1', 'querystring_auth': False},
+        }}))
+        self.storage = image_storage()
+        self.seller = User.objects.create_user('seller')
+        self.client.force_login(self.seller)
+        self.content = png_bytes(size=(40, 30))
+
+    def keys(self):
+        return sorted(item.key for item in self.storage.bucket.objects.all())
+
+    def start_direct(self, content=None, content_type='image/png'):
+        content = content or self.content
+        response = self.client.post(reverse('start_upload_session'), json.dumps({
+            'filename': 'photo.png', 'size': len(content), 'content_type': content_type,
+            'sha256': hashlib.sha256(content).hexdigest(), 'direct': True,
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload']
+
+    def put(self, upload, content=None):
+        direct = upload['direct']
+        response = requests.put(direct['url'], data=content or self.content, headers=direct['headers'])
+        self.assertEqual(response.status_code, 200)
+
+    def complete(self, upload):
+        return self.client.post(reverse('complete_upload_session', args=[upload['id']]))
+
+    def test_content_addressed_save_writes_each_blob_once(self):
+        with mock.patch.object(self.storage, '_save', wraps=self.storage._save) as write:
+            first = self.storage.save('products/IMG_1.png', ContentFile(self.content))
+            second = self.storage.save('products/IMG_2.PNG', ContentFile(self.content))
+        self.assertEqual(first, second)
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(self.keys(), [first])
+        self.assertEqual(MediaBlob.objects.get(name=first).sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(self.storage.read_head(first, 8), self.content[:8])
+
+    def test_presigned_put_then_complete(self):
+        upload = self.start_direct(content_type='text/html')
+        direct = upload['direct']
+        signed = parse_qs(urlparse(direct['url']).query)['X-Amz-SignedHeaders'][0].split(';')
+        self.assertTrue({'content-length', 'content-type', 'x-amz-checksum-sha256'} <= set(signed))
+        # The type is taken from the extension, not from what the client claimed
+        self.assertEqual(direct['headers']['Content-Type'], 'image/png')
+
+        self.assertEqual(self.complete(upload).status_code, 409)
+        self.put(upload)
+        response = self.complete(upload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['upload']['status'], 'complete')
+
+        session = UploadSession.objects.get(pk=upload['id'])
+        stored = self.storage.bucket.Object(session.stored_name).get()
+        self.assertEqual((stored['ContentType'], stored['Body'].read()), ('image/png', self.content))
+        self.assertEqual(MediaBlob.objects.get(name=session.stored_name).ref_count, 1)
+
+        # The same bytes again are already stored: nothing to send
+        again = self.start_direct()
+        self.assertEqual((again['status'], 'direct' in again), ('complete', False))
+
+    def test_direct_upload_is_checked_like_a_chunked_one(self):
+        not_an_image = b'<html><script>alert(1)</script></html>'
+        upload = self.start_direct(not_an_image, content_type='text/html')
+        self.put(upload, not_an_image)
+        self.assertEqual(self.complete(upload).status_code, 422)
+        self.assertEqual(self.keys(), [])
+
+        with self.settings(IMAGE_MAX_PIXELS=1000):
+            upload = self.start_direct()
+            self.put(upload)
+            self.assertEqual(self.complete(upload).status_code, 422)
+        self.assertEqual(self.keys(), [])
+        self.assertEqual(UploadSession.objects.get(pk=upload['id']).status, 'uploading')
+
+    def test_expired_unconfirmed_upload_is_deleted(self):
+        upload = self.start_direct()
+        self.put(upload)
+        session = UploadSession.objects.get(pk=upload['id'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(clear_expired_uploads(now=session.expires_at), 1)
+        self.assertEqual(self.keys(), [])
+        self.assertFalse(MediaBlob.objects.filter(name=session.stored_name).exists())
+
+    def test_copy_media_to_storage_keeps_names(self):
+        files = {'products/ab/abc.png': png_bytes('red'), 'profile_pics/me.png': png_bytes('blue')}
+        for name, content in files.items():
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+        output = io.StringIO()
+        call_command('copy_media_to_storage', source=str(settings.MEDIA_ROOT), stdout=output)
+        self.assertIn('Copied 2 of 2', output.getvalue())
+        self.assertEqual(self.keys(), sorted(files))
+        self.assertEqual(self.storage.read_head('profile_pics/me.png', 1024), files['profile_pics/me.png'])
+
+        call_command('copy_media_to_storage', source=str(settings.MEDIA_ROOT), stdout=output)
+        self.assertIn('Copied 0 of 2', output.getvalue())
+
+
+class SellerDashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller')
+        self.fans = [User.objects.create_user(f'fan{i}') for i in range(3)]
+        self.lamp = make_product(self.seller, 'Lamp')
+
+    def view(self, count):
+        for i in range(count):
+            ProductView.objects.create(product=self.lamp, ip_address='127.0.0.1')
+
+    def titles(self, kind):
+        return [entry['product_title'] for entry in get_recent_activity(self.seller.id, kind)]
+
+    def test_views_and_likes_are_capped_separately(self):
+        self.view(15)
+        for fan in self.fans:
+            ProductLike.objects.create(user=fan, product=self.lamp)
+        self.assertEqual(len(get_recent_activity(self.seller.id, 'view')), 10)
+        self.assertEqual(
+            [entry['username'] for entry in get_recent_activity(self.seller.id, 'like')], ['fan2', 'fan1', 'fan0']
+        )
+
+        # A burst of new views is pushed onto the cached view list only
+        with self.captureOnCommitCallbacks(execute=True):
+            self.view(12)
+        self.assertEqual(len(get_recent_activity(self.seller.id, 'view')), 10)
+        self.assertEqual(len(get_recent_activity(self.seller.id, 'like')), 3)
+
+    def test_only_status_and_title_changes_drop_the_caches(self):
+        self.view(1)
+        self.assertEqual(self.titles('view'), ['Lamp'])
+        self.assertEqual(get_dashboard_stats(self.seller)['sold_products'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(pk=self.lamp.pk)
+            product.price = Decimal('12.00')
+            product.save()
+            unsaved_title = Product.objects.get(pk=self.lamp.pk)
+            unsaved_title.title = 'Not saved'
+            unsaved_title.save(update_fields=['description'])
+        self.assertIsNotNone(cache.get(f'seller_dashboard:{self.seller.id}'))
+        self.assertIsNotNone(cache.get(f'seller_activity:{self.seller.id}:view'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.status = 'sold'
+            product.save()
+        self.assertIsNone(cache.get(f'seller_dashboard:{self.seller.id}'))
+        self.assertIsNotNone(cache.get(f'seller_activity:{self.seller.id}:view'))
+        self.assertEqual(get_dashboard_stats(self.seller)['sold_products'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.title = 'Desk lamp'
+            product.save()
+        self.assertEqual(self.titles('view'), ['Desk lamp'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product(self.seller, 'Chair')
+        self.assertEqual(get_dashboard_stats(self.seller)['total_products'], 2)
+
+
+class ScanMediaTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller')
+        self.storage = image_storage()
+
+    def age(self, name):
+        os.utime(self.storage.path(name), (0, 0))
+
+    def scan(self):
+        output = io.StringIO()
+        call_command('scan_media', '--delete-orphans', stdout=output)
+        return json.loads(output.getvalue())
+
+    def test_delete_orphans_spares_referenced_and_recently_registered_blobs(self):
+        used = make_product(self.seller, 'Lamp', image=ContentFile(png_bytes('red'), 'lamp.png')).image.name
+        unused = self.storage.save('products/abandoned.png', ContentFile(png_bytes('blue')))
+        self.storage.save_unhashed('products/stray.png', ContentFile(png_bytes('green')))
+        for name in (used, unused, 'products/stray.png'):
+            self.age(name)
+
+        # A re-upload of the unused bytes is between register() and its row's save
+        with self.settings(MEDIA_BLOB_GRACE_PERIOD=3600):
+            self.assertEqual(self.storage.save('products/again.png', ContentFile(png_bytes('blue'))), unused)
+            report = self.scan()
+        self.assertEqual(report['deleted']['count'], 1)
+        self.assertFalse(self.storage.exists('products/stray.png'))
+        self.assertTrue(self.storage.exists(unused))
+        self.assertTrue(self.storage.exists(used))
+
+        report = self.scan()
+        self.assertEqual(report['deleted']['count'], 1)
+        self.assertFalse(self.storage.exists(unused))
+        self.assertFalse(MediaBlob.objects.filter(name=unused).exists())
+        self.assertTrue(self.storage.exists(used))
+
+
+class OrderNumberTests(TestCase):
+    def test_numbers_are_monotonic_and_fixed_width(self):
+        generator = OrderNumberGenerator(5)
+        numbers = [generator.next_order_number() for _ in range(5000)]
+        self.assertEqual(numbers, sorted(set(numbers)))
+        self.assertEqual({len(number) for number in numbers}, {ORDER_NUMBER_LENGTH})
+
+    def test_clock_moving_backwards_does_not_reorder_ids(self):
+        generator = OrderNumberGenerator(5)
+        with mock.patch.object(generator, '_current_millis', side_effect=[10, 9]):
+            first, second = generator.next_id(), generator.next_id()
+        self.assertLess(first, second)
+
+    def test_sequence_rollover_waits_for_the_next_millisecond(self):
+        generator = OrderNumberGenerator(5)
+        ticks = [7] * (MAX_SEQUENCE + 2) + [8]
+        with mock.patch.object(generator, '_current_millis', side_effect=ticks), mock.patch('products.utils.time.sleep'):
+            ids = [generator.next_id() for _ in range(MAX_SEQUENCE + 2)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(ids[MAX_SEQUENCE] & MAX_SEQUENCE, MAX_SEQUENCE)
+        last = ids[-1]
+        self.assertEqual(last & MAX_SEQUENCE, 0)
+        self.assertEqual((last >> SEQUENCE_BITS) & MAX_WORKER_ID, 5)
+        self.assertEqual(last >> (SEQUENCE_BITS + WORKER_ID_BITS), 8)
+
+    def lease(self):
+        lease = WorkerLease(timedelta(minutes=10))
+        with self.captureOnCommitCallbacks(execute=True):
+            lease.current()
+        return lease
+
+    def test_processes_lease_distinct_worker_ids(self):
+        first, second = self.lease(), self.lease()
+        self.assertNotEqual(first.worker_id, second.worker_id)
+        # A committed lease is reused without a query until it is due for renewal
+        with self.assertNumQueries(0):
+            self.assertEqual(first.current(), first.worker_id)
+
+    def test_expired_lease_goes_to_another_process(self):
+        first = self.lease()
+        OrderNumberWorker.objects.filter(worker_id=first.worker_id).update(expires_at=timezone.now() - timedelta(days=1))
+        second = self.lease()
+        self.assertEqual(second.worker_id, first.worker_id)
+
+        with mock.patch('products.utils.time.monotonic', return_value=float('inf')):
+            self.assertNotEqual(first.current(), second.worker_id)
+
+    def test_rolled_back_lease_is_not_trusted(self):
+        first = WorkerLease(timedelta(minutes=10))
+        with self.assertRaises(ValueError), transaction.atomic():
+            first.current()
+            raise ValueError
+        second = self.lease()
+        self.assertEqual(second.worker_id, first.worker_id)
+        self.assertNotEqual(first.current(), second.worker_id)
+
+
+class SalesExportTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        UserProfile.objects.filter(user__in=[self.alice, self.bob]).update(is_seller=True)
+        buyer = User.objects.create_user('buyer')
+        order = Order.objects.create(buyer=buyer, buyer_name='Buyer', total_amount=Decimal('120.00'))
+        self.lamp = make_product(self.alice, 'Lamp', '10.00')
+        for product, quantity in ((self.lamp, 2), (make_product(self.bob, 'Bike', '100.00'), 1)):
+            OrderItem.objects.create(
+                order=order, product=product, seller=product.seller, quantity=quantity,
+                price=product.price, total=product.price * quantity
+            )
+        self.order_number = order.order_number
+
+    def test_csv_lists_only_the_sellers_items(self):
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('seller_sales_export'))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('order_number,order_date,'))
+        row = lines[1].split(',')
+        self.assertEqual(row[0], self.order_number)
+        self.assertEqual(row[6:], [str(self.lamp.id), 'Lamp', '2', '10.00', '20.00'])
+
+    async def test_jsonl_streams_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.bob)
+        response = await self.async_client.get(reverse('seller_sales_export'), {'format': 'jsonl'})
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([(row['order_number'], row['product_title'], row['total']) for row in rows], [
+            (self.order_number, 'Bike', '100.00'),
+        ])
@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .counters import get_thread_version
+from .models import Message
+
+
+MAX_THREAD_DEPTH = 200  # Guards the recursive queries against a corrupted parent cycle
+
+_ANCESTORS_SQL = """
+    WITH RECURSIVE chain (id, parent_message_id, depth) AS (
+        SELECT id, parent_message_id, 0 FROM {table} WHERE id = %s
+        UNION ALL
+        SELECT m.id, m.parent_message_id, chain.depth + 1
+        FROM {table} m JOIN chain ON m.id = chain.parent_message_id
+        WHERE chain.depth < %s
+    )
+    SELECT id, depth FROM chain ORDER BY depth DESC
+"""
+
+_DESCENDANTS_SQL = """
+    WITH RECURSIVE tree (id, parent_message_id, depth) AS (
+        SELECT id, parent_message_id, 0 FROM {table} WHERE id = %s
+        UNION ALL
+        SELECT m.id, m.parent_message_id, tree.depth + 1
+        FROM {table} m JOIN tree ON m.parent_message_id = tree.id
+        WHERE tree.depth < %s
+    )
+    SELECT id, depth FROM tree ORDER BY depth, id
+"""
+
+
+def _run_thread_query(sql, message_id):
+    """(id, depth) rows for a recursive walk starting at ``message_id``"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.format(table=connection.ops.quote_name(Message._meta.db_table)),
+            [message_id, MAX_THREAD_DEPTH]
+        )
+        return cursor.fetchall()
+
+
+def _load_messages(rows):
+    """Messages for (id, depth) rows, in row order, each annotated with ``depth``"""
+    messages = Message.objects.select_related('sender', 'recipient', 'product').in_bulk(
+        [message_id for message_id, depth in rows]
+    )
+    loaded = []
+    for message_id, depth in rows:
+        message = messages.get(message_id)
+        if message is not None:
+            message.depth = depth
+            loaded.append(message)
+    return loaded
+
+
+def reply_chain(message):
+    """The message and every ancestor up to the thread root, root first
+
+    The ``parent_message`` links are followed by one recursive query; each
+    message's ``depth`` counts from the root (0).
+    """
+    rows = _run_thread_query(_ANCESTORS_SQL, message.id)
+    root_depth = rows[0][1] if rows else 0
+    return _load_messages([(message_id, root_depth - depth) for message_id, depth in rows])
+
+
+def reply_tree(root):
+    """Every reply below ``root``, flattened depth first with replies in sent order
+
+    One recursive query collects the whole tree with its depths and one more
+    loads the messages, however deep the negotiation goes.
+    """
+    messages = _load_messages(_run_thread_query(_DESCENDANTS_SQL, root.id))
+    children = {}
+    for message in messages:
+        children.setdefault(message.parent_message_id, []).append(message)
+
+    ordered = []
+    stack = [messages[0]] if messages else []
+    while stack:
+        message = stack.pop()
+        ordered.append(message)
+        replies = sorted(children.get(message.id, ()), key=lambda reply: (reply.created_at, reply.id))
+        message.thread_replies = replies
+        stack.extend(reversed(replies))
+    return ordered
+
+
+def load_thread(message):
+    """The full reply tree containing ``message``, cached per conversation
+
+    Every reply joins its parent's conversation, so the conversation's trees
+    share one cache entry keyed on its thread version. Any write to one of
+    its messages (new replies, edits, read and replied flags, deletes) bumps
+    the version and moves readers onto a fresh entry.
+    """
+    cache_key = None
+    cached = None
+    if message.conversation_id is not None:
+        cache_key = f'message_thread:{message.conversation_id}:{get_thread_version(message.conversation_id)}'
+        cached = cache.get(cache_key) or {'roots': {}, 'threads': {}}
+        root_id = cached['roots'].get(message.id)
+        if root_id is not None:
+            return cached['threads'][root_id]
+
+    chain = reply_chain(message)
+    thread = reply_tree(chain[0]) if chain else []
+    if cache_key is not None and thread:
+        root_id = thread[0].id
+        cached['threads'][root_id] = thread
+        cached['roots'].update(dict.fromkeys((reply.id for reply in thread), root_id))
+        cache.set(cache_key, cached, getattr(settings, 'MESSAGE_THREAD_CACHE_TTL', 600))
+    return thread
@@ -0,0 +1,308 @@
+import hashlib
+import os
+import posixpath
+import shutil
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .images import ImageRejected, check_image, image_limits
+from .models import MediaBlob, UploadSession
+from .storage import image_storage
+
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif'}
+UPLOAD_DIRECTORY = 'products/'  # Same as the upload_to of Product.image and ProductImage.image
+STREAM_BLOCK_SIZE = 64 * 1024  # Request bodies and chunk files are copied in blocks this size
+HEADER_READ_SIZE = 1024 * 1024  # Bytes of a direct upload read to check its image header (room for EXIF and ICC data)
+
+
+class UploadError(ValueError):
+    """A rejected upload request; ``status`` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def session_directory(session):
+    return Path(getattr(settings, 'UPLOAD_SESSION_DIR', settings.BASE_DIR / 'upload_sessions')) / str(session.pk)
+
+
+def chunk_path(session, index):
+    return session_directory(session) / f'{index}.part'
+
+
+def start_upload(user, filename, size, content_type='', sha256='', direct=False):
+    """Open an upload session for a file of ``size`` bytes
+
+    With ``direct``, and an image storage that can presign uploads, the
+    file goes straight to object storage in one PUT and ``sha256`` is
+    required: it names the stored blob and the bucket checks the bytes
+    against it. Other storages fall back to a chunked session.
+    """
+    filename = get_valid_filename(posixpath.basename(str(filename or '')))
+    if not filename:
+        raise UploadError('Filename required')
+    if posixpath.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+        raise UploadError('Only JPG, PNG, GIF, WebP and AVIF images can be uploaded')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('Invalid file size')
+    max_size = image_limits()[0]
+    if size <= 0 or size > max_size:
+        raise UploadError(f'Images must be between 1 byte and {max_size // (1024 * 1024)} MB')
+    sha256 = str(sha256 or '').lower()
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise UploadError('Invalid SHA-256 checksum')
+
+    storage = image_storage()
+    direct = direct and hasattr(storage, 'presigned_upload')
+    if direct and not sha256:
+        raise UploadError('SHA-256 checksum required for direct uploads')
+
+    session = UploadSession(
+        user=user,
+        filename=filename,
+        content_type=str(content_type or '')[:100],
+        total_size=size,
+        chunk_size=getattr(settings, 'UPLOAD_CHUNK_SIZE', 1024 * 1024),
+        sha256=sha256,
+        expires_at=timezone.now() + timedelta(seconds=getattr(settings, 'UPLOAD_SESSION_TTL', 60 * 60 * 24)),
+    )
+    if not direct:
+        session.save()
+        session_directory(session).mkdir(parents=True, exist_ok=True)
+        return session
+
+    session.direct = True
+    session.chunk_size = size
+    session.stored_name = storage.hashed_name(posixpath.join(UPLOAD_DIRECTORY, filename), sha256)
+    with transaction.atomic():
+        # Registered before the check, as storage.save() does, so the file cannot be collected in between
+        MediaBlob.register(session.stored_name, sha256, size)
+        if storage.exists(session.stored_name):
+            # Already stored: nothing to send
+            MediaBlob.acquire(session.stored_name)
+            session.status = 'complete'
+        session.save()
+    return session
+
+
+def get_upload(user, upload_id):
+    """``user``'s unexpired upload session, or None"""
+    try:
+        upload_id = uuid.UUID(str(upload_id))
+    except ValueError:
+        return None
+    return UploadSession.objects.filter(pk=upload_id, user=user, expires_at__gt=timezone.now()).first()
+
+
+def received_chunks(session):
+    try:
+        names = os.listdir(session_directory(session))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-5]) for name in names if name.endswith('.part') and name[:-5].isdigit())
+
+
+def describe(session):
+    """JSON-ready state of an upload, used to resume it
+
+    A direct upload that is still open carries a freshly signed ``direct``
+    request (URL, method and headers) for sending the file.
+    """
+    if session.status != 'uploading':
+        received = list(range(session.total_chunks))
+    else:
+        received = [] if session.direct else received_chunks(session)
+    state = {
+        'id': str(session.pk),
+        'filename': session.filename,
+        'size': session.total_size,
+        'chunk_size': session.chunk_size,
+        'total_chunks': session.total_chunks,
+        'received': received,
+        'status': session.status,
+        'expires_at': session.expires_at.isoformat(),
+    }
+    if session.direct and session.status == 'uploading':
+        state['direct'] = image_storage().presigned_upload(
+            session.stored_name, session.total_size, session.sha256,
+            getattr(settings, 'UPLOAD_PRESIGN_TTL', 15 * 60),
+        )
+    return state
+
+
+def write_chunk(session, index, stream, checksum):
+    """Stream one chunk from ``stream`` to disk, verifying its length and SHA-256
+
+    The chunk is written to a temporary file and renamed into place, so a
+    chunk is either fully received or absent; re-sending one replaces it.
+    """
+    if session.status != 'uploading':
+        raise UploadError('Upload is already complete', status=409)
+    if session.direct:
+        raise UploadError('Send this file with its presigned upload URL', status=409)
+    if not 0 <= index < session.total_chunks:
+        raise UploadError('Chunk index out of range')
+    checksum = (checksum or '').lower()
+    if len(checksum) != 64:
+        raise UploadError('Chunk SHA-256 checksum required')
+
+    expected = session.chunk_length(index)
+    path = chunk_path(session, index)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'{path.name}.{uuid.uuid4().hex}.tmp')
+    sha256 = hashlib.sha256()
+    written = 0
+    try:
+        with open(temporary, 'wb') as f:
+            while written <= expected:
+                block = stream.read(min(STREAM_BLOCK_SIZE, expected + 1 - written))
+                if not block:
+                    break
+                sha256.update(block)
+                f.write(block)
+                written += len(block)
+        if written != expected:
+            raise UploadError(f'Chunk {index} must be {expected} bytes, got {written}')
+        if sha256.hexdigest() != checksum:
+            raise UploadError(f'Checksum mismatch for chunk {index}', status=422)
+        os.replace(temporary, path)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+    return received_chunks(session)
+
+
+def complete_upload(session):
+    """Assemble the chunks into image storage and return the stored name
+
+    Chunks are concatenated on disk block by block, so memory use does not
+    depend on the file size. Storage is content-addressed: an image that is
+    already stored is not written again. A completed session holds a
+    reference to its blob until it is discarded, so the file cannot be
+    collected before a form attaches it.
+    """
+    with transaction.atomic():
+        # Concurrent completes of one session would assemble into the same file
+        locked = UploadSession.objects.select_for_update().filter(pk=session.pk).first()
+        if locked is None:
+            raise UploadError('Upload not found or expired', status=404)
+        session.status, session.stored_name = locked.status, locked.stored_name
+        if session.status == 'complete':
+            return session.stored_name
+        if session.direct:
+            return _confirm_direct_upload(session)
+        return _assemble_upload(session)
+
+
+def _assemble_upload(session):
+    missing = sorted(set(range(session.total_chunks)) - set(received_chunks(session)))
+    if missing:
+        raise UploadError(f'{len(missing)} chunk(s) missing', status=409)
+
+    directory = session_directory(session)
+    assembled_path = directory / 'assembled'
+    sha256 = hashlib.sha256()
+    with open(assembled_path, 'wb') as assembled:
+        for index in range(session.total_chunks):
+            with open(chunk_path(session, index), 'rb') as chunk:
+                while block := chunk.read(STREAM_BLOCK_SIZE):
+                    sha256.update(block)
+                    assembled.write(block)
+    if session.sha256 and sha256.hexdigest() != session.sha256:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise UploadError('Checksum mismatch for the assembled file; upload it again', status=422)
+
+    with open(assembled_path, 'rb') as f:
+        assembled = File(f)
+        try:
+            # Header check only; the process_images worker does the full decode
+            check_image(assembled)
+        except ImageRejected as e:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise UploadError(str(e).rstrip('.'), status=422)
+        stored_name = image_storage().save(posixpath.join(UPLOAD_DIRECTORY, session.filename), assembled)
+    MediaBlob.acquire(stored_name)
+    UploadSession.objects.filter(pk=session.pk).update(status='complete', stored_name=stored_name)
+    session.status, session.stored_name = 'complete', stored_name
+    shutil.rmtree(directory, ignore_errors=True)
+    return stored_name
+
+
+def _confirm_direct_upload(session):
+    """Record a file the client PUT to object storage
+
+    The bucket has already checked its SHA-256 against the signed one, so
+    its presence and size are confirmed here and its image header is
+    checked from a ranged read, as chunked uploads are before they are
+    stored; the process_images worker does the full decode.
+    """
+    storage = image_storage()
+    name = session.stored_name
+    MediaBlob.register(name, session.sha256, session.total_size)
+    if not storage.exists(name):
+        raise UploadError('The file has not been uploaded yet', status=409)
+    if storage.size(name) != session.total_size:
+        storage.delete(name)
+        raise UploadError('Uploaded file has the wrong size; upload it again', status=422)
+    try:
+        check_image(ContentFile(storage.read_head(name, HEADER_READ_SIZE)))
+    except ImageRejected as e:
+        storage.delete(name)
+        raise UploadError(str(e).rstrip('.'), status=422)
+    MediaBlob.acquire(name)
+    UploadSession.objects.filter(pk=session.pk).update(status='complete')
+    session.status = 'complete'
+    return name
+
+
+def _discard(session):
+    """Delete a session and its chunks, releasing the reference a completed one holds"""
+    with transaction.atomic():
+        # Re-read under the lock: a concurrent complete may have taken a reference since
+        locked = UploadSession.objects.select_for_update().filter(pk=session.pk).first()
+        if locked is None:
+            return
+        locked.delete()
+        if locked.status == 'complete':
+            MediaBlob.release(locked.stored_name)
+    shutil.rmtree(session_directory(locked), ignore_errors=True)
+    if (locked.direct and locked.status == 'uploading'
+            and not UploadSession.objects.filter(stored_name=locked.stored_name).exists()):
+        # Possibly PUT but never confirmed; start_upload registered the blob so it can be collected
+        if not MediaBlob.collect(locked.stored_name) and not MediaBlob.objects.filter(name=locked.stored_name).exists():
+            image_storage().delete(locked.stored_name)  # Started before uploads registered their blob
+
+
+def abort_upload(session):
+    """Drop an upload; its stored file goes too unless a product or another upload uses it"""
+    _discard(session)
+
+
+def completed_upload_name(user, upload_id):
+    """Stored name of ``user``'s completed upload, for attaching it to a product, or None"""
+    session = get_upload(user, upload_id)
+    if session is None or session.status != 'complete':
+        return None
+    return session.stored_name
+
+
+def clear_expired_uploads(now=None):
+    """Delete expired sessions and their chunks, releasing their stored files"""
+    now = now or timezone.now()
+    expired = UploadSession.objects.filter(expires_at__lte=now)
+    cleared = 0
+    for session in expired.iterator():
+        _discard(session)
+        cleared += 1
+    return cleared
@@ -11,6 +11,7 @@ urlpatterns = [
     # API endpoints for cart
     path('api/cart/add/', views.api_add_to_cart, name='api_add_to_cart'),
     path('api/cart/update/', views.api_update_cart, name='api_update_cart'),
+    path('api/cart/batch/', views.api_batch_cart, name='api_batch_cart'),
     
     # Checkout
     path('checkout/', views.checkout, name='checkout'),
@@ -20,6 +21,11 @@ urlpatterns = [
     path('add-product/', views.add_product, name='add_product'),
     path('my-products/', views.my_products, name='my_products'),
     path('edit-product/<int:product_id>/', views.edit_product, name='edit_product'),
+    path('api/products/<int:product_id>/image-status/', views.product_image_status, name='product_image_status'),
+    path('api/uploads/', views.start_upload_session, name='start_upload_session'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_session, name='upload_session'),
+    path('api/uploads/<uuid:upload_id>/chunks/<int:index>/', views.upload_chunk, name='upload_chunk'),
+    path('api/uploads/<uuid:upload_id>/complete/', views.complete_upload_session, name='complete_upload_session'),
     path('delete-product/<int:product_id>/', views.delete_product, name='delete_product'),
     
     # Buyer-Seller Communication
@@ -27,5 +33,9 @@ urlpatterns = [
     path('my-messages/', views.my_messages, name='my_messages'),
     path('messages/mark-read/<int:message_id>/', views.mark_message_read, name='mark_message_read'),
     path('messages/reply/<int:message_id>/', views.reply_to_message, name='reply_to_message'),
+    path('messages/stream/', views.message_stream, name='message_stream'),
+    path('messages/bulk/', views.bulk_update_messages, name='bulk_update_messages'),
+    path('messages/conversation/<int:conversation_id>/', views.conversation_messages, name='conversation_messages'),
+    path('messages/search/', views.message_search, name='message_search'),
     path('toggle-like/<int:product_id>/', views.toggle_like, name='toggle_like'),
 ]
\ No newline at end of file
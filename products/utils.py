@@ -0,0 +1,140 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+
+# Crockford base32 keeps order numbers uppercase, unambiguous and
+# lexicographically sortable when padded to a fixed width.
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+# Snowflake layout: 41 bits of milliseconds since ORDER_NUMBER_EPOCH_MS,
+# 10 bits of worker id and 12 bits of per-millisecond sequence.
+ORDER_NUMBER_EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+ORDER_NUMBER_LENGTH = 13  # 13 base32 characters cover 65 bits
+
+
+class OrderNumberGenerator:
+    """Monotonic, time-sortable order number generator (snowflake style)
+
+    Each process numbers orders under its own leased worker id (see
+    ``WorkerLease``), so ids from different processes never collide and no
+    uniqueness retry is needed.
+    """
+
+    def __init__(self, worker_id):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f'worker_id must be between 0 and {MAX_WORKER_ID}')
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._last_timestamp = -1
+        self._sequence = 0
+
+    def _current_millis(self):
+        return int(time.time() * 1000) - ORDER_NUMBER_EPOCH_MS
+
+    def next_id(self):
+        """Return the next 63-bit integer id"""
+        with self._lock:
+            timestamp = self._current_millis()
+            # Never move backwards if the clock is adjusted
+            if timestamp < self._last_timestamp:
+                timestamp = self._last_timestamp
+
+            if timestamp == self._last_timestamp:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond, wait for the next one
+                    while timestamp <= self._last_timestamp:
+                        timestamp = max(self._current_millis(), timestamp)
+                        if timestamp <= self._last_timestamp:
+                            time.sleep(0.0001)
+            else:
+                self._sequence = 0
+
+            self._last_timestamp = timestamp
+            return (timestamp << (WORKER_ID_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+    def next_order_number(self):
+        """Return the next id encoded as a fixed-width base32 string"""
+        return encode_base32(self.next_id(), ORDER_NUMBER_LENGTH)
+
+
+def encode_base32(value, length):
+    """Encode a non-negative integer as zero-padded Crockford base32"""
+    chars = []
+    while value:
+        value, remainder = divmod(value, 32)
+        chars.append(CROCKFORD_ALPHABET[remainder])
+    return ''.join(reversed(chars)).rjust(length, '0')
+
+
+class WorkerLease:
+    """This process's lease on a worker id (``products.OrderNumberWorker``)
+
+    The lease is taken or renewed in the caller's transaction, so an order
+    numbered under it is only committed together with the lease. Once
+    committed it is used without a database round trip until half of
+    ``duration`` has passed; a lease lost in the meantime (e.g. to a long
+    pause) is replaced by a fresh id.
+    """
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.owner = f'{socket.gethostname()[:60]}:{os.getpid()}:{uuid.uuid4().hex[:12]}'
+        self.worker_id = None
+        self._lock = threading.RLock()
+        self._renew_after = None  # time.monotonic() deadline, None until the lease has committed
+
+    def current(self):
+        """Return the leased worker id, taking or renewing the lease when due"""
+        with self._lock:
+            if self._renew_after is not None and time.monotonic() < self._renew_after:
+                return self.worker_id
+            workers = apps.get_model('products', 'OrderNumberWorker')
+            if self.worker_id is None or not workers.renew(self.worker_id, self.owner, self.duration):
+                self.worker_id = workers.lease(self.owner, self.duration, MAX_WORKER_ID)
+            self._renew_after = None
+            worker_id = self.worker_id
+            renew_after = time.monotonic() + self.duration.total_seconds() / 2
+            transaction.on_commit(lambda: self._confirm(worker_id, renew_after))
+            return worker_id
+
+    def _confirm(self, worker_id, renew_after):
+        with self._lock:
+            if self.worker_id == worker_id:
+                self._renew_after = renew_after
+
+
+_lease = None
+_generator = None
+_generator_lock = threading.Lock()
+_generator_pid = None
+
+
+def generate_order_number():
+    """Generate a unique, time-sortable order number for this process"""
+    global _lease, _generator, _generator_pid
+    pid = os.getpid()
+    if _lease is None or _generator_pid != pid:
+        # Re-create after fork so child processes lease their own worker id
+        with _generator_lock:
+            if _lease is None or _generator_pid != pid:
+                _lease = WorkerLease(timedelta(seconds=getattr(settings, 'ORDER_NUMBER_WORKER_LEASE_SECONDS', 60 * 10)))
+                _generator = None
+                _generator_pid = pid
+    worker_id = _lease.current()
+    with _generator_lock:
+        if _generator is None or _generator.worker_id != worker_id:
+            _generator = OrderNumberGenerator(worker_id)
+        generator = _generator
+    return generator.next_order_number()
@@ -1,14 +1,32 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, F, Q
 from django.http import JsonResponse
 from django.core.paginator import Paginator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
-from .models import Product, Category, Cart, CartItem, Message, ProductLike, ProductView, ProductImage, Order, OrderItem
-from accounts.models import UserProfile
+from .models import Product, Category, Cart, CartItem, Message, ProductLike, ProductView, ProductImage, Order, OrderItem, SellerLedger, Conversation
+from .idempotency import idempotent
+from .threads import load_thread
+from .messaging import (
+    open_conversation, conversation_page, thread_page, get_user_conversation,
+    mark_messages_read, set_conversations_archived, search_messages, SEARCH_PAGE_SIZE,
+)
+from .events import event_stream_response, publish_engagement, user_channel
+from .images import ImageRejected, check_image
+from .uploads import (
+    UploadError, abort_upload, complete_upload, completed_upload_name, describe as describe_upload,
+    get_upload, start_upload, write_chunk,
+)
+from decimal import Decimal, InvalidOperation
+import json
+import uuid
 
 def home(request):
     """Home page showing featured products"""
@@ -65,6 +83,8 @@ def products(request):
     elif sort_by == 'popular':
         # For now, order by creation date as we don't have view counts
         products = products.order_by('-created_at')
+    elif sort_by == 'best_offer':
+        products = products.order_by(F('best_offer').desc(nulls_last=True), '-created_at')
     else:  # newest
         products = products.order_by('-created_at')
     
@@ -86,23 +106,26 @@ def products(request):
 
 def product_detail(request, product_id):
     """Product detail page"""
-    product = get_object_or_404(Product, id=product_id)
+    # The seller's profile supplies default contact details
+    product = get_object_or_404(Product.objects.select_related('seller__userprofile'), id=product_id)
     
     # Track product view
     try:
         if request.user.is_authenticated:
-            ProductView.objects.get_or_create(
+            view, created = ProductView.objects.get_or_create(
                 user=request.user,
                 product=product,
                 defaults={'ip_address': get_client_ip(request)}
             )
         else:
             # Track anonymous views by IP
-            ProductView.objects.get_or_create(
+            view, created = ProductView.objects.get_or_create(
                 product=product,
                 ip_address=get_client_ip(request),
                 defaults={'user': None}
             )
+        if created:
+            publish_engagement(product, 'engagement.view', view.user, created_at=view.created_at.isoformat())
     except Exception as e:
         # Log error but don't break the page
         print(f"Error tracking product view: {e}")
@@ -190,16 +213,18 @@ def contact_seller(request, product_id):
             content=content,
             offered_price=offered_price if offered_price else None
         )
+        publish_engagement(product, 'engagement.message', request.user, message=message.as_event_data())
         
         messages.success(request, 'Your message has been sent to the seller!')
         return redirect('product_detail', product_id=product_id)
     
     # Get existing messages between this buyer and seller for this product
-    existing_messages = Message.objects.filter(
-        product=product,
-        sender__in=[request.user, product.seller],
-        recipient__in=[request.user, product.seller]
-    ).order_by('created_at')
+    conversation = Conversation.objects.filter(
+        buyer=request.user,
+        seller=product.seller,
+        product=product
+    ).first()
+    existing_messages = conversation.messages.select_related('sender').order_by('created_at') if conversation else Message.objects.none()
     
     context = {
         'product': product,
@@ -227,6 +252,7 @@ def toggle_like(request, product_id):
         
         # Get updated like count
         like_count = product.likes.count()
+        publish_engagement(product, 'engagement.like', request.user, liked=liked, like_count=like_count)
         
         return JsonResponse({
             'success': True,
@@ -239,14 +265,9 @@ def toggle_like(request, product_id):
 @login_required
 def add_product(request):
     """Add a new product - only for sellers with active subscription"""
-    try:
-        user_profile = request.user.userprofile
-        if not user_profile.can_post_products():
-            messages.error(request, 'You need an active seller subscription to post products.')
-            return redirect('subscription_plans')
-    except UserProfile.DoesNotExist:
-        messages.error(request, 'Please complete your profile first.')
-        return redirect('profile')
+    if not request.user.userprofile.can_post_products():
+        messages.error(request, 'You need an active seller subscription to post products.')
+        return redirect('subscription_plans')
     
     if request.method == 'POST':
         # Get form data
@@ -260,9 +281,28 @@ def add_product(request):
         seller_email = request.POST.get('seller_email', '').strip()
         preferred_contact_method = request.POST.get('preferred_contact_method', 'message')
         image = request.FILES.get('image')
+        additional_images = request.FILES.getlist('additional_images')
         
         # Validation
         errors = []
+        # Images sent ahead through the chunked upload API arrive as upload ids
+        image_upload = request.POST.get('image_upload', '').strip()
+        if not image and image_upload:
+            image = completed_upload_name(request.user, image_upload)
+            if image is None:
+                errors.append('Your main image upload expired. Please choose the image again.')
+        for upload_id in request.POST.getlist('additional_uploads'):
+            name = completed_upload_name(request.user, upload_id)
+            if name is None:
+                errors.append('An additional image upload expired. Please choose the images again.')
+                break
+            additional_images.append(name)
+        # Size and header checks only; oversized photos never reach the decoder
+        for upload in request.FILES.getlist('image')[:1] + request.FILES.getlist('additional_images')[:5]:
+            try:
+                check_image(upload)
+            except ImageRejected as e:
+                errors.append(f'{upload.name}: {e}')
         if not title:
             errors.append('Title is required.')
         if not description:
@@ -291,7 +331,8 @@ def add_product(request):
                 messages.error(request, error)
             return render(request, 'products/add_product.html', {
                 'categories': Category.objects.all(),
-                'form_data': request.POST
+                'form_data': request.POST,
+                'initial_data': {'seller_phone': seller_phone, 'seller_email': seller_email}
             })
         
         # Create product
@@ -309,8 +350,7 @@ def add_product(request):
             image=image
         )
         
-        # Handle additional images
-        additional_images = request.FILES.getlist('additional_images')
+        # Handle additional images (stored as uploaded; the process_images worker resizes them)
         for img in additional_images[:5]:  # Limit to 5 additional images
             ProductImage.objects.create(product=product, image=img)
         
@@ -321,9 +361,8 @@ def add_product(request):
     categories = Category.objects.all()
     
     # Pre-fill contact info from user profile
-    user_profile = getattr(request.user, 'userprofile', None)
     initial_data = {
-        'seller_phone': user_profile.phone_number if user_profile else '',
+        'seller_phone': request.user.userprofile.phone_number,
         'seller_email': request.user.email,
     }
     
@@ -335,16 +374,13 @@ def add_product(request):
 @login_required
 def my_products(request):
     """Display seller's products"""
-    try:
-        user_profile = request.user.userprofile
-        if not user_profile.is_seller:
-            messages.error(request, 'You need to be a seller to access this page.')
-            return redirect('home')
-    except UserProfile.DoesNotExist:
-        messages.error(request, 'Please complete your profile first.')
-        return redirect('profile')
+    if not request.user.userprofile.is_seller:
+        messages.error(request, 'You need to be a seller to access this page.')
+        return redirect('home')
     
-    products = Product.objects.filter(seller=request.user).order_by('-created_at')
+    products = Product.objects.filter(seller=request.user).annotate(
+        images_processing=Count('image_jobs', filter=Q(image_jobs__status__in=['pending', 'processing']))
+    ).order_by('-created_at')
     
     # Pagination
     paginator = Paginator(products, 12)  # Show 12 products per page
@@ -356,6 +392,88 @@ def my_products(request):
         'products': page_obj
     })
 
+@login_required
+def product_image_status(request, product_id):
+    """Progress of background processing for a product's uploaded images"""
+    product = get_object_or_404(Product, id=product_id, seller=request.user)
+    progress = product.image_progress()
+    return JsonResponse({
+        'success': True,
+        'progress': progress,
+        'ready': not (progress.get('pending') or progress.get('processing')),
+    })
+
+@login_required
+@require_http_methods(['POST'])
+def start_upload_session(request):
+    """Open a chunked or direct image upload
+
+    Expects ``{"filename": "a.jpg", "size": 5242880, "content_type": "image/jpeg", "sha256": "..."}``
+    (``sha256`` of the whole file is optional). Chunks are then PUT to
+    ``api/uploads/<id>/chunks/<index>/`` and the upload finished with
+    ``api/uploads/<id>/complete/``; the returned id goes in the product
+    form's ``image_upload`` or ``additional_uploads`` field.
+
+    With ``"direct": true`` and object storage configured, the upload
+    instead carries a presigned ``direct`` request: the file is PUT there
+    in one piece, then ``complete/`` is called as usual. Without object
+    storage a chunked upload is returned.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+
+    try:
+        session = start_upload(
+            request.user, data.get('filename'), data.get('size'), data.get('content_type', ''), data.get('sha256', ''),
+            direct=data.get('direct') is True,
+        )
+    except UploadError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+    return JsonResponse({'success': True, 'upload': describe_upload(session)}, status=201)
+
+@login_required
+@require_http_methods(['GET', 'DELETE'])
+def upload_session(request, upload_id):
+    """State of an upload (to resume it: which chunks the server already has), or abort it"""
+    session = get_upload(request.user, upload_id)
+    if session is None:
+        return JsonResponse({'success': False, 'error': 'Upload not found or expired'}, status=404)
+    if request.method == 'DELETE':
+        abort_upload(session)
+        return JsonResponse({'success': True})
+    return JsonResponse({'success': True, 'upload': describe_upload(session)})
+
+@login_required
+@require_http_methods(['PUT'])
+def upload_chunk(request, upload_id, index):
+    """Store one chunk; the raw request body is the chunk and ``X-Chunk-Checksum`` its SHA-256"""
+    session = get_upload(request.user, upload_id)
+    if session is None:
+        return JsonResponse({'success': False, 'error': 'Upload not found or expired'}, status=404)
+    try:
+        # Read from the request stream so the chunk is never held in memory whole
+        received = write_chunk(session, index, request, request.headers.get('X-Chunk-Checksum'))
+    except UploadError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+    return JsonResponse({'success': True, 'received': len(received), 'total_chunks': session.total_chunks})
+
+@login_required
+@require_http_methods(['POST'])
+def complete_upload_session(request, upload_id):
+    """Assemble a fully received upload into image storage"""
+    session = get_upload(request.user, upload_id)
+    if session is None:
+        return JsonResponse({'success': False, 'error': 'Upload not found or expired'}, status=404)
+    try:
+        complete_upload(session)
+    except UploadError as e:
+        return JsonResponse({'success': False, 'error': str(e), 'upload': describe_upload(session)}, status=e.status)
+    return JsonResponse({'success': True, 'upload': describe_upload(session)})
+
 @login_required
 def edit_product(request, product_id):
     """Edit an existing product"""
@@ -374,9 +492,28 @@ def edit_product(request, product_id):
         seller_email = request.POST.get('seller_email', '').strip()
         preferred_contact_method = request.POST.get('preferred_contact_method', 'message')
         image = request.FILES.get('image')
+        additional_images = request.FILES.getlist('additional_images')
         
         # Validation
         errors = []
+        # Images sent ahead through the chunked upload API arrive as upload ids
+        image_upload = request.POST.get('image_upload', '').strip()
+        if not image and image_upload:
+            image = completed_upload_name(request.user, image_upload)
+            if image is None:
+                errors.append('Your main image upload expired. Please choose the image again.')
+        for upload_id in request.POST.getlist('additional_uploads'):
+            name = completed_upload_name(request.user, upload_id)
+            if name is None:
+                errors.append('An additional image upload expired. Please choose the images again.')
+                break
+            additional_images.append(name)
+        # Size and header checks only; oversized photos never reach the decoder
+        for upload in request.FILES.getlist('image')[:1] + request.FILES.getlist('additional_images')[:5]:
+            try:
+                check_image(upload)
+            except ImageRejected as e:
+                errors.append(f'{upload.name}: {e}')
         if not title:
             errors.append('Title is required.')
         if not description:
@@ -425,8 +562,7 @@ def edit_product(request, product_id):
         
         product.save()
         
-        # Handle additional images
-        additional_images = request.FILES.getlist('additional_images')
+        # Handle additional images (stored as uploaded; the process_images worker resizes them)
         for img in additional_images[:5]:  # Limit to 5 additional images
             ProductImage.objects.create(product=product, image=img)
         
@@ -456,38 +592,174 @@ def delete_product(request, product_id):
 
 @login_required
 def my_messages(request):
-    """View messages for the current user"""
-    # Messages received by the user (as seller)
-    received_messages = Message.objects.filter(recipient=request.user).order_by('-created_at')
+    """View conversations for the current user, one keyset page per tab"""
+    show_archived = request.GET.get('archived') == '1'
     
-    # Messages sent by the user (as buyer)
-    sent_messages = Message.objects.filter(sender=request.user).order_by('-created_at')
+    # Conversations where the user is selling
+    selling_conversations, selling_next_cursor = conversation_page(
+        Conversation.objects.filter(seller=request.user, seller_archived=show_archived),
+        cursor=request.GET.get('selling_cursor')
+    )
     
-    context = {
-        'received_messages': received_messages,
-        'sent_messages': sent_messages,
-    }
+    # Conversations where the user is buying
+    buying_conversations, buying_next_cursor = conversation_page(
+        Conversation.objects.filter(buyer=request.user, buyer_archived=show_archived),
+        cursor=request.GET.get('buying_cursor')
+    )
+    
+    context = open_conversation(request)
+    active_conversation = context['active_conversation']
+    if active_conversation:
+        active_tab = 'buying' if active_conversation.buyer_id == request.user.id else 'selling'
+    else:
+        active_tab = 'buying' if request.GET.get('buying_cursor') else 'selling'
+    
+    context.update({
+        'selling_conversations': selling_conversations,
+        'selling_next_cursor': selling_next_cursor,
+        'buying_conversations': buying_conversations,
+        'buying_next_cursor': buying_next_cursor,
+        'show_archived': show_archived,
+        'active_tab': active_tab,
+        'other_party': active_conversation.other_party(request.user) if active_conversation else None,
+    })
     
     return render(request, 'products/my_messages.html', context)
 
+@login_required
+def conversation_messages(request, conversation_id):
+    """JSON page of a thread's messages, newest page first, for lazy loading
+
+    Pass the ``cursor`` from a previous response to load earlier messages.
+    """
+    conversation = get_user_conversation(request.user, conversation_id)
+    if conversation is None:
+        return JsonResponse({'success': False, 'error': 'Conversation not found'}, status=404)
+    
+    thread_messages, earlier_cursor = thread_page(conversation, cursor=request.GET.get('cursor'))
+    return JsonResponse({
+        'success': True,
+        'conversation_id': conversation.id,
+        'messages': [message.as_event_data() for message in thread_messages],
+        'next_cursor': earlier_cursor,
+    })
+
+@login_required
+def message_search(request):
+    """JSON search over the user's messages
+
+    ``q`` matches subject and content; ``type``, ``min_price`` and
+    ``max_price`` narrow the results, e.g. to offers in a price range.
+    """
+    query = request.GET.get('q', '').strip()
+    message_type = request.GET.get('type') or None
+    if message_type and message_type not in dict(Message.MESSAGE_TYPES):
+        return JsonResponse({'success': False, 'error': 'Unknown message type'}, status=400)
+    
+    try:
+        min_price = Decimal(request.GET['min_price']) if request.GET.get('min_price') else None
+        max_price = Decimal(request.GET['max_price']) if request.GET.get('max_price') else None
+        page = max(int(request.GET.get('page', 1)), 1)
+    except (InvalidOperation, ValueError):
+        return JsonResponse({'success': False, 'error': 'Invalid filter'}, status=400)
+    
+    if not (query or message_type or min_price is not None or max_price is not None):
+        return JsonResponse({'success': False, 'error': 'Enter a search term or filter'}, status=400)
+    
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    results = list(search_messages(
+        request.user, query, message_type=message_type, min_price=min_price, max_price=max_price
+    )[offset:offset + SEARCH_PAGE_SIZE + 1])
+    return JsonResponse({
+        'success': True,
+        'results': [message.as_event_data() for message in results[:SEARCH_PAGE_SIZE]],
+        'page': page,
+        'has_next': len(results) > SEARCH_PAGE_SIZE,
+    })
+
 @login_required
 @require_http_methods(["POST"])
 def mark_message_read(request, message_id):
     """Mark a message as read"""
     try:
-        message = Message.objects.get(id=message_id, recipient=request.user)
-        message.is_read = True
-        message.save()
+        if not Message.objects.filter(id=message_id, recipient=request.user).exists():
+            raise Message.DoesNotExist
+        mark_messages_read(request.user, message_ids=[message_id])
         return JsonResponse({'success': True})
     except Message.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Message not found'})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+BULK_MESSAGE_ACTIONS = ('read', 'archive', 'unarchive')
+
+@login_required
+@require_http_methods(["POST"])
+def bulk_update_messages(request):
+    """Mark read, archive or unarchive many messages at once
+
+    Expects ``{"action": "read", "conversation_id": 1}``; the scope is any
+    combination of ``conversation_id``, ``product_id`` and ``before`` (an ISO
+    timestamp). Every action answers with the same shape:
+    ``conversation_ids`` are the conversations it changed and
+    ``message_ids`` the messages whose read state changed (always empty for
+    ``archive``/``unarchive``).
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+
+    action = data.get('action')
+    if action not in BULK_MESSAGE_ACTIONS:
+        return JsonResponse({'success': False, 'error': 'Unknown action'}, status=400)
+
+    scope = {}
+    try:
+        for field in ('conversation_id', 'product_id'):
+            if data.get(field) is not None:
+                scope[field] = int(data[field])
+        if data.get('before'):
+            before = parse_datetime(data['before'])
+            if before is None:
+                raise ValueError
+            scope['before'] = before if timezone.is_aware(before) else timezone.make_aware(before)
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Invalid scope'}, status=400)
+    if not scope:
+        return JsonResponse({'success': False, 'error': 'A conversation, product or timestamp is required'}, status=400)
+
+    if action == 'read':
+        message_ids, conversation_ids = mark_messages_read(request.user, **scope)
+    else:
+        message_ids = []
+        conversation_ids = set_conversations_archived(request.user, archived=(action == 'archive'), **scope)
+    return JsonResponse({
+        'success': True,
+        'action': action,
+        'conversation_ids': conversation_ids,
+        'message_ids': message_ids,
+    })
+
+@login_required
+async def message_stream(request):
+    """Server-sent event stream of new messages and read receipts for the current user
+
+    Needs an ASGI server (see university_market_backend/asgi.py); under WSGI
+    the client is told to retry later instead of holding a worker.
+    """
+    user = await request.auser()
+    return event_stream_response(request, [user_channel(user.id)])
+
 @login_required
 def reply_to_message(request, message_id):
     """Reply to a message"""
-    original_message = get_object_or_404(Message, id=message_id, recipient=request.user)
+    original_message = get_object_or_404(
+        Message.objects.select_related('sender', 'product', 'conversation'),
+        id=message_id, recipient=request.user
+    )
     
     if request.method == 'POST':
         subject = request.POST.get('subject')
@@ -510,18 +782,27 @@ def reply_to_message(request, message_id):
             original_message.save()
             
             messages.success(request, 'Reply sent successfully!')
-            return redirect('seller_messages')
+            conversation = reply_message.conversation
+            inbox = 'seller_messages' if conversation.seller_id == request.user.id else 'my_messages'
+            return redirect(f'{reverse(inbox)}?conversation={conversation.id}')
         else:
             messages.error(request, 'Please fill in all required fields.')
     
+    thread = [
+        message for message in load_thread(original_message)
+        if request.user.id in (message.sender_id, message.recipient_id)
+    ]
+    
     context = {
         'original_message': original_message,
+        'thread': thread or [original_message],
     }
     
     return render(request, 'products/reply_message.html', context)
 
 @csrf_exempt
 @login_required
+@idempotent()
 def api_add_to_cart(request):
     """API endpoint to add product to cart"""
     if request.method != 'POST':
@@ -530,6 +811,8 @@ def api_add_to_cart(request):
     try:
         import json
         data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
         product_id = data.get('product_id')
         quantity = data.get('quantity', 1)
         
@@ -560,7 +843,26 @@ def api_add_to_cart(request):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
+def _checkout_context(cart):
+    """Checkout template context with a fresh idempotency key for the form"""
+    return {'cart': cart, 'idempotency_key': uuid.uuid4().hex}
+
+def _publish_order_engagement(order):
+    """One ``engagement.order`` event per seller with their share of the order"""
+    items_by_seller = {}
+    for item in order.items.select_related('product'):
+        items_by_seller.setdefault(item.seller_id, []).append(item)
+    for seller_items in items_by_seller.values():
+        publish_engagement(
+            seller_items[0].product, 'engagement.order', order.buyer,
+            order_number=order.order_number,
+            items=[{'product_id': item.product_id, 'title': item.product.title, 'quantity': item.quantity} for item in seller_items],
+            total=str(sum(item.total for item in seller_items)),
+            created_at=order.created_at.isoformat(),
+        )
+
 @login_required
+@idempotent(should_store=lambda response: response.status_code == 302)
 def checkout(request):
     """Checkout page"""
     cart = get_object_or_404(Cart, user=request.user)
@@ -580,7 +882,7 @@ def checkout(request):
         # Validate required fields
         if not all([buyer_name, buyer_email, buyer_phone, delivery_address]):
             messages.error(request, 'Please fill in all required fields.')
-            return render(request, 'products/checkout.html', {'cart': cart})
+            return render(request, 'products/checkout.html', _checkout_context(cart))
         
         try:
             from decimal import Decimal
@@ -589,41 +891,40 @@ def checkout(request):
             shipping_cost = Decimal('0.00')  # Free campus pickup
             total_amount = subtotal + shipping_cost
             
-            # Generate order number
-            import random
-            import string
-            order_number = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-            
-            # Create order
-            order = Order.objects.create(
-                order_number=order_number,
-                buyer=request.user,
-                buyer_name=buyer_name,
-                buyer_email=buyer_email,
-                buyer_phone=buyer_phone,
-                delivery_address=delivery_address,
-                delivery_notes=delivery_notes,
-                subtotal=subtotal,
-                shipping_cost=shipping_cost,
-                total_amount=total_amount,
-                status='pending',
-                payment_status='pending'
-            )
-            
-            # Create order items
-            for cart_item in cart.items.all():
-                item_total = Decimal(str(cart_item.quantity)) * cart_item.product.price
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    seller=cart_item.product.seller,
-                    quantity=cart_item.quantity,
-                    price=cart_item.product.price,
-                    total=item_total
+            with transaction.atomic():
+                # Create order (order_number is assigned by Order.save)
+                order = Order.objects.create(
+                    buyer=request.user,
+                    buyer_name=buyer_name,
+                    buyer_email=buyer_email,
+                    buyer_phone=buyer_phone,
+                    delivery_address=delivery_address,
+                    delivery_notes=delivery_notes,
+                    subtotal=subtotal,
+                    shipping_cost=shipping_cost,
+                    total_amount=total_amount,
+                    status='pending',
+                    payment_status='pending'
                 )
-            
-            # Clear the cart
-            cart.items.all().delete()
+                
+                # Create order items
+                for cart_item in cart.items.all():
+                    item_total = Decimal(str(cart_item.quantity)) * cart_item.product.price
+                    OrderItem.objects.create(
+                        order=order,
+                        product=cart_item.product,
+                        seller=cart_item.product.seller,
+                        quantity=cart_item.quantity,
+                        price=cart_item.product.price,
+                        total=item_total
+                    )
+                
+                # Add the sale to each seller's ledger in the same transaction
+                SellerLedger.record_order(order)
+                _publish_order_engagement(order)
+                
+                # Clear the cart
+                cart.items.all().delete()
             
             # Send success message
             messages.success(request, f'Order {order.order_number} has been placed successfully!')
@@ -632,10 +933,10 @@ def checkout(request):
             
         except Exception as e:
             messages.error(request, f'An error occurred while processing your order: {str(e)}')
-            return render(request, 'products/checkout.html', {'cart': cart})
+            return render(request, 'products/checkout.html', _checkout_context(cart))
     
     # GET request - show checkout form
-    return render(request, 'products/checkout.html', {'cart': cart})
+    return render(request, 'products/checkout.html', _checkout_context(cart))
 
 @login_required
 def checkout_success(request, order_id):
@@ -645,6 +946,7 @@ def checkout_success(request, order_id):
 
 @csrf_exempt
 @login_required
+@idempotent()
 def api_update_cart(request):
     """API endpoint to update cart item quantity"""
     if request.method != 'POST':
@@ -653,6 +955,8 @@ def api_update_cart(request):
     try:
         import json
         data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
         product_id = data.get('product_id')
         quantity = data.get('quantity', 1)
         
@@ -681,3 +985,119 @@ def api_update_cart(request):
         return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+CART_BATCH_OPERATIONS = ('add', 'update', 'remove')
+CART_BATCH_MAX_OPERATIONS = 50
+
+def _cart_state(cart):
+    """Serialize the cart's items and total with a single query"""
+    items = []
+    total = Decimal('0.00')
+    for item in cart.items.select_related('product').order_by('created_at'):
+        item_total = item.get_total_price()
+        total += item_total
+        items.append({
+            'product_id': item.product_id,
+            'title': item.product.title,
+            'price': float(item.product.price),
+            'quantity': item.quantity,
+            'total': float(item_total),
+        })
+    return {'items': items, 'total': float(total)}
+
+@csrf_exempt
+@login_required
+@idempotent()
+def api_batch_cart(request):
+    """API endpoint to apply several add/update/remove operations to the cart at once
+
+    Expects ``{"operations": [{"op": "add", "product_id": 1, "quantity": 1}, ...]}``.
+    Operations are folded in order into final quantities, then written with one
+    product fetch, one upsert and one delete inside a single transaction.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return JsonResponse({'success': False, 'error': 'Operations list required'}, status=400)
+    if len(operations) > CART_BATCH_MAX_OPERATIONS:
+        return JsonResponse({
+            'success': False,
+            'error': f'At most {CART_BATCH_MAX_OPERATIONS} operations per request'
+        }, status=400)
+
+    # Validate every operation before touching the database
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            return JsonResponse({'success': False, 'error': f'Operation {index} is invalid'}, status=400)
+        op = operation.get('op')
+        if op not in CART_BATCH_OPERATIONS:
+            return JsonResponse({'success': False, 'error': f'Operation {index} has an unknown op'}, status=400)
+        try:
+            product_id = int(operation.get('product_id'))
+            quantity = int(operation.get('quantity', 1 if op == 'add' else 0))
+        except (ValueError, TypeError):
+            return JsonResponse({'success': False, 'error': f'Operation {index} is invalid'}, status=400)
+        if op == 'add' and quantity <= 0:
+            return JsonResponse({'success': False, 'error': f'Operation {index} needs a positive quantity'}, status=400)
+        parsed.append((op, product_id, quantity))
+
+    try:
+        with transaction.atomic():
+            cart, created = Cart.objects.get_or_create(user=request.user)
+            product_ids = {product_id for op, product_id, quantity in parsed}
+            products = Product.objects.in_bulk(product_ids)
+            missing = product_ids - set(products)
+            if missing:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Product not found',
+                    'missing_product_ids': sorted(missing)
+                }, status=404)
+
+            quantities = dict(
+                CartItem.objects.select_for_update()
+                .filter(cart=cart, product_id__in=product_ids)
+                .values_list('product_id', 'quantity')
+            )
+            for op, product_id, quantity in parsed:
+                if op == 'add':
+                    quantities[product_id] = quantities.get(product_id, 0) + quantity
+                elif op == 'update':
+                    quantities[product_id] = quantity
+                else:  # remove
+                    quantities[product_id] = 0
+
+            to_upsert = [
+                CartItem(cart=cart, product=products[product_id], quantity=quantity)
+                for product_id, quantity in quantities.items()
+                if quantity > 0
+            ]
+            to_remove = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+
+            if to_upsert:
+                CartItem.objects.bulk_create(
+                    to_upsert,
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity'],
+                )
+            if to_remove:
+                CartItem.objects.filter(cart=cart, product_id__in=to_remove).delete()
+
+        return JsonResponse({
+            'success': True,
+            'message': 'Cart updated!',
+            **_cart_state(cart)
+        })
+
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -120,8 +120,7 @@ def test_user_login():
         username='logintest',
         email='logintest@university.edu',
         password='testpass123'
-    )
-    UserProfile.objects.create(user=test_user)
+    )  # Its profile is created with it
     
     # Test buyer login
     buyer_login_data = {
@@ -16,7 +16,6 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'university_market_backend.setti
 django.setup()
 
 from django.contrib.auth.models import User
-from accounts.models import UserProfile
 
 def test_registration_fix():
     """Test that we can create multiple users without student_id conflicts"""
@@ -45,12 +44,8 @@ def test_registration_fix():
                 password='testpass123'
             )
             
-            # Create profile (this was causing the error before)
-            profile = UserProfile.objects.create(
-                user=user,
-                student_id=None,  # This should not cause conflicts now
-                university='',
-            )
+            # Profile created with the user, with no student ID (this was causing the error before)
+            profile = user.userprofile
             
             print(f"✅ User {i}: {username} created successfully")
             success_count += 1
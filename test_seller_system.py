@@ -40,9 +40,8 @@ def create_test_seller():
         password='testpass123'
     )
     
-    # Create profile
-    profile = UserProfile.objects.create(
-        user=user,
+    # Fill in the profile created with the user
+    UserProfile.objects.filter(user=user).update(
         student_id='TEST123',
         university='Test University',
         is_seller=True,
@@ -50,6 +49,7 @@ def create_test_seller():
         subscription_start_date=timezone.now(),
         subscription_end_date=timezone.now() + timedelta(days=30)
     )
+    profile = UserProfile.objects.get(user=user)
     
     # Create subscription record
     subscription = SellerSubscription.objects.create(
@@ -160,7 +160,6 @@ def test_seller_permissions():
             email='testbuyer@university.edu',
             password='testpass123'
         )
-        UserProfile.objects.create(user=regular_user)
     
     regular_profile = regular_user.userprofile
     print(f"Regular user can post products: {regular_profile.can_post_products()}")
@@ -3,6 +3,12 @@ ASGI config for university_market_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Live endpoints such as ``messages/stream/`` and
+``accounts/seller/dashboard/stream/`` are async views that hold the
+connection open; serve them through this entry point with an ASGI server,
+e.g. ``uvicorn university_market_backend.asgi:application``. Events fan out
+in memory within one process (see products/events.py).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -64,6 +65,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "products.context_processors.unread_messages",
             ],
         },
     },
@@ -96,6 +98,15 @@ DATABASES = {
 }
 
 
+# Authentication
+# Users are loaded together with their UserProfile (accounts/backends.py).
+# ModelBackend stays listed so sessions created before the switch still
+# resolve; they move to the new backend at their next login.
+AUTHENTICATION_BACKENDS = [
+    "accounts.backends.ProfileModelBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -136,11 +147,120 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# Cache
+# Local-memory cache is per process; point this at a shared backend
+# (Redis, Memcached or the database cache) when running several workers.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "unimarket",
+    }
+}
+
+# Idempotency keys for checkout and cart APIs
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24  # Stored responses are replayed for a day
+IDEMPOTENCY_LOCK_TTL = 30  # Seconds a key stays claimed while its request runs
+IDEMPOTENCY_WAIT_SECONDS = 5  # How long a concurrent replay waits for the first response
+
+# Unread message badges are cached per user and adjusted as messages are
+# sent and read; this bounds how long a missed adjustment can linger
+UNREAD_COUNT_TTL = 60 * 60
+
+# Seller dashboard: product counts, ledger and latest messages are cached per
+# seller and dropped when they change; views and likes are kept in capped
+# per-seller lists, one for each (products/dashboard.py)
+SELLER_DASHBOARD_CACHE_TTL = 60 * 10
+SELLER_ACTIVITY_LENGTH = 10  # Entries kept of each kind
+SELLER_ACTIVITY_TTL = 60 * 60
+
+# Assembled reply trees; entries are keyed on a per-conversation version that
+# every message write bumps, so this only bounds how long superseded trees
+# stay in memory
+MESSAGE_THREAD_CACHE_TTL = 60 * 10
+
+# Server-sent event streams (served through asgi.py)
+EVENT_STREAM_HEARTBEAT_SECONDS = 15
+EVENT_STREAM_QUEUE_SIZE = 100  # Events buffered per connection before the oldest are dropped
+EVENT_STREAM_WSGI_RETRY_SECONDS = 300  # How long clients wait before retrying when not served over ASGI
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploaded images are named by content hash and stored once, with reference
+# counts in products.MediaBlob (products/storage.py). Their URLs never change
+# content, so they can be served with far-future cache headers.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "images": {
+        "BACKEND": "products.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+# Seconds a newly stored blob is kept even with no references, so the row
+# that is about to point at it can be saved; `python manage.py collect_media`
+# deletes unreferenced blobs once this has passed
+MEDIA_BLOB_GRACE_PERIOD = 60 * 60
+
+# Object storage for images. With MEDIA_BUCKET set, images are kept in an
+# S3-compatible bucket (AWS S3, or MinIO locally via MEDIA_ENDPOINT_URL) and
+# served from it or from MEDIA_CUSTOM_DOMAIN; browsers upload to it directly
+# with presigned URLs (products/s3.py, needs django-storages and boto3).
+# Credentials come from the usual AWS_* environment variables. The bucket
+# needs a CORS rule allowing PUT with the Content-Type, Cache-Control and
+# x-amz-checksum-sha256 headers from the site's origin.
+MEDIA_BUCKET = os.environ.get('MEDIA_BUCKET')
+if MEDIA_BUCKET:
+    STORAGES["images"] = {
+        "BACKEND": "products.s3.ContentAddressedS3Storage",
+        "OPTIONS": {
+            "bucket_name": MEDIA_BUCKET,
+            "endpoint_url": os.environ.get('MEDIA_ENDPOINT_URL'),
+            "region_name": os.environ.get('MEDIA_REGION'),
+            "custom_domain": os.environ.get('MEDIA_CUSTOM_DOMAIN'),
+            "querystring_auth": False,  # Public, unsigned image URLs
+            "object_parameters": {"CacheControl": "public, max-age=31536000, immutable"},
+        },
+    }
+UPLOAD_PRESIGN_TTL = 15 * 60  # Seconds a presigned upload URL stays valid
+
+# Resized derivatives generated for every uploaded image (products/images.py).
+# Formats the installed Pillow cannot encode are skipped.
+IMAGE_DERIVATIVE_WIDTHS = [160, 320, 640, 1280]
+IMAGE_DERIVATIVE_FORMATS = ['avif', 'webp', 'jpeg']
+
+# Limits for uploaded images, checked from the file size and image header
+# before anything is decoded
+IMAGE_MAX_BYTES = 20 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_MAX_DIMENSION = 4096  # Larger originals are stored downscaled to this many pixels per side
+
+# Background image processing (python manage.py process_images)
+IMAGE_WORKER_PROCESSES = 2  # Images processed concurrently
+IMAGE_WORKER_MAX_TASKS = 50  # Worker processes are recycled after this many images
+IMAGE_WORKER_MEMORY_LIMIT = 1024 * 1024 * 1024  # Address-space cap per worker process, in bytes
+IMAGE_JOB_MAX_ATTEMPTS = 5
+IMAGE_JOB_RETRY_DELAY = 30  # Seconds before the first retry; doubles on each attempt
+IMAGE_JOB_STALE_AFTER = 600  # Seconds before a job claimed by a dead worker is picked up again
+
+# Chunked, resumable image uploads (products/uploads.py). Chunks are kept
+# outside MEDIA_ROOT until the upload is complete; expired sessions are
+# removed by `python manage.py clear_upload_sessions`.
+UPLOAD_SESSION_DIR = BASE_DIR / 'upload_sessions'
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_SESSION_TTL = 60 * 60 * 24  # Seconds an unfinished or unattached upload is kept
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Order numbers
+# Every process leases its own snowflake worker id (0-1023) from the
+# database (products.OrderNumberWorker) and renews it while numbering orders;
+# an id is handed to another process once its lease has run out.
+ORDER_NUMBER_WORKER_LEASE_SECONDS = 60 * 10